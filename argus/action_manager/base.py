@@ -33,7 +33,7 @@ class BaseActionManager(object):
         self._os_type = os_type
 
     @abc.abstractmethod
-    def download(self, uri, location):
+    def download(self, uri, location, policy=None):
         """Download the resource located at a specific URI in the location.
 
         :param uri:
@@ -42,6 +42,8 @@ class BaseActionManager(object):
         :param location:
             Path from the instance in which we should download the
             remote resource.
+        :param policy:
+            A :class:`argus.util.RetryPolicy` for the download.
         """
         pass
 
@@ -76,7 +78,7 @@ class BaseActionManager(object):
         pass
 
     @abc.abstractmethod
-    def git_clone(self, repo_url, location, count, delay):
+    def git_clone(self, repo_url, location, count, delay, policy=None):
         """Clone from a remote repository to a specified location.
 
         :param repo_url: The remote repository URL.
@@ -84,6 +86,9 @@ class BaseActionManager(object):
         :param count:
             The number of tries that should be attempted in case it fails.
         :param delay: The time delay before retrying.
+        :param policy:
+            A :class:`argus.util.RetryPolicy`, which replaces
+            `count` and `delay` when given.
 
         :returns: True if the clone was successful, False if not.
         :raises: ArgusCLIError if the path is not valid.
@@ -13,10 +13,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
+import collections
 import ntpath
 import os
 import socket
-import time
 
 import requests
 
@@ -27,11 +28,55 @@ from argus.action_manager import base
 from argus import config as argus_config
 from argus import exceptions
 from argus.introspection.cloud import windows as introspection
+from argus import resource_server
 from argus import util
 
 LOG = util.LOG
 CONFIG = argus_config.CONFIG
 
+# The Windows file time of the Unix epoch and the number of file time
+# units in a second, for converting the modification times.
+_FILE_TIME_EPOCH = 116444736000000000
+_FILE_TIME_UNITS = 10.0 ** 7
+
+# The maximum number of characters of the paths given to a single
+# command by `stat_many` and `read_many`, which keeps the encoded
+# command under the limit of 8191 characters of cmd.exe.
+PATHS_MAX_SIZE = 1000
+
+# The default maximum number of bytes read from each file by
+# `read_many`.
+READ_MAX_SIZE = 64 * 1024
+
+# The maximum size of the output of a single `read_many` command,
+# well under the output capture limit of the remote clients.
+READ_OUTPUT_MAX_SIZE = 2 * 1024 * 1024
+
+# The number of seconds given to all the attempts of installing
+# Cloudbase-Init, after which no other attempt is started.
+INSTALL_TIMEOUT = 60 * 60
+
+PathStat = collections.namedtuple("PathStat",
+                                  ["exists", "type", "size", "mtime"])
+"""The result of :meth:`WindowsActionManager.stat`.
+
+The type is ``"File"`` or ``"Directory"`` and the modification time
+is a POSIX timestamp, all of them None when the path doesn't exist.
+"""
+
+FileContent = collections.namedtuple("FileContent",
+                                     ["stat", "content", "truncated"])
+"""An item of the result of :meth:`WindowsActionManager.read_many`.
+
+The content is None for the missing paths and for the directories.
+The truncated flag is set when only the beginning of the file was read.
+"""
+
+
+def _quote(path):
+    """Quote the given path as a PowerShell string literal."""
+    return "'{}'".format(path.replace("'", "''"))
+
 
 def wait_boot_completion(client, username):
     wait_cmd = ("echo '{}'".format(username))
@@ -47,15 +92,82 @@ class WindowsActionManager(base.BaseActionManager):
     PATH_LEAF = "Leaf"
     PATH_CONTAINER = "Container"
 
+    os_fingerprint = None
+    """The :class:`argus.introspection.cloud.windows.OSFingerprint` of
+    the instance, when the action manager was chosen by it."""
+
     _DIRECTORY = "Directory"
     _FILE = "File"
+    _MISSING = "Missing"
+    _DONE = "Done"
+
+    # The scripts run by :meth:`_check_and_act`, which print `_DONE`
+    # when they acted on the path and a word telling what they found
+    # there otherwise.
+    _GET_ITEM = (
+        "$item = Get-Item -LiteralPath $path -Force "
+        "-ErrorAction SilentlyContinue; "
+        "if ($item -eq $null) { 'Missing' } "
+        "elseif ($item.PSIsContainer) { 'Directory 0 ' + "
+        "$item.LastWriteTimeUtc.ToFileTimeUtc() } ")
+    _FILE_STAT = ("'File ' + $item.Length + ' ' + "
+                  "$item.LastWriteTimeUtc.ToFileTimeUtc()")
+    _STAT_SCRIPT = _GET_ITEM + "else { " + _FILE_STAT + " }"
+    # Also prints the first `$maxSize` bytes of a file, encoded
+    # with base64, after its stat.
+    _READ_SCRIPT = _GET_ITEM + (
+        "else { $buffer = New-Object byte[] "
+        "([Math]::Min($item.Length, $maxSize)); "
+        "$stream = New-Object IO.FileStream("
+        "$item.FullName, 'Open', 'Read', 'ReadWrite'); "
+        "try { $read = 0; while ($read -lt $buffer.Length) { "
+        "$count = $stream.Read($buffer, $read, $buffer.Length - $read); "
+        "if ($count -eq 0) { break }; $read += $count } } "
+        "finally { $stream.Close() }; " + _FILE_STAT +
+        " + ' ' + [Convert]::ToBase64String($buffer, 0, $read) }")
+    _REMOVE_SCRIPT = (
+        "if (Test-Path -PathType Leaf -LiteralPath $path) "
+        "{ Remove-Item -Force -LiteralPath $path; 'Done' } "
+        "elseif (Test-Path -LiteralPath $path) { 'Invalid' } "
+        "else { 'Missing' }")
+    _RMDIR_SCRIPT = (
+        "if (Test-Path -PathType Container -LiteralPath $path) "
+        "{ Remove-Item -Force -Recurse -LiteralPath $path; 'Done' } "
+        "elseif (Test-Path -LiteralPath $path) { 'Invalid' } "
+        "else { 'Missing' }")
+    # New-Item has no -LiteralPath on the older PowerShell versions,
+    # so the items are created by .NET, from the unresolved path.
+    _FULL_PATH = (
+        "$full = $ExecutionContext.SessionState.Path."
+        "GetUnresolvedProviderPathFromPSPath($path); ")
+    _MKDIR_SCRIPT = (
+        "if (Test-Path -PathType Container -LiteralPath $path) "
+        "{ 'Directory' } "
+        "elseif (Test-Path -LiteralPath $path) { 'Exists' } "
+        "else { " + _FULL_PATH +
+        "[IO.Directory]::CreateDirectory($full) | Out-Null; 'Done' }")
+    _TOUCH_ITEM = (
+        "$item = Get-Item -LiteralPath $path -Force; $now = Get-Date; "
+        "$item.LastWriteTime = $now; $item.LastAccessTime = $now; ")
+    _NEW_FILE = (
+        "else { " + _FULL_PATH +
+        "[IO.Directory]::CreateDirectory([IO.Path]::GetDirectoryName("
+        "$full)) | Out-Null; [IO.File]::Create($full).Close(); 'Done' }")
+    _MKFILE_SCRIPT = (
+        "if (Test-Path -PathType Container -LiteralPath $path) "
+        "{ 'Directory' } "
+        "elseif (Test-Path -PathType Leaf -LiteralPath $path) "
+        "{ " + _TOUCH_ITEM + "'File' } " + _NEW_FILE)
+    _TOUCH_SCRIPT = (
+        "if (Test-Path -LiteralPath $path) "
+        "{ " + _TOUCH_ITEM + "'Done' } " + _NEW_FILE)
 
     WINDOWS_MANAGEMENT_CMDLET = "Get-WmiObject"
 
     def __init__(self, client, os_type=util.WINDOWS):
         super(WindowsActionManager, self).__init__(client, os_type)
 
-    def download(self, uri, location):
+    def download(self, uri, location, policy=None):
         """Download the resource located at a specific URI in the location.
 
         :param uri:
@@ -64,6 +176,8 @@ class WindowsActionManager(base.BaseActionManager):
         :param location:
             Path from the instance in which we should download the
             remote resource.
+        :param policy:
+            A :class:`argus.util.RetryPolicy` for the download.
         """
         LOG.debug("Downloading from %s to %s ", uri, location)
         cmd = ('(New-Object System.Net.WebClient).DownloadFile('
@@ -71,25 +185,27 @@ class WindowsActionManager(base.BaseActionManager):
         self._client.run_command_with_retry(cmd,
                                             count=util.RETRY_COUNT,
                                             delay=util.RETRY_DELAY,
-                                            command_type=util.POWERSHELL)
+                                            command_type=util.POWERSHELL,
+                                            policy=policy)
 
-    def download_resource(self, resource_location, location):
+    def download_resource(self, resource_location, location, policy=None):
         """Download the resource in the specified location
 
         :param resource_script:
             Is relative to the /argus/resources/ directory.
         :param location:
             The location on the instance.
+        :param policy:
+            A :class:`argus.util.RetryPolicy` for the download.
         """
-        base_resource = CONFIG.argus.resources
+        base_resource = resource_server.get_resources_url()
         if not base_resource.endswith("/"):
-            base_resource = urlparse.urljoin(CONFIG.argus.resources,
-                                             "resources/")
+            base_resource = urlparse.urljoin(base_resource, "resources/")
         uri = urlparse.urljoin(base_resource, resource_location)
-        self.download(uri, location)
+        self.download(uri, location, policy=policy)
 
     def _execute_resource_script(self, resource_location, parameters,
-                                 script_type):
+                                 script_type, policy=None):
         """Run a resource script with with the specific parameters."""
         LOG.debug("Executing resource script %s with this parameters %s",
                   resource_location, parameters)
@@ -98,19 +214,21 @@ class WindowsActionManager(base.BaseActionManager):
             script_type = util.CMD
 
         instance_location = r"C:\{}".format(resource_location.split('/')[-1])
-        self.download_resource(resource_location, instance_location)
+        self.download_resource(resource_location, instance_location,
+                               policy=policy)
         cmd = '"{}" {}'.format(instance_location, parameters)
         self._client.run_command_with_retry(cmd,
                                             count=util.RETRY_COUNT,
                                             delay=util.RETRY_DELAY,
-                                            command_type=script_type)
+                                            command_type=script_type,
+                                            policy=policy)
 
     def execute_powershell_resource_script(self, resource_location,
-                                           parameters=""):
+                                           parameters="", policy=None):
         """Execute a powershell resource script."""
         self._execute_resource_script(
             resource_location=resource_location, parameters=parameters,
-            script_type=util.POWERSHELL_SCRIPT_BYPASS)
+            script_type=util.POWERSHELL_SCRIPT_BYPASS, policy=policy)
 
     def get_installation_script(self):
         """Get installation script for Cloudbase-Init."""
@@ -119,10 +237,11 @@ class WindowsActionManager(base.BaseActionManager):
                                r"C:\installCBinit.ps1")
 
     def _execute(self, cmd, count=util.RETRY_COUNT, delay=util.RETRY_DELAY,
-                 command_type=util.CMD):
+                 command_type=util.CMD, cacheable=False):
         """Execute until succeeds and return only the standard output."""
         stdout, _, _ = self._client.run_command_with_retry(
-            cmd, count=count, delay=delay, command_type=command_type)
+            cmd, count=count, delay=delay, command_type=command_type,
+            cacheable=cacheable)
         return stdout
 
     def check_cbinit_installation(self):
@@ -130,7 +249,8 @@ class WindowsActionManager(base.BaseActionManager):
         LOG.info("Checking Cloudbase-Init installation.")
 
         try:
-            python_dir = introspection.get_python_dir(self._execute)
+            python_dir = introspection.get_python_dir(self._execute,
+                                                      self.os_fingerprint)
         except exceptions.ArgusError as exc:
             LOG.warning("Could not check Cloudbase-Init installation: %s", exc)
             return False
@@ -151,16 +271,26 @@ class WindowsActionManager(base.BaseActionManager):
         """Cleans up Cloudbase-Init if the installation failed."""
         LOG.debug("Cleaning up Cloudbase-Init from the instance.")
         try:
-            cbinit_dir = introspection.get_cbinit_dir(self._execute)
+            cbinit_dir = introspection.get_cbinit_dir(self._execute,
+                                                      self.os_fingerprint)
             self.rmdir(ntpath.dirname(cbinit_dir))
+            self._client.invalidate_cache()
         except exceptions.ArgusError as exc:
             LOG.warning("Could not cleanup Cloudbase-Init: %s", exc)
             return False
         else:
             return True
 
-    def install_cbinit(self):
-        """Install Cloudbase-Init on the underlying instance."""
+    def install_cbinit(self, policy=None):
+        """Install Cloudbase-Init on the underlying instance.
+
+        :param policy:
+            A :class:`argus.util.RetryPolicy` for the rounds of
+            installation methods, by default `util.RETRY_COUNT` rounds
+            started during `INSTALL_TIMEOUT` seconds. The remote
+            commands of the installation methods are retried until
+            its deadline at most.
+        """
         LOG.info("Trying to install Cloudbase-Init.")
 
         installer = "CloudbaseInitSetup_{build}_{arch}.msi".format(
@@ -168,34 +298,53 @@ class WindowsActionManager(base.BaseActionManager):
             arch=CONFIG.argus.arch
         )
 
-        for _ in range(util.RETRY_COUNT):
+        policy = policy or util.RetryPolicy(count=util.RETRY_COUNT, delay=0,
+                                            timeout=INSTALL_TIMEOUT)
+        state = policy.start()
+        for _ in state.attempts():
             for install_method in (self._run_installation_script,
                                    self._deploy_using_scheduled_task):
+                installed = False
                 try:
-                    install_method(installer)
+                    install_method(installer, policy=state.limit())
+                    installed = True
                 except exceptions.ArgusError as exc:
                     LOG.debug("Could not install Cloudbase-Init: %s", exc)
-                else:
-                    if self.check_cbinit_installation():
-                        return True
+                finally:
+                    # Even a failed attempt may leave a partial
+                    # installation behind, which the cached lookups
+                    # made before it wouldn't find.
+                    self._client.invalidate_cache()
+                if installed and self.check_cbinit_installation():
+                    return True
                 self.cbinit_cleanup()
 
         return False
 
-    def _run_installation_script(self, installer):
+    def _run_installation_script(self, installer, policy=None):
         """Run the installation script for Cloudbase-Init."""
         LOG.info("Running the installation script for Cloudbase-Init.")
 
+        resource_location = 'windows/installCBinit.ps1'
         parameters = '-installer {}'.format(installer)
-        self.execute_powershell_resource_script(
-            resource_location='windows/installCBinit.ps1',
-            parameters=parameters)
+        LOG.debug("Executing resource script %s with this parameters %s",
+                  resource_location, parameters)
+
+        instance_location = r"C:\{}".format(resource_location.split('/')[-1])
+        self.download_resource(resource_location, instance_location,
+                               policy=policy)
+        cmd = '"{}" {}'.format(instance_location, parameters)
+        self._client.stream_command_with_retry(
+            cmd, command_type=util.POWERSHELL_SCRIPT_BYPASS,
+            on_line=lambda stream, line: LOG.debug("%s: %s", stream, line),
+            spool="installCBinit-{}.log".format(installer), policy=policy)
 
-    def _deploy_using_scheduled_task(self, installer):
+    def _deploy_using_scheduled_task(self, installer, policy=None):
         """Deploy Cloudbase-Init using a scheduled task."""
         LOG.info("Deploying Cloudbase-Init using a scheduled task.")
         resource_script = 'windows/schedule_installer.ps1'
-        self.execute_powershell_resource_script(resource_script, installer)
+        self.execute_powershell_resource_script(resource_script, installer,
+                                                policy=policy)
 
     def sysprep(self):
         resource_location = "windows/sysprep.ps1"
@@ -215,11 +364,12 @@ class WindowsActionManager(base.BaseActionManager):
             # This fixes errors that stops scenarios from getting
             # created on different windows images.
             LOG.debug("Currently rebooting...")
+        self._client.invalidate_cache()
         LOG.info("Wait for the machine to finish rebooting ...")
         self.wait_boot_completion()
 
     def git_clone(self, repo_url, location, count=util.RETRY_COUNT,
-                  delay=util.RETRY_DELAY):
+                  delay=util.RETRY_DELAY, policy=None):
         """Clone from a remote repository to a specified location.
 
         :param repo_url: The remote repository URL.
@@ -227,6 +377,9 @@ class WindowsActionManager(base.BaseActionManager):
         :param count:
             The number of tries that should be attempted in case it fails.
         :param delay: The time delay before retrying.
+        :param policy:
+            A :class:`argus.util.RetryPolicy`, which replaces
+            `count` and `delay` when given.
         :returns: True if the clone was successful, False if not.
         :raises: ArgusCLIError if the path is not valid.
         :rtype: bool
@@ -238,18 +391,19 @@ class WindowsActionManager(base.BaseActionManager):
         cmd = "git clone '{repo}' '{location}'".format(repo=repo_url,
                                                        location=location)
 
-        while count > 0:
+        policy = policy or util.RetryPolicy(count=count, delay=delay)
+        for _ in policy:
             try:
                 self._client.run_command(cmd)
-            except exceptions.ArgusError as exc:
+            except Exception as exc:  # pylint: disable=broad-except
+                if not policy.is_retryable(exc):
+                    raise
                 LOG.debug("Cloning failed with %r.", exc)
-                if self.exists(location):
-                    rem = self.rmdir if self.is_dir(location) else self.remove
+                path_stat = self.stat(location)
+                if path_stat.exists:
+                    rem = (self.rmdir if path_stat.type == self._DIRECTORY
+                           else self.remove)
                     rem(location)
-                count -= 1
-                if count:
-                    LOG.debug('Retrying...')
-                    time.sleep(delay)
             else:
                 return True
 
@@ -264,7 +418,8 @@ class WindowsActionManager(base.BaseActionManager):
             wait_cmd,
             lambda out: out.strip() == 'Stopped',
             retry_count=util.RETRY_COUNT, delay=util.RETRY_DELAY,
-            command_type=util.POWERSHELL)
+            command_type=util.POWERSHELL,
+            remote_condition="$output.Trim() -eq 'Stopped'")
 
     def check_cbinit_service(self, searched_paths=None):
         """Check if the Cloudbase-Init service started.
@@ -273,14 +428,19 @@ class WindowsActionManager(base.BaseActionManager):
             Paths to files that should exist if the heartbeat patch is
             applied.
         """
-        test_cmd = 'Test-Path "{}"'
-        check_cmds = [test_cmd.format(path) for path in searched_paths or []]
-        for check_cmd in check_cmds:
-            self._client.run_command_until_condition(
-                check_cmd,
-                lambda out: out.strip() == 'True',
-                retry_count=util.RETRY_COUNT, delay=util.RETRY_DELAY,
-                command_type=util.POWERSHELL)
+        if not searched_paths:
+            return
+        # A single command waits for all the paths, by counting
+        # the missing ones.
+        check_cmd = ("@(@({}) | Where-Object "
+                     "{{ -not (Test-Path -LiteralPath $_) }}).Count").format(
+                         ",".join(_quote(path) for path in searched_paths))
+        self._client.run_command_until_condition(
+            check_cmd,
+            lambda out: out.strip() == '0',
+            retry_count=util.RETRY_COUNT, delay=util.RETRY_DELAY,
+            command_type=util.POWERSHELL,
+            remote_condition="$output.Trim() -eq '0'")
 
     def wait_boot_completion(self):
         """Wait for a reasonable amount of time the instance to boot."""
@@ -293,23 +453,172 @@ class WindowsActionManager(base.BaseActionManager):
         # We don't have anything specific for the base
         LOG.debug("Prepare something specific for OS Type %s", self._os_type)
 
+    def _check_and_act(self, path, script, acted=(), policy=None):
+        """Check a path and act on it with a single remote command.
+
+        The check and the action aren't repeated as a whole, so an
+        attempt which failed after acting leaves the path in the state
+        which the script brings it to. Finding it so when retrying is
+        reported as `_DONE`.
+
+        :param path:
+            The instance path given to the script as `$path`.
+        :param script:
+            A PowerShell script which prints a single word describing
+            what it found or what it did.
+        :param acted:
+            The words printed by the script when the path is already
+            in the state the script brings it to.
+        :param policy:
+            A :class:`argus.util.RetryPolicy`, the same as the default
+            one of the clients if not given.
+        """
+        cmd = "$path = {}; {}".format(_quote(path), script)
+        policy = policy or util.RetryPolicy.from_count()
+        for attempt in policy:
+            try:
+                stdout, _, _ = self._client.run_command(
+                    cmd, command_type=util.POWERSHELL)
+            except Exception as exc:  # pylint: disable=broad-except
+                if not policy.is_retryable(exc):
+                    raise
+                LOG.debug("Command failed with %r.", exc)
+                continue
+            result = stdout.strip()
+            if attempt > 1 and result in acted:
+                LOG.debug("A failed attempt already acted on %s.", path)
+                return self._DONE
+            return result
+
+        raise exceptions.ArgusTimeoutError(
+            "Command {!r} failed too many times.".format(cmd))
+
+    def _parse_stat(self, path, output):
+        """Parse the output of the stat of a path.
+
+        Return the :class:`PathStat` and the remaining fields.
+        """
+        fields = output.split()
+        if not fields or fields[0] == self._MISSING:
+            return PathStat(False, None, None, None), fields[1:]
+        if len(fields) < 3 or fields[0] not in (self._FILE,
+                                                self._DIRECTORY):
+            raise exceptions.ArgusCLIError(
+                "Unexpected output of stat for {!r}: {!r}".format(
+                    path, output))
+        item_type, size, file_time = fields[:3]
+        mtime = (int(file_time) - _FILE_TIME_EPOCH) / _FILE_TIME_UNITS
+        return PathStat(True, item_type, int(size), mtime), fields[3:]
+
+    def stat(self, path):
+        """Get the existence, type, size and modification time of a path.
+
+        :param path:
+            Path to inspect.
+        :rtype: PathStat
+        """
+        output = self._check_and_act(path, self._STAT_SCRIPT)
+        path_stat, extra = self._parse_stat(path, output)
+        if extra:
+            raise exceptions.ArgusCLIError(
+                "Unexpected output of stat for {!r}: {!r}".format(
+                    path, output))
+        return path_stat
+
+    def _run_for_paths(self, paths, script, per_command=None,
+                       max_size=None):
+        """Run a script for many paths, with as few commands as possible.
+
+        The script is run for each path given as `$path` and it
+        must print a single line. Each command gets at most
+        `per_command` paths, whose total size is under
+        :data:`PATHS_MAX_SIZE`.
+
+        Return the lines printed for each path, in order.
+        """
+        groups = []
+        size = 0
+        for path in paths:
+            quoted = _quote(path)
+            if (not groups or len(groups[-1]) == per_command or
+                    size + len(quoted) > PATHS_MAX_SIZE):
+                groups.append([])
+                size = 0
+            groups[-1].append(quoted)
+            size += len(quoted) + 1
+
+        lines = []
+        for group in groups:
+            cmd = "foreach ($path in @({})) {{ {} }}".format(
+                ",".join(group), script)
+            if max_size is not None:
+                cmd = "$maxSize = {}; {}".format(max_size, cmd)
+            stdout, _, _ = self._client.run_command_with_retry(
+                cmd, command_type=util.POWERSHELL)
+            output = [line for line in stdout.splitlines() if line.strip()]
+            if len(output) != len(group):
+                raise exceptions.ArgusCLIError(
+                    "Expected {} lines for the paths {}, got {!r}.".format(
+                        len(group), ", ".join(group), stdout))
+            lines.extend(output)
+        return lines
+
+    def stat_many(self, paths):
+        """Get the stat of many paths, with a single command if possible.
+
+        :param paths:
+            The paths to inspect.
+        :returns:
+            A list with the :class:`PathStat` of each path, in order.
+        """
+        lines = self._run_for_paths(paths, self._STAT_SCRIPT)
+        return [self._parse_stat(path, line)[0]
+                for path, line in zip(paths, lines)]
+
+    def read_many(self, paths, max_size=READ_MAX_SIZE):
+        """Read many files, with a single command if possible.
+
+        :param paths:
+            The paths of the files.
+        :param max_size:
+            The maximum number of bytes read from each file, the
+            bigger files being truncated.
+        :returns:
+            A list with the :class:`FileContent` of each path, in order.
+        """
+        # Each line has the stat of the file and its encoded content.
+        per_command = max(1, READ_OUTPUT_MAX_SIZE // (max_size * 4 // 3 + 64))
+        lines = self._run_for_paths(paths, self._READ_SCRIPT,
+                                    per_command=per_command,
+                                    max_size=max_size)
+        results = []
+        for path, line in zip(paths, lines):
+            path_stat, extra = self._parse_stat(path, line)
+            content = None
+            if path_stat.type == self._FILE:
+                content = base64.b64decode(extra[0]) if extra else b""
+            truncated = content is not None and len(content) < path_stat.size
+            if truncated:
+                LOG.debug("Read only %d bytes of the %d bytes of %s.",
+                          len(content), path_stat.size, path)
+            results.append(FileContent(path_stat, content, truncated))
+        return results
+
     def remove(self, path):
         """Remove a file."""
-        if not self.exists(path) or not self.is_file(path):
-            raise exceptions.ArgusCLIError("Invalid Path '{}'.".format(path))
-
         LOG.debug("Remove file %s", path)
-        cmd = "Remove-Item -Force -Path '{path}'".format(path=path)
-        self._client.run_command_with_retry(cmd, command_type=util.POWERSHELL)
+        result = self._check_and_act(path, self._REMOVE_SCRIPT,
+                                     acted=(self._MISSING, ))
+        if result != self._DONE:
+            raise exceptions.ArgusCLIError("Invalid Path '{}'.".format(path))
 
     def rmdir(self, path):
         """Remove a directory."""
-        if not self.exists(path) or not self.is_dir(path):
-            raise exceptions.ArgusCLIError("Invalid Path '{}'.".format(path))
-
         LOG.debug("Remove directory  %s", path)
-        cmd = "Remove-Item -Force -Recurse -Path '{path}'".format(path=path)
-        self._client.run_command_with_retry(cmd, command_type=util.POWERSHELL)
+        result = self._check_and_act(path, self._RMDIR_SCRIPT,
+                                     acted=(self._MISSING, ))
+        if result != self._DONE:
+            raise exceptions.ArgusCLIError("Invalid Path '{}'.".format(path))
 
     def _exists(self, path, path_type):
         """Check if the path exists and it has the specified type.
@@ -349,30 +658,18 @@ class WindowsActionManager(base.BaseActionManager):
         """
         return self._exists(path, self.PATH_CONTAINER)
 
-    def _new_item(self, path, item_type):
-        """Create a directory or a file.
-
-        :param path:
-            Instance path of the new item.
-        :param item_type:
-            It can be `Directory` or `File`
-        """
-        cmd = "New-Item -Path '{}' -Type {} -Force".format(path, item_type)
-        self._client.run_command_with_retry(cmd=cmd,
-                                            command_type=util.POWERSHELL)
-
     def mkdir(self, path):
         """Create a directory in the instance if the path is valid.
 
         :param path:
             Remote path where the new directory should be created.
         """
-        if self.exists(path):
+        result = self._check_and_act(path, self._MKDIR_SCRIPT,
+                                     acted=(self._DIRECTORY, ))
+        if result != self._DONE:
             raise exceptions.ArgusCLIError(
                 "Cannot create directory {} . It already exists.".format(
                     path))
-        else:
-            self._new_item(path, self._DIRECTORY)
 
     def mkfile(self, path):
         """Create a file in the instance if the path is valid.
@@ -380,17 +677,15 @@ class WindowsActionManager(base.BaseActionManager):
         :param path:
             Remote path where the new file should be created.
         """
-        if self.is_file(path):
-            LOG.warning("File '%s' already exists. LastWriteTime and"
-                        " LastAccessTime will be updated.", path)
-            self._client.run_command_with_retry(
-                "echo $null >> '{}'".format(path),
-                command_type=util.POWERSHELL)
-        elif self.is_dir(path):
+        result = self._check_and_act(path, self._MKFILE_SCRIPT,
+                                     acted=(self._FILE, ))
+        if result == self._DIRECTORY:
             raise exceptions.ArgusCLIError(
                 "Path '{}' leads to a"
                 " directory.".format(path))
-        self._new_item(path, self._FILE)
+        elif result == self._FILE:
+            LOG.warning("File '%s' already exists. LastWriteTime and"
+                        " LastAccessTime will be updated.", path)
 
     def touch(self, path):
         """Update the access and modification time.
@@ -398,15 +693,7 @@ class WindowsActionManager(base.BaseActionManager):
         If the file doesn't exist, an empty file will be created
         as side effect.
         """
-        if self.is_dir(path):
-            cmd = ("$datetime = get-date;"
-                   "$dir = Get-Item '{}';"
-                   "$dir.LastWriteTime = $datetime;"
-                   "$dir.LastAccessTime = $datetime;").format(path)
-            self._client.run_command_with_retry(
-                cmd, command_type=util.POWERSHELL)
-        else:
-            self.mkfile(path)
+        self._check_and_act(path, self._TOUCH_SCRIPT)
 
     # pylint: disable=unused-argument
     def prepare_config(self, cbinit_conf, cbinit_unattend_conf):
@@ -429,14 +716,14 @@ class WindowsServer2008ActionManager(WindowsActionManager):
     def __init__(self, client, os_type=util.WINDOWS_SERVER_2008):
         super(WindowsServer2008ActionManager, self).__init__(client, os_type)
 
-    def _run_installation_script(self, installer):
+    def _run_installation_script(self, installer, policy=None):
         """Run the installation script for Cloudbase-Init."""
         LOG.info("Running the installation script for Cloudbase-Init.")
 
         parameters = '-installer {}'.format(installer)
         self.execute_powershell_resource_script(
             resource_location='windows/2008R2/installCBinit.ps1',
-            parameters=parameters)
+            parameters=parameters, policy=policy)
 
     def prepare_config(self, cbinit_conf, cbinit_unattend_conf):
         """Prepare Cloudbase-Init config for every OS.
@@ -497,27 +784,26 @@ class WindowsNanoActionManager(WindowsSever2016ActionManager):
     def specific_prepare(self):
         super(WindowsNanoActionManager, self).specific_prepare()
 
-        if not self.is_dir(self._RESOURCE_DIRECTORY):
-            self.mkdir(self._RESOURCE_DIRECTORY)
-
+        # The resources are uploaded only if they aren't already there,
+        # the resource directory being created if needed.
         resource_path = self._get_resource_path(self._COMMON)
-        self._client.copy_file(
+        self._client.upload_cached(
             resource_path, ntpath.join(self._RESOURCE_DIRECTORY,
                                        self._COMMON))
 
         LOG.info("Copy Download script for Windows NanoServer.")
         resource_path = self._get_resource_path(self._DOWNLOAD_SCRIPT)
-        self._client.copy_file(
+        self._client.upload_cached(
             resource_path, ntpath.join(self._RESOURCE_DIRECTORY,
                                        self._DOWNLOAD_SCRIPT))
 
-    def download(self, uri, location):
+    def download(self, uri, location, policy=None):
         resource_path = ntpath.join(self._RESOURCE_DIRECTORY,
                                     self._DOWNLOAD_SCRIPT)
         cmd = r"{script_path} -Uri {uri} -OutFile '{outfile}'".format(
             script_path=resource_path, uri=uri, outfile=location)
         self._client.run_command_with_retry(
-            cmd, command_type=util.POWERSHELL)
+            cmd, command_type=util.POWERSHELL, policy=policy)
 
     def prepare_config(self, cbinit_conf, cbinit_unattend_conf):
         """Prepare Cloudbase-Init config for every OS.
@@ -549,75 +835,28 @@ WindowsActionManagers = {
 }
 
 
-def _is_nanoserver(client):
-    """Returns True if the client is connected to a NanoServer machine.
-
-       Using the powershell code from here: https://goo.gl/UD27SK
-    """
-    server_level_key = (r'HKLM:\Software\Microsoft\Windows NT\CurrentVersion'
-                        r'\Server\ServerLevels')
-
-    cmd = r'Test-Path "{}"'.format(server_level_key)
-    path_exists, _, _ = client.run_command_with_retry(
-        cmd, count=util.RETRY_COUNT, delay=util.RETRY_DELAY,
-        command_type=util.POWERSHELL)
-
-    if path_exists == "False":
-        return False
-
-    cmd = r'(Get-ItemProperty "{}").NanoServer'.format(server_level_key)
-    nanoserver_property, _, _ = client.run_command_with_retry(
-        cmd, count=util.RETRY_COUNT, delay=util.RETRY_DELAY,
-        command_type=util.POWERSHELL)
-
-    return len(nanoserver_property) > 0 and nanoserver_property[0] == "1"
-
-
-def _get_product_type(client, major_version):
-    """Return the minor version of the OS.
+def get_windows_action_manager(client):
+    """Get the OS specific Action Manager.
 
-    :param client:
-        A Windows Client.
-    :param  major_version:
-        Windows Major version according to
-        https://msdn.microsoft.com/en-us/library/aa394239(v=vs.85).aspx
+    The OS is identified with a single command, retried until the
+    instance finishes booting.
     """
-    # NOTE(mmicu): For Windows 10, Windows Server 2016 and Windows Nano
-    # we use Common Information Model (Cim) and for the others we use
-    # Windows Management Instrumentation (Wmi)
-    cmdlet = Windows8ActionManager.WINDOWS_MANAGEMENT_CMDLET
-    if major_version == 10:
-        cmdlet = Windows10ActionManager.WINDOWS_MANAGEMENT_CMDLET
-    cmd = r"({} -Class Win32_OperatingSystem).producttype".format(cmdlet)
-
-    product_type, _, _ = client.run_command_with_retry(
-        cmd, count=util.RETRY_COUNT, delay=util.RETRY_DELAY,
-        command_type=util.POWERSHELL)
-    return util.get_int_from_str(product_type.strip())
-
-
-def get_windows_action_manager(client):
-    """Get the OS specific Action Manager."""
     LOG.info("Waiting for boot completion in order to select an "
              "Action Manager ...")
 
-    username = CONFIG.openstack.image_username
-    wait_boot_completion(client, username)
-
-    # get OS type
-    major_version = introspection.get_os_version(client, 'Major')
-    minor_version = introspection.get_os_version(client, 'Minor')
-    product_type = _get_product_type(client, major_version)
-    windows_type = util.WINDOWS_VERSION.get((major_version, minor_version,
-                                             product_type), util.WINDOWS)
-    is_nanoserver = _is_nanoserver(client)
+    fingerprint = introspection.get_os_fingerprint(client)
+    windows_type = util.WINDOWS_VERSION.get(
+        (fingerprint.major, fingerprint.minor, fingerprint.product_type),
+        util.WINDOWS)
 
     if isinstance(windows_type, dict):
-        windows_type = windows_type[is_nanoserver]
+        windows_type = windows_type[fingerprint.nano_server]
 
     LOG.debug(("We got the OS type %s because we have the major Version : %d,"
                "The product Type : %d, and IsNanoserver: %d"), windows_type,
-              major_version, product_type, is_nanoserver)
+              fingerprint.major, fingerprint.product_type,
+              fingerprint.nano_server)
 
-    action_manager = WindowsActionManagers[windows_type]
-    return action_manager(client=client)
+    action_manager = WindowsActionManagers[windows_type](client=client)
+    action_manager.os_fingerprint = fingerprint
+    return action_manager
@@ -14,7 +14,6 @@
 #    under the License.
 
 import abc
-import time
 
 from heatclient import exc
 import six
@@ -180,17 +179,15 @@ class BaseHeatBackend(base.CloudBackend):
         return six.functools.reduce(lambda acc, e: acc + 1, iterator, 0)
 
     def _wait_stacks(self, retry_count=RETRY_COUNT,
-                     retry_delay=RETRY_DELAY):
+                     retry_delay=RETRY_DELAY, policy=None):
         """We are going to wait until all stacks are deleted."""
-        stacks = self._get_stacks()
-        retry_count = stacks * retry_count
-        retry_delay = stacks * retry_delay
-        while retry_count > 0:
+        if policy is None:
+            stacks = self._get_stacks()
+            policy = util.RetryPolicy(count=stacks * retry_count,
+                                      delay=stacks * retry_delay)
+        for _ in policy:
             if not self._get_stacks():
                 return
-            else:
-                retry_count -= 1
-            time.sleep(retry_delay)
         raise exceptions.ArgusHeatTeardown(
             "All stacks failed to be deleted in time!")
 
@@ -211,28 +208,28 @@ class BaseHeatBackend(base.CloudBackend):
 
     def _search_resource_until_status(self, resource_name,
                                       limit=HEAT_RESOURCE_LIMIT,
-                                      status=RESOURCE_COMPLETED_STATUS):
+                                      status=RESOURCE_COMPLETED_STATUS,
+                                      policy=None):
         fields = {
             'stack_id': self._name,
             'nested_depth': 1,
         }
-        while limit > 0:
+        policy = policy or util.RetryPolicy(count=limit,
+                                            delay=HEAT_RESOURCE_TIMEOUT)
+        for _ in policy:
             try:
                 resources = self._heat_client.resources.list(**fields)
             except exc.HTTPNotFound:
                 raise exceptions.ArgusError('Stack not found: %s' % self._name)
-            else:
-                for resource in resources:
-                    if resource.resource_type == resource_name:
-                        # Found the resource we were needing
-                        if resource.resource_status == status:
-                            return resource.physical_resource_id
-                        else:
-                            limit -= 1
-                            time.sleep(HEAT_RESOURCE_TIMEOUT)
-                            break
-                else:
+
+            for resource in resources:
+                if resource.resource_type == resource_name:
+                    # Found the resource we were needing
+                    if resource.resource_status == status:
+                        return resource.physical_resource_id
                     break
+            else:
+                break
 
         raise exceptions.ArgusError("No resource %s found with name %s"
                                     % (resource_name, self._name))
@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from argus.client import ssh
 from argus.client import windows
 from argus import config as argus_config
 from argus import util
@@ -23,17 +24,55 @@ CONFIG = argus_config.CONFIG
 class WindowsBackendMixin(object):
     """Mixin back-end tailored for interacting with Windows."""
 
+    remote_transport = None
+    """The transport of the remote clients, overriding the configured one.
+
+    This is either ``winrm`` or ``ssh``.
+    """
+
     # pylint: disable=unused-argument
     def get_remote_client(self, username=None, password=None,
-                          protocol='http', **kwargs):
-        """Uses : class:`argus.util.WinRemoteClient` as underlying client."""
+                          protocol='http', cert_pem=None, cert_key=None,
+                          transport=None, **kwargs):
+        """Get a remote client to the instance.
+
+        :class:`argus.client.windows.WinRemoteClient` is used by default
+        and :class:`argus.client.ssh.SSHRemoteClient` when the transport
+        is ``ssh``, given as argument, by :attr:`remote_transport` or
+        by the configuration. The clients authenticated with a
+        certificate always use WinRM over HTTPS.
+        """
 
         if username is None:
             username = CONFIG.openstack.image_username
         if password is None:
             password = CONFIG.openstack.image_password
-        return windows.WinRemoteClient(self.floating_ip(),
-                                       username, password,
-                                       transport_protocol=protocol)
+        transport = (transport or self.remote_transport or
+                     CONFIG.argus.remote_transport)
+        if transport == 'ssh' and not cert_pem:
+            return ssh.SSHRemoteClient(
+                self.floating_ip(), username, password,
+                capture_limit=CONFIG.argus.output_capture_limit)
+        return windows.WinRemoteClient(
+            self.floating_ip(), username, password,
+            transport_protocol='https' if cert_pem else protocol,
+            cert_pem=cert_pem, cert_key=cert_key,
+            use_runspace=CONFIG.argus.powershell_runspace,
+            capture_limit=CONFIG.argus.output_capture_limit)
 
     remote_client = util.cached_property(get_remote_client, 'remote_client')
+
+    def reboot_instance(self):
+        """Reboot the instance, forgetting what the default client cached."""
+        result = super(WindowsBackendMixin, self).reboot_instance()
+        remote_client = self.__dict__.get('remote_client')
+        if remote_client is not None:
+            remote_client.invalidate_cache()
+        return result
+
+    def cleanup(self):
+        """Close the default client before destroying the resources."""
+        remote_client = self.__dict__.pop('remote_client', None)
+        if remote_client is not None:
+            remote_client.close()
+        super(WindowsBackendMixin, self).cleanup()
@@ -43,3 +43,9 @@ class BaseClient(object):
         It will return a tuple of three elements, stdout, stderr
         and the return code of the command.
         """
+
+    def close(self):
+        """Release the resources held by the client, if any."""
+
+    def invalidate_cache(self):
+        """Forget the cached results of the remote queries, if any."""
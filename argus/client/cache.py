@@ -0,0 +1,97 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Caching of the results of the idempotent remote queries."""
+
+import threading
+import time
+
+from argus import util
+
+LOG = util.get_logger()
+
+# The number of seconds a cached result is used for.
+RESULT_CACHE_TTL = 300
+
+
+class ResultCache(object):
+    """A cache of results, which expire after a given number of seconds.
+
+    Concurrent requests for the same missing key are collapsed into
+    a single call, the other callers waiting for its result.
+    Only the results are cached, the errors are not.
+
+    :param ttl:
+        The number of seconds a result is used for.
+    """
+
+    def __init__(self, ttl=RESULT_CACHE_TTL):
+        self._ttl = ttl
+        self._results = {}
+        self._pending = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, func):
+        """Get the result for the key, calling `func` if it's missing."""
+        while True:
+            with self._lock:
+                entry = self._results.get(key)
+                if entry is not None and entry[0] > time.time():
+                    return entry[1]
+                event = self._pending.get(key)
+                if event is None:
+                    event = self._pending[key] = threading.Event()
+                    generation = self._generation
+                    break
+            # The same request is in flight, wait for its result.
+            event.wait()
+
+        try:
+            result = func()
+        except Exception:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+            raise
+
+        with self._lock:
+            del self._pending[key]
+            # The result might be stale if the cache was invalidated
+            # while it was computed.
+            if generation == self._generation:
+                self._results[key] = (time.time() + self._ttl, result)
+        event.set()
+        return result
+
+    def peek(self, key):
+        """Get the cached result for the key, None if it's missing."""
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and entry[0] > time.time():
+                return entry[1]
+        return None
+
+    def put(self, key, result):
+        """Cache the given result for the key."""
+        with self._lock:
+            self._results[key] = (time.time() + self._ttl, result)
+
+    def invalidate(self):
+        """Forget all the cached results."""
+        with self._lock:
+            LOG.debug("Invalidating %d cached results.", len(self._results))
+            self._results.clear()
+            self._generation += 1
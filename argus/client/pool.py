@@ -0,0 +1,215 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""HTTP connection pools shared by the remote clients."""
+
+import ssl
+import threading
+
+from requests import adapters
+from six.moves import urllib_parse as urlparse
+
+from argus import util
+
+LOG = util.get_logger()
+
+# The maximum number of idle connections kept alive for an endpoint.
+POOL_MAXSIZE = 4
+# Whether the TLS sessions can be resumed by new connections, which
+# needs an SSL module able to create sockets of a custom class.
+TLS_SESSION_RESUMPTION = hasattr(ssl.SSLContext, "sslsocket_class")
+
+
+class _ResumableSSLSocket(ssl.SSLSocket):
+    """An SSL socket handing its TLS session to its context.
+
+    With TLS 1.3, the session tickets are received only after the
+    handshake, so the session is saved by the first read finding
+    it resumable.
+    """
+
+    _session_saved = False
+
+    def read(self, *args, **kwargs):
+        data = super(_ResumableSSLSocket, self).read(*args, **kwargs)
+        if not self._session_saved:
+            self._session_saved = self.context.save_session(self)
+        return data
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """An SSL context resuming the last TLS session of its connections.
+
+    The handshake of a new connection resumes the session of a
+    previous one, if the server still knows it, instead of doing
+    a full handshake. Only a context used for a single server
+    should resume its sessions.
+    """
+
+    sslsocket_class = _ResumableSSLSocket
+
+    # pylint: disable=unused-argument
+    def __init__(self, *args, **kwargs):
+        # The arguments are handled by `ssl.SSLContext.__new__`.
+        super(ResumingSSLContext, self).__init__()
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def save_session(self, sock):
+        """Save the session of the socket, if it can be resumed."""
+        session = sock.session
+        if session is None:
+            return False
+        if not session.has_ticket and (sock.version() == "TLSv1.3" or
+                                       not session.id):
+            return False
+        with self._session_lock:
+            self._session = session
+        return True
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        with self._session_lock:
+            kwargs.setdefault("session", self._session)
+        ssl_sock = super(ResumingSSLContext, self).wrap_socket(
+            sock, *args, **kwargs)
+        if ssl_sock.session_reused:
+            LOG.debug("Resumed the TLS session with %s.",
+                      kwargs.get("server_hostname"))
+        ssl_sock._session_saved = self.save_session(ssl_sock)
+        return ssl_sock
+
+
+def _get_ssl_context():
+    """Get a new context resuming the TLS sessions, if it's supported."""
+    if not TLS_SESSION_RESUMPTION:
+        return None
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    # The server certificate is validated by urllib3 when asked to.
+    context.check_hostname = False
+    return context
+
+
+class SharedHTTPAdapter(adapters.HTTPAdapter):
+    """An HTTP adapter which can be mounted by multiple sessions.
+
+    Closing a session which mounted this adapter will not close the
+    underlying connections, since they can still be used by other
+    sessions. They are closed only by :meth:`release`.
+
+    :param ssl_context:
+        The SSL context used for the HTTPS connections, instead
+        of the default one created by urllib3 for each connection.
+    """
+
+    def __init__(self, ssl_context=None, **kwargs):
+        self._ssl_context = ssl_context
+        super(SharedHTTPAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self._ssl_context is not None:
+            kwargs["ssl_context"] = self._ssl_context
+        super(SharedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        if self._ssl_context is not None:
+            kwargs["ssl_context"] = self._ssl_context
+        return super(SharedHTTPAdapter, self).proxy_manager_for(
+            *args, **kwargs)
+
+    def close(self):
+        """Do nothing, the connections are owned by the pool."""
+
+    def release(self):
+        """Close all the connections of this adapter."""
+        super(SharedHTTPAdapter, self).close()
+
+
+class EndpointPool(object):
+    """A registry of keep-alive connection pools, one for each endpoint.
+
+    All the sessions created for the same endpoint, no matter the
+    credentials they use, will send their requests through the
+    same bounded pool of connections. The sessions authenticated
+    with a client certificate get a pool of their own for each
+    certificate, since the certificate is bound to the connection.
+
+    The HTTPS connections of an endpoint resume the TLS sessions
+    of the previous ones, even after the pool was released.
+
+    :param maxsize:
+        The maximum number of connections kept alive for an endpoint.
+    """
+
+    def __init__(self, maxsize=POOL_MAXSIZE):
+        self._maxsize = maxsize
+        self._adapters = {}
+        self._ssl_contexts = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_prefix(endpoint):
+        """Get the scheme and the network location of the endpoint."""
+        parsed = urlparse.urlparse(endpoint)
+        return "{}://{}/".format(parsed.scheme, parsed.netloc)
+
+    def _get_key(self, endpoint, cert=None):
+        if isinstance(cert, list):
+            cert = tuple(cert)
+        return self._get_prefix(endpoint), cert or None
+
+    def get_adapter(self, endpoint, cert=None):
+        """Get the adapter used for the given endpoint.
+
+        :param cert:
+            The client certificate used for the endpoint, as given
+            to :attr:`requests.Session.cert`.
+        """
+        key = self._get_key(endpoint, cert)
+        with self._lock:
+            adapter = self._adapters.get(key)
+            if adapter is None:
+                LOG.debug("Creating a connection pool for %s.", key[0])
+                ssl_context = None
+                if key[0].startswith("https:"):
+                    ssl_context = self._ssl_contexts.get(key)
+                    if ssl_context is None:
+                        ssl_context = self._ssl_contexts[key] = (
+                            _get_ssl_context())
+                adapter = self._adapters[key] = SharedHTTPAdapter(
+                    ssl_context=ssl_context,
+                    pool_connections=1, pool_maxsize=self._maxsize)
+            return adapter
+
+    def mount(self, session, endpoint):
+        """Make the given session use the pool of the endpoint."""
+        session.mount(self._get_prefix(endpoint),
+                      self.get_adapter(endpoint, session.cert))
+
+    def release(self, endpoint=None):
+        """Close the connections of an endpoint or of all of them."""
+        with self._lock:
+            if endpoint is None:
+                released = list(self._adapters.values())
+                self._adapters.clear()
+            else:
+                prefix = self._get_prefix(endpoint)
+                released = [self._adapters.pop(key)
+                            for key in list(self._adapters)
+                            if key[0] == prefix]
+        for adapter in released:
+            adapter.release()
+
+
+ENDPOINT_POOL = EndpointPool()
@@ -0,0 +1,289 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A PowerShell process kept running on the instance.
+
+Instead of starting a new powershell.exe for every command, the
+commands are sent to the standard input of a single PowerShell
+process, which runs them in the same session, so the global variables
+and the imported modules are kept between the commands. Each command
+runs in its own scope though, like a script, so its local variables
+and preferences aren't seen by the following ones.
+
+Each request is a line made of an ID and the base64 encoded script.
+Each response is a line starting with :data:`RESPONSE_MARKER`,
+followed by the ID of the request, the exit code and the base64
+encoded output and errors of the script, which are decoded as they
+are received.
+"""
+
+import base64
+import itertools
+
+import six
+from winrm import exceptions as winrm_exceptions
+
+from argus import exceptions
+from argus import util
+
+LOG = util.get_logger()
+
+# The prefix of the lines carrying the responses of the host.
+RESPONSE_MARKER = "ARGUS-RUNSPACE"
+# The maximum number of characters of a request sent at once.
+INPUT_CHUNK_SIZE = 64 * 1024
+
+# The commands executed in the runspace, all the others being
+# executed by the command shell, as before.
+RUNSPACE_COMMAND_TYPES = (
+    util.POWERSHELL,
+    util.POWERSHELL_SCRIPT_BYPASS,
+)
+
+# Reads the requests from the standard input, until it is closed.
+# Each request is written to a script file, which is run in its own
+# scope, after the preference variables are reset to their initial
+# values, so a request doesn't change the ones following it, while
+# `exit` ends only the request. The modules are imported globally, so
+# they are kept. The exit code is the last one of a native command or
+# of `exit`, otherwise 1 when the request failed or wrote errors.
+_HOST_SCRIPT = """
+$argusEncoding = New-Object System.Text.UTF8Encoding $false
+$argusScriptEncoding = New-Object System.Text.UTF8Encoding $true
+$argusErrorType = [System.Management.Automation.ErrorRecord]
+$argusPath = Join-Path ([IO.Path]::GetTempPath()) "argus-runspace-$PID.ps1"
+$argusPreferences = @{{}}
+foreach ($argusVariable in Get-Variable -Name "*Preference" -Scope Global) {{
+    $argusPreferences[$argusVariable.Name] = $argusVariable.Value
+}}
+$PSDefaultParameterValues["Import-Module:Global"] = $true
+function ConvertTo-ArgusBase64($value) {{
+    [Convert]::ToBase64String($argusEncoding.GetBytes([string]$value))
+}}
+while ($true) {{
+    $argusRequest = [Console]::In.ReadLine()
+    if ($argusRequest -eq $null) {{ break }}
+    $argusId, $argusPayload = $argusRequest.Split(" ", 2)
+    foreach ($argusName in $argusPreferences.Keys) {{
+        Set-Variable -Name $argusName -Value $argusPreferences[$argusName] `
+            -Scope Global
+    }}
+    $argusCode = 0
+    $argusRecords = @()
+    $global:LASTEXITCODE = 0
+    try {{
+        [IO.File]::WriteAllText($argusPath, $argusEncoding.GetString(
+            [Convert]::FromBase64String($argusPayload)), $argusScriptEncoding)
+        $argusRecords = @(& $argusPath 2>&1)
+    }} catch {{
+        $argusRecords += $_
+        $argusCode = 1
+    }}
+    $argusOutput = $argusRecords | Where-Object {{ $_ -isnot $argusErrorType }}
+    $argusErrors = $argusRecords | Where-Object {{ $_ -is $argusErrorType }}
+    # The standard error of the native commands is reported only
+    # by their exit code.
+    $argusFailures = @($argusErrors | Where-Object {{
+        $_.FullyQualifiedErrorId -notlike "NativeCommandError*" }})
+    if ($global:LASTEXITCODE) {{
+        $argusCode = $global:LASTEXITCODE
+    }} elseif ($argusFailures.Count) {{
+        $argusCode = 1
+    }}
+    [Console]::Out.WriteLine("{marker} {{0}} {{1}} {{2}} {{3}}" -f $argusId,
+        $argusCode, (ConvertTo-ArgusBase64 ($argusOutput | Out-String)),
+        (ConvertTo-ArgusBase64 ($argusErrors | Out-String)))
+    [Console]::Out.Flush()
+}}
+Remove-Item -LiteralPath $argusPath -ErrorAction SilentlyContinue
+""".format(marker=RESPONSE_MARKER)
+
+
+def _b64encode(data):
+    encoded = base64.b64encode(data)
+    if six.PY3:
+        encoded = encoded.decode()
+    return encoded
+
+
+def get_host_command():
+    """Get the CMD command which starts the PowerShell host."""
+    encoded = _b64encode(_HOST_SCRIPT.encode("UTF-16LE"))
+    return ("powershell -NoLogo -NoProfile -NonInteractive"
+            " -ExecutionPolicy Bypass -EncodedCommand {}".format(encoded))
+
+
+def get_script(command, command_type):
+    """Get the PowerShell script equivalent to the given command."""
+    if command_type == util.POWERSHELL:
+        return command
+    # A PowerShell script file, with its parameters.
+    return "& {}".format(command)
+
+
+class _ResponseReader(object):
+    """Decode the fields of a response, as its chunks are received.
+
+    The exit code is kept, while the output and the errors are
+    written in the given streams.
+    """
+
+    def __init__(self, stdout, stderr):
+        self.exit_code = b""
+        self._streams = (None, stdout, stderr)
+        self._field = 0
+        self._encoded = b""
+
+    def feed(self, data):
+        """Decode the data, returning what follows the response.
+
+        None is returned while the response isn't complete.
+        """
+        while data:
+            separator = b"\n" if self._field == 2 else b" "
+            part, found, data = data.partition(separator)
+            if self._field == 0:
+                self.exit_code += part
+            else:
+                # Only whole groups of base64 characters are decoded,
+                # until the end of the field.
+                self._encoded += part.replace(b"\r", b"")
+                size = len(self._encoded)
+                if not found:
+                    size -= size % 4
+                self._streams[self._field].write(
+                    base64.b64decode(self._encoded[:size]))
+                self._encoded = self._encoded[size:]
+            if found:
+                self._field += 1
+                if self._field == len(self._streams):
+                    return data
+        return None
+
+
+class PowerShellRunspace(object):
+    """A PowerShell session running on the instance.
+
+    :param shell:
+        A tuple of a protocol and the ID of the shell in which the
+        host runs. The shell is used only by the runspace and it is
+        closed together with it.
+    """
+
+    def __init__(self, shell):
+        self._protocol, self._shell_id = shell
+        self._command_id = None
+        self._ids = itertools.count(1)
+        self._pending = b""
+
+    @property
+    def shell(self):
+        """The protocol and the ID of the shell of the runspace."""
+        return self._protocol, self._shell_id
+
+    def open(self):
+        """Start the PowerShell host on the instance."""
+        self._command_id = self._protocol.run_command(
+            self._shell_id, get_host_command())
+        LOG.debug("Started the PowerShell runspace %s.", self._command_id)
+
+    def _get_output(self):
+        get_output = getattr(self._protocol, "get_command_output_raw", None)
+        if get_output is None:
+            # Older pywinrm versions.
+            get_output = self._protocol._raw_get_command_output
+        while True:
+            try:
+                return get_output(self._shell_id, self._command_id)
+            except winrm_exceptions.WinRMOperationTimeoutError:
+                continue
+
+    def _find_response(self, prefix):
+        """Skip the pending lines until the response with the prefix.
+
+        The pending data is left after the prefix and True is returned
+        when the response is found.
+        """
+        while not self._pending.startswith(prefix):
+            line, found, rest = self._pending.partition(b"\n")
+            if not found:
+                return False
+            self._pending = rest
+            line = line.rstrip(b"\r")
+            if line:
+                # Written directly to the console, by Write-Host
+                # for instance.
+                LOG.debug("PowerShell runspace: %r", line)
+        self._pending = self._pending[len(prefix):]
+        return True
+
+    def _read_response(self, request_id, stdout, stderr):
+        """Read the response of the given request, returning its exit code.
+
+        The output and the errors are written in the given streams.
+        """
+        prefix = "{} {} ".format(RESPONSE_MARKER, request_id).encode()
+        reader = None
+        done = False
+        while True:
+            if reader is None and self._find_response(prefix):
+                reader = _ResponseReader(stdout, stderr)
+            if reader is not None:
+                pending = reader.feed(self._pending)
+                self._pending = pending or b""
+                if pending is not None:
+                    return int(reader.exit_code)
+
+            if done:
+                raise exceptions.ArgusError(
+                    "The PowerShell runspace exited unexpectedly.")
+            output, errors, _, done = self._get_output()
+            if errors:
+                LOG.debug("PowerShell runspace error: %r", errors)
+            self._pending += output
+
+    def run(self, script, stdout, stderr):
+        """Run the script, returning its exit code.
+
+        The output and the errors of the script are written in the
+        `stdout` and `stderr` streams, as they are received.
+        """
+        if self._command_id is None:
+            raise exceptions.ArgusError("The PowerShell runspace is closed.")
+
+        request_id = next(self._ids)
+        request = "{} {}\r\n".format(
+            request_id, _b64encode(script.encode("utf-8")))
+        for offset in range(0, len(request), INPUT_CHUNK_SIZE):
+            self._protocol.send_command_input(
+                self._shell_id, self._command_id,
+                request[offset:offset + INPUT_CHUNK_SIZE])
+
+        return self._read_response(request_id, stdout, stderr)
+
+    def close(self):
+        """Stop the host and close its shell, ignoring any error."""
+        command_id, self._command_id = self._command_id, None
+        try:
+            if command_id is not None:
+                try:
+                    self._protocol.send_command_input(
+                        self._shell_id, command_id, "", end=True)
+                finally:
+                    self._protocol.cleanup_command(self._shell_id,
+                                                   command_id)
+            self._protocol.close_shell(self._shell_id)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOG.debug("Closing the PowerShell runspace failed with %r.", exc)
@@ -0,0 +1,102 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A pool of remote shells, for running commands concurrently."""
+
+import contextlib
+import threading
+import time
+
+from argus import util
+
+LOG = util.get_logger()
+
+
+class ShellPool(object):
+    """A pool of remote shells on an instance, reused by the commands.
+
+    A shell is used by a single command at a time, so the number of
+    shells opened by the pool grows up to the number of commands
+    running concurrently. The shells unused for more than
+    `idle_timeout` seconds are closed instead of being reused.
+
+    :param open_shell:
+        A function opening a new shell.
+    :param close_shell:
+        A function closing a shell, ignoring any error.
+    :param idle_timeout:
+        The number of seconds a shell can stay unused.
+    :param discard_errors:
+        The errors making a shell unusable. A shell is closed,
+        instead of being reused, when a command fails with them.
+    """
+
+    def __init__(self, open_shell, close_shell, idle_timeout,
+                 discard_errors=()):
+        self._open_shell = open_shell
+        self._close_shell = close_shell
+        self._idle_timeout = idle_timeout
+        self._discard_errors = discard_errors
+        self._idle = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Get an idle shell or a new one, if there isn't any."""
+        expired = []
+        with self._lock:
+            while self._idle:
+                last_used, shell = self._idle.pop()
+                if time.time() - last_used <= self._idle_timeout:
+                    break
+                expired.append(shell)
+            else:
+                shell = None
+        for expired_shell in expired:
+            self._close_shell(expired_shell)
+        if shell is None:
+            shell = self._open_shell()
+        return shell
+
+    def release(self, shell):
+        """Give back a shell acquired from the pool."""
+        with self._lock:
+            if not self._closed:
+                self._idle.append((time.time(), shell))
+                return
+        self._close_shell(shell)
+
+    @contextlib.contextmanager
+    def shell(self):
+        """Use a shell of the pool, discarding it if it becomes unusable."""
+        shell = self.acquire()
+        try:
+            yield shell
+        except self._discard_errors as exc:
+            LOG.debug("Discarding a pooled remote shell after %r.", exc)
+            self._close_shell(shell)
+            raise
+        except Exception:
+            self.release(shell)
+            raise
+        self.release(shell)
+
+    def close(self):
+        """Close the idle shells and the ones released from now on."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for _, shell in idle:
+            self._close_shell(shell)
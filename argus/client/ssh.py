@@ -0,0 +1,229 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A client for the Windows instances running an SSH service."""
+
+import contextlib
+import ntpath
+import select
+import socket
+import threading
+
+import paramiko
+import six
+
+from argus.action_manager.windows import get_windows_action_manager
+from argus.client import windows
+from argus import util
+
+LOG = util.get_logger()
+
+# The default port of the SSH service.
+SSH_PORT = 22
+# The number of seconds to wait for establishing the connection.
+CONNECT_TIMEOUT = 60
+# The maximum number of channels running commands concurrently over
+# the connection, below the default MaxSessions of OpenSSH.
+MAX_CHANNELS = 8
+# The number of bytes read from a channel at once.
+READ_SIZE = 64 * 1024
+# The number of seconds to wait for the output of a command between
+# the checks of its exit status.
+POLL_INTERVAL = 1
+
+
+def _get_sftp_path(path):
+    """Get the SFTP path of a Windows path, like ``/C:/argus/file``."""
+    path = path.replace("\\", "/")
+    if ntpath.splitdrive(path)[0]:
+        path = "/" + path
+    return path
+
+
+class SSHRemoteClient(windows.BaseWindowsClient):
+    """Get a remote client to a Windows instance, over SSH.
+
+    The instance needs an SSH service, like Win32-OpenSSH, using
+    ``cmd.exe`` as its shell, the commands being sent as for the
+    WinRM client.
+
+    :param hostname: The IP where the client should be connected.
+    :param username: The username of the client.
+    :param password: The password of the remote client.
+    :param port: The port of the SSH service.
+    :param key_filename:
+        A private key file used for authenticating, instead of
+        the password.
+    :param connect_timeout:
+        The number of seconds to wait for establishing the connection.
+    :param capture_limit:
+        The number of bytes of the output of a command kept in memory
+        while it runs, the rest being spooled to disk. The errors show
+        only the beginning and the end of the output.
+    :param max_channels:
+        The maximum number of channels running the commands given to
+        :meth:`submit` and :meth:`map` concurrently.
+
+    The client keeps a single connection opened, each command running
+    in its own channel and the files being transferred with SFTP over
+    the same connection. The connection is reopened if it drops, like
+    after a reboot of the instance. Call :meth:`close` for releasing it.
+    The results of the commands marked as cacheable are reused until
+    they expire or until :meth:`invalidate_cache` is called.
+    """
+
+    def __init__(self, hostname, username, password, port=SSH_PORT,
+                 key_filename=None, connect_timeout=CONNECT_TIMEOUT,
+                 capture_limit=windows.OUTPUT_CAPTURE_LIMIT,
+                 max_channels=MAX_CHANNELS):
+        super(SSHRemoteClient, self).__init__(hostname, username, password)
+        self._port = port
+        self._key_filename = key_filename
+        self._connect_timeout = connect_timeout
+        self._capture_limit = capture_limit
+        self._max_channels = max_channels
+        self._connection = None
+        self._lock = threading.RLock()
+        self.manager = get_windows_action_manager(self)
+
+    def _connect(self):
+        connection = paramiko.SSHClient()
+        # The instances are created for each run, so their host
+        # keys can't be known beforehand.
+        connection.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        connection.connect(
+            self._hostname, port=self._port, username=self._username,
+            password=self._password, key_filename=self._key_filename,
+            timeout=self._connect_timeout, allow_agent=False,
+            look_for_keys=False)
+        LOG.debug("Connected to %s:%d over SSH.", self._hostname, self._port)
+        return connection
+
+    def _get_transport(self, reconnect=False):
+        """Get the transport of the connection, reconnecting if needed."""
+        with self._lock:
+            transport = (self._connection and
+                         self._connection.get_transport())
+            if reconnect or transport is None or not transport.is_active():
+                if self._connection is not None:
+                    LOG.debug("The SSH connection dropped, reconnecting.")
+                    self._connection.close()
+                self._connection = None
+                self._connection = self._connect()
+                transport = self._connection.get_transport()
+            return transport
+
+    def _open(self, open_channel):
+        """Open a channel on the connection with the given function.
+
+        The connection can drop without being noticed yet, like after
+        a reboot of the instance, so opening the channel is retried
+        once on a new connection, since nothing was run in it yet.
+        """
+        try:
+            return open_channel(self._get_transport())
+        except (paramiko.SSHException, EOFError, socket.error) as exc:
+            LOG.debug("Opening a channel failed with %r.", exc)
+        return open_channel(self._get_transport(reconnect=True))
+
+    def close(self):
+        """Wait for the submitted commands and close the connection."""
+        super(SSHRemoteClient, self).close()
+        with self._lock:
+            connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.close()
+
+    def _iter_command_output(self, cmd, command_type):
+        channel = self._open(paramiko.Transport.open_session)
+        with contextlib.closing(channel):
+            channel.exec_command(util.get_command(cmd, command_type))
+            while True:
+                if channel.recv_ready():
+                    yield windows.STDOUT, channel.recv(READ_SIZE)
+                elif channel.recv_stderr_ready():
+                    yield windows.STDERR, channel.recv_stderr(READ_SIZE)
+                elif channel.exit_status_ready():
+                    break
+                else:
+                    select.select([channel], [], [], POLL_INTERVAL)
+            # Drain the output received together with the exit status.
+            for name, recv in ((windows.STDOUT, channel.recv),
+                               (windows.STDERR, channel.recv_stderr)):
+                chunk = recv(READ_SIZE)
+                while chunk:
+                    yield name, chunk
+                    chunk = recv(READ_SIZE)
+            exit_code = channel.recv_exit_status()
+        yield None, exit_code
+
+    def run_remote_cmd(self, cmd, command_type=util.POWERSHELL):
+        """Run the given remote command.
+
+        The command will be executed on the remote underlying server.
+        It will return a tuple of three elements, stdout, stderr
+        and the return code of the command.
+        """
+        return self._capture_command(cmd, command_type, self._capture_limit)
+
+    def _get_max_workers(self):
+        return self._max_channels
+
+    def _run_concurrently(self, cmd, command_type):
+        """Run the command in its own channel, like any other command."""
+        return self.run_remote_cmd(cmd, command_type)
+
+    @contextlib.contextmanager
+    def _sftp(self):
+        sftp = self._open(paramiko.SFTPClient.from_transport)
+        with contextlib.closing(sftp):
+            yield sftp
+
+    def copy_file(self, filepath, remote_destination):
+        """Copy the given file-path in the remote destination.
+
+        The remote destination is the file name where the content
+        of file-path will be written. If it already exists, it will
+        be overwritten.
+        """
+        with self._sftp() as sftp:
+            sftp.put(filepath, _get_sftp_path(remote_destination))
+
+    def write_file(self, data, remote_destination):
+        """Copy the given data in the remote destination.
+
+        The remote destination is the file name where the content
+        of file-path will be written. The data is appended to it,
+        followed by a new line.
+        """
+        if isinstance(data, six.text_type):
+            data = data.encode("utf-8")
+        with self._sftp() as sftp:
+            with sftp.open(_get_sftp_path(remote_destination), "ab") as fd:
+                fd.write(data + b"\r\n")
+
+    def _download(self, remote_path, stream):
+        with self._sftp() as sftp:
+            size = sftp.getfo(_get_sftp_path(remote_path), stream)
+        LOG.debug("Downloaded %d bytes from %s.", size, remote_path)
+        return size
+
+    def download_file(self, remote_path, local_path):
+        """Download the remote file in the local path.
+
+        :returns: The number of bytes downloaded.
+        """
+        with open(local_path, "wb") as stream:
+            return self._download(remote_path, stream)
@@ -0,0 +1,154 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Timing statistics of the remote commands."""
+
+import collections
+import contextlib
+import hashlib
+import math
+import re
+import threading
+import time
+
+from argus import exceptions
+from argus import util
+
+LOG = util.get_logger()
+
+# The minimum number of seconds a Receive request waits for the
+# output of a command, for the commands known to be fast.
+MIN_OPERATION_TIMEOUT = 5
+# The maximum number of seconds a Receive request waits for the
+# output of a command, for the commands known to be slow.
+MAX_OPERATION_TIMEOUT = 600
+# How many times longer than the usual duration of a command the
+# Receive requests wait for its output.
+POLL_FACTOR = 2
+# The weight of the latest duration of a command in its average.
+SMOOTHING = 0.3
+
+# The number of characters of a script kept readable in its key, the
+# rest being replaced by a digest.
+SCRIPT_KEY_SIZE = 40
+
+# A command made of a name, maybe quoted, and of its arguments.
+_SIMPLE_COMMAND = re.compile(
+    r"""^\s*("[^"]*"|'[^']*'|[^\s"';|{}]+)(\s+[^;|{}\r\n]*)?$""")
+# The string literals and the numbers of a script, which usually are
+# the values changing between its runs.
+_SCRIPT_VALUES = re.compile(
+    r"""'(?:[^']|'')*'|"(?:[^"`]|`.)*"|\b\d+(?:\.\d+)?\b""")
+
+CommandTiming = collections.namedtuple(
+    "CommandTiming", "count average maximum last")
+
+
+def get_command_key(command, command_type):
+    """Get the key grouping the timings of the similar commands.
+
+    The commands are grouped by their type and by their name, ignoring
+    their arguments, or by their script, ignoring the string literals
+    and the numbers in it. The long scripts are identified by their
+    beginning and a digest of the rest.
+    """
+    match = _SIMPLE_COMMAND.match(command)
+    if match is not None:
+        return command_type, match.group(1).strip("\"'").lower()
+    if not command.strip():
+        return command_type, ""
+
+    script = " ".join(_SCRIPT_VALUES.sub("?", command).split()).lower()
+    if len(script) > SCRIPT_KEY_SIZE:
+        digest = hashlib.sha1(script.encode("utf-8")).hexdigest()
+        script = "{}#{}".format(script[:SCRIPT_KEY_SIZE], digest[:12])
+    return command_type, script
+
+
+class CommandTimings(object):
+    """The durations of the commands, tuning the long-polls for them.
+
+    The output of a command is received with long-polling requests,
+    waiting on the server side for the output up to an operation
+    timeout. The commands known to be fast get short polls and the
+    slow ones, like the installers, get long polls, instead of
+    keeping a request open for as long for all of them.
+
+    :param min_timeout:
+        The shortest operation timeout given for a command.
+    :param max_timeout:
+        The longest operation timeout given for a command.
+    """
+
+    def __init__(self, min_timeout=MIN_OPERATION_TIMEOUT,
+                 max_timeout=MAX_OPERATION_TIMEOUT):
+        self._min_timeout = min_timeout
+        self._max_timeout = max_timeout
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, duration):
+        """Record a duration of the commands with the given key."""
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                timing = CommandTiming(1, duration, duration, duration)
+            else:
+                timing = CommandTiming(
+                    timing.count + 1,
+                    SMOOTHING * duration + (1 - SMOOTHING) * timing.average,
+                    max(timing.maximum, duration), duration)
+            self._timings[key] = timing
+
+    def get(self, key):
+        """Get the timing of the commands with the given key, if any."""
+        with self._lock:
+            return self._timings.get(key)
+
+    def get_all(self):
+        """Get the timings of all the commands, mapped by their keys."""
+        with self._lock:
+            return dict(self._timings)
+
+    def get_operation_timeout(self, key, default):
+        """Get the operation timeout for the commands with the given key.
+
+        The `default` timeout is used for the commands without timings.
+        """
+        timing = self.get(key)
+        if timing is None:
+            return default
+        expected = max(timing.average, timing.last)
+        timeout = int(math.ceil(expected * POLL_FACTOR))
+        return min(max(timeout, self._min_timeout), self._max_timeout)
+
+    @contextlib.contextmanager
+    def measure(self, key):
+        """Record the duration of the command run in this context.
+
+        The commands which failed with an exit code are measured too,
+        but not the ones interrupted by an error of the transport.
+        """
+        start = time.time()
+        try:
+            yield
+        except exceptions.ArgusError:
+            self.record(key, time.time() - start)
+            raise
+        self.record(key, time.time() - start)
+
+
+# The timings of the commands run by all the clients.
+COMMAND_TIMINGS = CommandTimings()
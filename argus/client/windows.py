@@ -15,27 +15,300 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import abc
 import base64
+import codecs
+import collections
+from concurrent import futures
+import contextlib
 import functools
-
-try:
-    import StringIO
-except ImportError:
-    import io as StringIO
-
+import gzip
+import hashlib
+import io
+import ntpath
+import os
+import socket
+import tempfile
+import threading
 import time
 
+import requests
 import six
+from winrm import exceptions as winrm_exceptions
 from winrm import protocol
 
 from argus.action_manager.windows import get_windows_action_manager
 from argus.client import base
+from argus.client import cache
+from argus.client import pool
+from argus.client import runspace
+from argus.client import shell_pool
+from argus.client import timing
+from argus import config as argus_config
 from argus import exceptions
 from argus import util
 
 
+CONFIG = argus_config.CONFIG
 LOG = util.get_logger()
 CODEPAGE_UTF8 = 65001
+# Number of seconds after which an unused remote shell is considered
+# stale and it will be reopened before running the next command.
+SHELL_IDLE_TIMEOUT = 60
+# Maximum number of seconds a WS-Management operation can take
+# on the server side, before returning a timeout fault.
+OPERATION_TIMEOUT = 60
+# Maximum number of seconds to wait for an HTTP response, it needs
+# to be greater than the operation timeout.
+READ_TIMEOUT = 90
+# The maximum number of shells running commands concurrently, for
+# the commands submitted to a client.
+MAX_PARALLEL_SHELLS = 4
+# The number of shells kept for the client itself, out of the ones
+# a user can open: its own shell and the one of the runspace.
+RESERVED_SHELLS = 2
+# The limits of the WinRM service for a user, used when the configured
+# ones can't be obtained, which are the defaults of WinRM 2.0.
+DEFAULT_MAX_SHELLS_PER_USER = 5
+DEFAULT_MAX_OPERATIONS_PER_USER = 15
+# The maximum envelope size accepted by default by the WinRM service,
+# used when the configured one can't be obtained.
+DEFAULT_MAX_ENVELOPE_SIZE = 150 * 1024
+# Space reserved for the SOAP envelope around the data of a request.
+ENVELOPE_OVERHEAD = 4 * 1024
+
+# Uploads smaller than this number of bytes are never compressed.
+COMPRESSION_MIN_SIZE = 1024
+# Compressed uploads are used only if they are smaller than
+# this fraction of the original size.
+COMPRESSION_RATIO = 0.9
+
+# Files bigger than this number of bytes are uploaded in parts,
+# each of them having at least this size, over up to as many shells
+# of the pool as the commands which can run concurrently.
+PARALLEL_UPLOAD_PART_SIZE = 2 * 1024 * 1024
+
+# The number of bytes of a remote file read with a single command
+# when downloading it.
+DOWNLOAD_CHUNK_SIZE = 512 * 1024
+
+# The remote directory where the files uploaded with
+# `upload_cached` are stored by default.
+UPLOAD_CACHE_DIRECTORY = r"C:\argus_cache"
+
+# The number of seconds between two checks of a condition
+# evaluated on the instance.
+REMOTE_POLL_INTERVAL = 1
+# The maximum number of seconds spent waiting on the instance
+# when the retry policy doesn't bound the waiting time.
+REMOTE_WAIT_TIMEOUT = 600
+
+# The number of bytes of the output of a command kept in memory while
+# it runs, the rest being spooled to a temporary file.
+OUTPUT_CAPTURE_LIMIT = 4 * 1024 * 1024
+# The number of bytes from the beginning and from the end of the
+# output of a failed command included in the error message.
+ERROR_OUTPUT_PREVIEW = 2048
+
+# The names of the output streams of a command.
+STDOUT = "stdout"
+STDERR = "stderr"
+# The number of output lines of a streamed command which are kept
+# for its result and for the error messages.
+STREAM_TAIL_LINES = 20
+
+# Prints True if the file exists and it has the given SHA256
+# checksum, otherwise it makes sure the parent directory exists.
+_CACHE_CHECK_SCRIPT = """
+$path = {path}
+if (Test-Path -PathType Leaf $path) {{
+    $stream = [System.IO.File]::OpenRead($path)
+    try {{
+        $sha256 = [System.Security.Cryptography.SHA256]::Create()
+        $hash = $sha256.ComputeHash($stream)
+    }} finally {{
+        $stream.Dispose()
+    }}
+    $checksum = [System.BitConverter]::ToString($hash).Replace("-", "")
+    if ($checksum.ToLower() -eq "{checksum}") {{
+        return $true
+    }}
+}}
+$parent = Split-Path -Parent $path
+if (!(Test-Path -PathType Container $parent)) {{
+    $null = New-Item -ItemType Directory -Force -Path $parent
+}}
+$false
+"""
+
+# Decodes the base64 lines received through the standard input into
+# the file, printing the SHA256 checksum of the written bytes.
+# Compressed content is gathered in a temporary file first and then
+# decompressed into the destination.
+_UPLOAD_SCRIPT = """
+$ErrorActionPreference = "Stop"
+$path = {path}
+$compressed = {compressed}
+$stream = [System.IO.File]::Open($path, [System.IO.FileMode]::{mode})
+$start = $stream.Position
+$target = $stream
+if ($compressed) {{
+    $temp = [System.IO.Path]::GetTempFileName()
+    $target = [System.IO.File]::Open($temp, [System.IO.FileMode]::Create)
+}}
+try {{
+    while (($line = [Console]::In.ReadLine()) -ne $null) {{
+        if (!$line) {{ continue }}
+        $bytes = [System.Convert]::FromBase64String($line)
+        $target.Write($bytes, 0, $bytes.Length)
+    }}
+    if ($compressed) {{
+        $null = $target.Seek(0, [System.IO.SeekOrigin]::Begin)
+        $gzip = New-Object System.IO.Compression.GZipStream($target,
+            [System.IO.Compression.CompressionMode]::Decompress)
+        $buffer = New-Object byte[] 65536
+        while (($count = $gzip.Read($buffer, 0, $buffer.Length)) -gt 0) {{
+            $stream.Write($buffer, 0, $count)
+        }}
+    }}
+}} finally {{
+    $stream.Dispose()
+    if ($compressed) {{
+        $target.Dispose()
+        Remove-Item -Force $temp
+    }}
+}}
+$stream = [System.IO.File]::OpenRead($path)
+try {{
+    $null = $stream.Seek($start, [System.IO.SeekOrigin]::Begin)
+    $sha256 = [System.Security.Cryptography.SHA256]::Create()
+    $hash = $sha256.ComputeHash($stream)
+}} finally {{
+    $stream.Dispose()
+}}
+[System.BitConverter]::ToString($hash).Replace("-", "").ToLower()
+"""
+
+# Joins the uploaded parts in the destination, printing the SHA256
+# checksum of the resulting file. The parts are always removed.
+_JOIN_SCRIPT = """
+$ErrorActionPreference = "Stop"
+$path = {path}
+$parts = @({parts})
+if ({join}) {{
+    $stream = [System.IO.File]::Open($path, [System.IO.FileMode]::Create)
+    try {{
+        $buffer = New-Object byte[] 65536
+        foreach ($part in $parts) {{
+            $reader = [System.IO.File]::OpenRead($part)
+            try {{
+                while (($count = $reader.Read($buffer, 0, 65536)) -gt 0) {{
+                    $stream.Write($buffer, 0, $count)
+                }}
+            }} finally {{
+                $reader.Dispose()
+            }}
+        }}
+    }} finally {{
+        $stream.Dispose()
+    }}
+}}
+foreach ($part in $parts) {{
+    if (Test-Path $part) {{ Remove-Item -Force $part }}
+}}
+if ({join}) {{
+    $stream = [System.IO.File]::OpenRead($path)
+    try {{
+        $sha256 = [System.Security.Cryptography.SHA256]::Create()
+        $hash = $sha256.ComputeHash($stream)
+    }} finally {{
+        $stream.Dispose()
+    }}
+    [System.BitConverter]::ToString($hash).Replace("-", "").ToLower()
+}}
+"""
+
+# Prints the size and the SHA256 checksum of the file. The file can
+# still be written by other processes, like the logs.
+_FILE_INFO_SCRIPT = """
+$ErrorActionPreference = "Stop"
+$stream = New-Object System.IO.FileStream({path}, [System.IO.FileMode]::Open,
+    [System.IO.FileAccess]::Read, [System.IO.FileShare]::ReadWrite)
+try {{
+    $sha256 = [System.Security.Cryptography.SHA256]::Create()
+    $hash = $sha256.ComputeHash($stream)
+    $size = $stream.Position
+}} finally {{
+    $stream.Dispose()
+}}
+"{{0}} {{1}}" -f $size, [System.BitConverter]::ToString($hash).Replace("-", "")
+"""
+
+# Prints the base64 encoded bytes of the given range of the file.
+_READ_RANGE_SCRIPT = """
+$ErrorActionPreference = "Stop"
+$stream = New-Object System.IO.FileStream({path}, [System.IO.FileMode]::Open,
+    [System.IO.FileAccess]::Read, [System.IO.FileShare]::ReadWrite)
+try {{
+    $null = $stream.Seek({offset}, [System.IO.SeekOrigin]::Begin)
+    $buffer = New-Object byte[] {length}
+    $count = 0
+    while ($count -lt {length}) {{
+        $read = $stream.Read($buffer, $count, {length} - $count)
+        if ($read -eq 0) {{ break }}
+        $count += $read
+    }}
+}} finally {{
+    $stream.Dispose()
+}}
+[System.Convert]::ToBase64String($buffer, 0, $count)
+"""
+
+# Runs the command until the condition, which can use the output
+# of the command as `$output`, holds or until the timeout expires.
+# Prints whether the condition holds, followed by the last output.
+_WAIT_SCRIPT = """
+$ErrorActionPreference = "Stop"
+$deadline = [DateTime]::UtcNow.AddSeconds({timeout})
+while ($true) {{
+    $met = $false
+    try {{
+        $output = ({command}) | Out-String
+        $met = [bool]({condition})
+    }} catch {{
+        $output = ""
+    }}
+    if ($met -or [DateTime]::UtcNow -ge $deadline) {{ break }}
+    Start-Sleep -Milliseconds {interval}
+}}
+"{{0}}`n{{1}}" -f $met, $output
+"""
+
+# The code of the WSMan fault returned for a shell unknown to the
+# server, closed by it or lost by a restart of the WinRM service.
+WSMAN_SHELL_NOT_FOUND = 2150858843
+
+# Errors after which the remote shell can't be trusted anymore.
+_SHELL_ERRORS = (
+    winrm_exceptions.WinRMError,
+    winrm_exceptions.WinRMTransportError,
+    winrm_exceptions.WinRMOperationTimeoutError,
+    requests.ConnectionError,
+    requests.Timeout,
+    socket.error,
+)
+
+
+def _is_shell_not_found(exc):
+    """Check if the error is a fault for a shell not found on the server."""
+    if getattr(exc, "wsman_fault_code", None) == WSMAN_SHELL_NOT_FOUND:
+        return True
+    # The older pywinrm versions give only the response of the fault.
+    try:
+        response = exc.response_text
+    except (AttributeError, IndexError):
+        return False
+    return str(WSMAN_SHELL_NOT_FOUND) in (response or "")
 
 
 def _encode(data):
@@ -45,160 +318,405 @@ def _encode(data):
     return encoded
 
 
-def _base64_read_file(filepath, size=8192):
-    with open(filepath, 'rb') as stream:
-        reader = functools.partial(stream.read, size)
-        for data in iter(reader, b''):
-            encoded = _encode(data)
-            yield encoded
+def _get_size(stream):
+    """Get the number of bytes from the current position to the end."""
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell() - position
+    stream.seek(position)
+    return size
 
 
-class WinRemoteClient(base.BaseClient):
-    """Get a remote client to a Windows instance.
+def _compress(stream):
+    """Gzip compress the content of the stream in a temporary file.
 
-    :param hostname: The IP where the client should be connected.
-    :param username: The username of the client.
-    :param password: The password of the remote client.
-    :param transport_protocol:
-        The transport for the WinRM protocol. Only HTTP and HTTPS makes
-        sense.
-    :param cert_pem:
-        Client authentication certificate file path in PEM format.
-    :param cert_key:
-        Client authentication certificate key file path in PEM format.
+    Return the temporary file, positioned at its beginning, and the
+    checksum of the uncompressed content.
     """
-    def __init__(self, hostname, username, password,
-                 transport_protocol='http',
-                 cert_pem=None, cert_key=None):
-        super(WinRemoteClient, self).__init__(hostname, username, password,
-                                              cert_pem, cert_key)
-        self._hostname = "{protocol}://{hostname}:{port}/wsman".format(
-            protocol=transport_protocol,
-            hostname=hostname,
-            port=5985 if transport_protocol == 'http' else 5986)
-        self.manager = get_windows_action_manager(self)
+    checksum = hashlib.sha256()
+    compressed = tempfile.TemporaryFile()
+    with gzip.GzipFile(fileobj=compressed, mode="wb") as gzip_file:
+        for chunk in iter(functools.partial(stream.read, 64 * 1024), b""):
+            checksum.update(chunk)
+            gzip_file.write(chunk)
+    compressed.seek(0)
+    return compressed, checksum.hexdigest()
 
-    @staticmethod
-    def _run_command(protocol_client, shell_id, command,
-                     command_type=util.POWERSHELL):
-        command_id = None
-        bare_command = command
 
-        command = util.get_command(command, command_type)
+class _FileRange(object):
+    """A read-only view over a range of bytes from a file."""
 
-        try:
-            command_id = protocol_client.run_command(shell_id, command)
-            stdout, stderr, exit_code = protocol_client.get_command_output(
-                shell_id, command_id)
-            if exit_code:
-                output = "\n\n".join([out for out in (stdout, stderr) if out])
-                raise exceptions.ArgusError(
-                    "Executing command {command!r} with encoded Command"
-                    "{encoded_command!r} failed with exit code {exit_code!r}"
-                    " and output {output!r}."
-                    .format(command=bare_command,
-                            encoded_command=command,
-                            exit_code=exit_code,
-                            output=output))
+    def __init__(self, stream, offset, length):
+        self._stream = stream
+        self._offset = offset
+        self._length = length
+        self._stream.seek(offset)
 
-            return util.sanitize_command_output(stdout), stderr, exit_code
-        finally:
-            protocol_client.cleanup_command(shell_id, command_id)
+    def tell(self):
+        return self._stream.tell() - self._offset
 
-    def _run_commands(self, commands, commands_type=util.POWERSHELL):
-        protocol_client = self._get_protocol()
-        shell_id = protocol_client.open_shell(codepage=CODEPAGE_UTF8)
+    def seek(self, position, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            position += self.tell()
+        elif whence == os.SEEK_END:
+            position += self._length
+        self._stream.seek(self._offset + min(max(position, 0), self._length))
+
+    def read(self, size=-1):
+        remaining = self._length - self.tell()
+        if size < 0 or size > remaining:
+            size = remaining
+        return self._stream.read(size)
+
+
+def _join_preview(head, tail, omitted):
+    if not omitted:
+        return head + tail
+    marker = "\n[... {} bytes omitted ...]\n".format(omitted)
+    return head + marker.encode() + tail
+
+
+def _get_error_output(stdout, stderr):
+    """Get the previews of the captured output and errors of a command."""
+    return "\n\n".join([
+        util.sanitize_command_output(capture.preview(ERROR_OUTPUT_PREVIEW))
+        for capture in (stdout, stderr) if capture.size])
+
+
+def _get_output_function(protocol_client):
+    """Get the function returning the next output of a command."""
+    get_output = getattr(protocol_client, "get_command_output_raw", None)
+    if get_output is None:
+        # Older pywinrm versions.
+        get_output = protocol_client._raw_get_command_output
+    return get_output
+
+
+@contextlib.contextmanager
+def _operation_timeout(protocol_client, timeout):
+    """Use another operation timeout for the requests of the protocol.
+
+    The read timeout is changed too, keeping its margin over
+    the operation timeout.
+    """
+    if timeout is None:
+        yield
+        return
+    transport = protocol_client.transport
+    saved = protocol_client.operation_timeout_sec, transport.read_timeout_sec
+    protocol_client.operation_timeout_sec = timeout
+    transport.read_timeout_sec = timeout + saved[1] - saved[0]
+    try:
+        yield
+    finally:
+        protocol_client.operation_timeout_sec, transport.read_timeout_sec = (
+            saved)
+
+
+class _OutputCapture(object):
+    """An output stream of a command, captured in bounded memory.
+
+    Up to `limit` bytes are kept in memory, a bigger output being
+    spooled to a temporary file.
+    """
+
+    def __init__(self, limit):
+        self._file = tempfile.SpooledTemporaryFile(max_size=limit)
+        self.size = 0
+
+    def write(self, data):
+        self._file.write(data)
+        self.size += len(data)
+
+    def preview(self, size):
+        """Get the output, keeping only its first and last `size` bytes."""
+        self._file.seek(0)
+        if self.size <= 2 * size:
+            return self._file.read()
+        head = self._file.read(size)
+        self._file.seek(self.size - size)
+        return _join_preview(head, self._file.read(size),
+                             self.size - 2 * size)
+
+    def getvalue(self):
+        """Get the whole output, read back from the disk if spooled."""
+        self._file.seek(0)
+        return self._file.read()
+
+    def close(self):
+        self._file.close()
+
+
+def _decode_text(data):
+    """Decode the content of a text file, using its byte order mark."""
+    for bom, encoding in ((codecs.BOM_UTF8, "utf-8"),
+                          (codecs.BOM_UTF16_LE, "utf-16-le"),
+                          (codecs.BOM_UTF16_BE, "utf-16-be")):
+        if data.startswith(bom):
+            return data[len(bom):].decode(encoding, "replace")
+    return data.decode("utf-8", "replace")
+
+
+def _call_with_retry(policy, func, *args):
+    """Call the function until it succeeds, according to the policy."""
+    state = policy.start()
+    while True:
         try:
-            results = [self._run_command(protocol_client, shell_id, command,
-                                         command_type=commands_type)
-                       for command in commands]
-        finally:
-            protocol_client.close_shell(shell_id)
-        return results
+            return func(*args)
+        except Exception as exc:  # pylint: disable=broad-except
+            delay = state.next_delay() if policy.is_retryable(exc) else None
+            if delay is None:
+                raise
+            LOG.debug("Retrying in %.1f seconds after %r.", delay, exc)
+            time.sleep(delay)
 
-    def _get_protocol(self):
-        protocol.Protocol.DEFAULT_TIMEOUT = "PT3600S"
-        return protocol.Protocol(endpoint=self._hostname,
-                                 transport='plaintext',
-                                 username=self._username,
-                                 password=self._password,
-                                 server_cert_validation='ignore',
-                                 cert_pem=self._cert_pem,
-                                 cert_key_pem=self._cert_key)
 
-    def run_remote_cmd(self, cmd, command_type=util.POWERSHELL):
-        """Run the given remote command.
+def _quote(value):
+    """Quote the given value as a PowerShell string literal."""
+    return "'{}'".format(value.replace("'", "''"))
 
-        The command will be executed on the remote underlying server.
-        It will return a tuple of three elements, stdout, stderr
-        and the return code of the command.
-        """
-        return self._run_commands([cmd], command_type)[0]
 
-    def copy_file(self, filepath, remote_destination):
-        """Copy the given file-path in the remote destination.
+class _LineSplitter(object):
+    """Split the chunks of a stream into decoded lines."""
 
-        The remote destination is the file name where the content
-        of file-path will be written.
-        """
+    def __init__(self, callback):
+        self._callback = callback
+        self._pending = b""
 
-        # TODO(cpopa): This powershell dance is a little complicated,
-        # find a simpler way to send a file over a remote server,
-        # without relying on OpenStack infra.
-        get_string_cmd = ("[System.Text.Encoding]::UTF8.GetString("
-                          "[System.Convert]::FromBase64String('{}'))")
-        commands = []
-        for command in _base64_read_file(filepath):
-            remote_command = (
-                r'powershell "{content}" >> "{remote_destination}"'
-                .format(content=get_string_cmd.format(command),
-                        remote_destination=remote_destination))
-
-            commands.append(remote_command)
-        # NOTE(mmicu): If the command would be POWERSHELL type
-        #              it will get over the 8191 char limit.
-        self._run_commands(commands, commands_type=util.CMD)
+    def feed(self, chunk):
+        lines = (self._pending + chunk).split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._emit(line)
 
-    def write_file(self, data, remote_destination):
-        """Copy the given data in the remote destination.
+    def flush(self):
+        if self._pending:
+            self._emit(self._pending)
+            self._pending = b""
 
-        The remote destination is the file name where the content
-        of file-path will be written.
+    def _emit(self, line):
+        self._callback(line.rstrip(b"\r").decode("utf-8", "replace"))
+
+
+class BaseWindowsClient(base.BaseClient):
+    """The part of the Windows clients independent of their transport.
+
+    The subclasses run the commands over their transport, with
+    :meth:`run_remote_cmd` and :meth:`_iter_command_output`, and
+    they run the commands given to :meth:`submit` and :meth:`map`
+    concurrently, with :meth:`_run_concurrently`.
+    The results of the commands marked as cacheable are reused until
+    they expire or until :meth:`invalidate_cache` is called.
+    """
+
+    def __init__(self, hostname, username, password, cert_pem=None,
+                 cert_key=None):
+        super(BaseWindowsClient, self).__init__(hostname, username, password,
+                                                cert_pem, cert_key)
+        self._result_cache = cache.ResultCache()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _iter_command_output(self, cmd, command_type):
+        """Yield the output chunks of the command, then its exit code.
+
+        The exit code is yielded as the chunk of a ``None`` stream.
         """
-        # TODO(mmicu): This powershell dance is a little complicated,
-        # find a simpler way to send a file over a remote server,
-        # without relying on OpenStack infra.
-        get_string_cmd = ("[System.Text.Encoding]::UTF8.GetString("
-                          "[System.Convert]::FromBase64String('{}'))")
-        commands = []
-        data = StringIO.StringIO(data)
-        data.seek(0)
-        content = data.read(1024)
-        while content:
-            remote_command = (
-                "{content} >> '{remote_destination}'"
-                .format(content=get_string_cmd.format(_encode(content)),
-                        remote_destination=remote_destination))
-
-            commands.append(remote_command)
-            content = data.read(1024)
-        self._run_commands(commands, commands_type=util.POWERSHELL)
 
-    def read_file(self, filepath):
-        """Get the content of the given file."""
-        cmd = 'Get-Content "{}"'.format(filepath)
-        return (self.run_command_with_retry(
-            cmd, command_type=util.POWERSHELL)[0])
+    @abc.abstractmethod
+    def _download(self, remote_path, stream):
+        """Write the content of the remote file in the given stream."""
+
+    @abc.abstractmethod
+    def _get_max_workers(self):
+        """Get how many submitted commands can run at the same time."""
+
+    @abc.abstractmethod
+    def _run_concurrently(self, cmd, command_type):
+        """Run a submitted command, concurrently with the other ones."""
 
-    def run_command(self, cmd, command_type=util.POWERSHELL):
+    def close(self):
+        """Wait for the submitted commands and release the resources."""
+        self._shutdown_executor()
+
+    def run_command(self, cmd, command_type=util.POWERSHELL,
+                    cacheable=False):
         """Run the given command and return execution details.
 
+        :param cacheable:
+            The command is idempotent and it doesn't change the
+            instance, so its result can be cached.
         :rtype: tuple
         :returns: stdout, stderr, exit_code
         """
-
+        if cacheable:
+            return self._result_cache.get(
+                (cmd, command_type),
+                functools.partial(self.run_remote_cmd, cmd,
+                                  command_type=command_type))
         return self.run_remote_cmd(cmd, command_type=command_type)
 
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                max_workers = self._get_max_workers()
+                LOG.debug("Running up to %d submitted commands at once.",
+                          max_workers)
+                self._executor = futures.ThreadPoolExecutor(max_workers)
+            return self._executor
+
+    def _shutdown_executor(self):
+        """Wait for the submitted commands and stop running new ones."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def submit(self, cmd, command_type=util.POWERSHELL, cacheable=False):
+        """Run the command concurrently with the other submitted ones.
+
+        The command shouldn't depend on the commands run at the
+        same time, since their order isn't defined.
+
+        :param cacheable:
+            The command is idempotent and it doesn't change the
+            instance, so its result can be cached.
+        :returns:
+            A future of the stdout, stderr and exit code of the command.
+        """
+        func = functools.partial(self._run_concurrently, cmd, command_type)
+        if cacheable:
+            func = functools.partial(self._result_cache.get,
+                                     (cmd, command_type), func)
+        return self._get_executor().submit(func)
+
+    def map(self, commands, command_type=util.POWERSHELL, cacheable=False):
+        """Run independent commands concurrently, returning their results.
+
+        The results are returned in the order of the commands. If a
+        command fails, the ones not started yet are cancelled and the
+        error of the first failed command is raised.
+        """
+        pending = [self.submit(command, command_type, cacheable)
+                   for command in commands]
+        try:
+            return [future.result() for future in pending]
+        except Exception:
+            for future in pending:
+                future.cancel()
+            raise
+
+    def invalidate_cache(self):
+        """Forget the cached results of the commands.
+
+        This should be called whenever the instance changes in a way
+        which affects them, after installing something or after
+        a reboot, for instance.
+        """
+        self._result_cache.invalidate()
+
+    def iter_command_output(self, cmd, command_type=util.POWERSHELL):
+        """Run the given command, yielding its output as it arrives.
+
+        The items are tuples of the stream name, :data:`STDOUT` or
+        :data:`STDERR`, and a chunk of bytes from that stream.
+        If the command fails, `ArgusError` is raised after all its
+        output was yielded. Closing the generator early stops the
+        remote command.
+        """
+        for name, chunk in self._iter_command_output(cmd, command_type):
+            if name is None:
+                if chunk:
+                    raise exceptions.ArgusError(
+                        "Executing command {!r} failed with exit code {!r}."
+                        .format(cmd, chunk))
+                return
+            yield name, chunk
+
+    def _capture_command(self, cmd, command_type, capture_limit):
+        """Run the command, capturing its output in bounded memory.
+
+        This is :meth:`run_remote_cmd` for the transports
+        streaming the output of the commands.
+        """
+        captures = {STDOUT: _OutputCapture(capture_limit),
+                    STDERR: _OutputCapture(capture_limit)}
+        try:
+            for name, chunk in self._iter_command_output(cmd, command_type):
+                if name is None:
+                    exit_code = chunk
+                    break
+                captures[name].write(chunk)
+
+            if exit_code:
+                raise exceptions.ArgusError(
+                    "Executing command {command!r} failed with exit code "
+                    "{exit_code!r} and output {output!r}."
+                    .format(command=cmd, exit_code=exit_code,
+                            output=_get_error_output(captures[STDOUT],
+                                                     captures[STDERR])))
+
+            return (util.sanitize_command_output(captures[STDOUT].getvalue()),
+                    captures[STDERR].getvalue(), exit_code)
+        finally:
+            for capture in captures.values():
+                capture.close()
+
+    def stream_command(self, cmd, command_type=util.POWERSHELL,
+                       on_line=None, spool=None):
+        """Run the given command, handling its output line by line.
+
+        The output isn't kept in memory, except for its last lines.
+
+        :param on_line:
+            A callable receiving the stream name and each line of
+            the output, as soon as it arrives. It can raise an
+            exception to stop the command early.
+        :param spool:
+            The name of a file from the output directory, to which
+            the output is appended as it arrives.
+        :returns:
+            The last lines of the standard output.
+        """
+        tails = {STDOUT: collections.deque(maxlen=STREAM_TAIL_LINES),
+                 STDERR: collections.deque(maxlen=STREAM_TAIL_LINES)}
+        splitters = {}
+        for name, tail in tails.items():
+            def _on_line(line, name=name, tail=tail):
+                tail.append(line)
+                if on_line:
+                    on_line(name, line)
+            splitters[name] = _LineSplitter(_on_line)
+
+        output = self._iter_command_output(cmd, command_type)
+        with contextlib.closing(output), self._open_spool(spool) as spool:
+            for name, chunk in output:
+                if name is None:
+                    exit_code = chunk
+                    break
+                spool.write(chunk)
+                splitters[name].feed(chunk)
+        for splitter in splitters.values():
+            splitter.flush()
+
+        if exit_code:
+            raise exceptions.ArgusError(
+                "Executing command {!r} failed with exit code {!r} and "
+                "the last output lines {!r}."
+                .format(cmd, exit_code,
+                        "\n".join(list(tails[STDOUT]) + list(tails[STDERR]))))
+        return "\n".join(tails[STDOUT])
+
+    @staticmethod
+    def _open_spool(name):
+        """Open the file with the given name from the output directory."""
+        if not name or not CONFIG.argus.output_directory:
+            return open(os.devnull, "wb")
+        path = os.path.join(CONFIG.argus.output_directory, name)
+        LOG.info("Saving the command output to %s.", path)
+        return open(path, "ab")
+
     def run_command_verbose(self, cmd, command_type=util.POWERSHELL):
         """Run the given command and log anything it returns.
 
@@ -216,7 +734,8 @@ class WinRemoteClient(base.BaseClient):
 
     def run_command_with_retry(self, cmd, count=util.RETRY_COUNT,
                                delay=util.RETRY_DELAY,
-                               command_type=util.POWERSHELL):
+                               command_type=util.POWERSHELL,
+                               policy=None, cacheable=False):
         """Run the given `cmd` until succeeds.
 
         :param cmd:
@@ -227,56 +746,93 @@ class WinRemoteClient(base.BaseClient):
             If the value is ``None``, then the function will retry *forever*.
         :param delay:
             The number of seconds to sleep when retrying a command.
+        :param policy:
+            A :class:`argus.util.RetryPolicy`, which replaces
+            `count` and `delay` when given.
+        :param cacheable:
+            The result of the command can be cached,
+            see :meth:`run_command`.
 
         :rtype: tuple
         :returns: stdout, stderr, exit_code
         """
+        policy = policy or util.RetryPolicy.from_count(count, delay)
+        for _ in policy:
+            try:
+                return self.run_command(cmd, command_type=command_type,
+                                        cacheable=cacheable)
+            except Exception as exc:  # pylint: disable=broad-except
+                if not policy.is_retryable(exc):
+                    raise
+                LOG.debug("Command failed with %r.", exc)
+
+        raise exceptions.ArgusTimeoutError(
+            "Command {!r} failed too many times.".format(cmd))
 
-        # Countdown normalization.
-        if not count or count < 0:
-            count = 0
+    def stream_command_with_retry(self, cmd, command_type=util.POWERSHELL,
+                                  on_line=None, spool=None, policy=None):
+        """Stream the given `cmd` until it succeeds.
 
-        while True:
+        Each attempt runs the command again from the start, see
+        :meth:`stream_command` for the parameters.
+
+        :param policy:
+            A :class:`argus.util.RetryPolicy`, the same as the default
+            one of :meth:`run_command_with_retry` if not given.
+        """
+        policy = policy or util.RetryPolicy.from_count()
+        for _ in policy:
             try:
-                return self.run_command(cmd, command_type=command_type)
+                return self.stream_command(cmd, command_type=command_type,
+                                           on_line=on_line, spool=spool)
             except Exception as exc:  # pylint: disable=broad-except
-                LOG.debug("Command failed with %r.", exc)
-                # A negative `count` means no count at all.
-                if count >= 0:
-                    count -= 1
-                if count == 0:
-                    raise exceptions.ArgusTimeoutError(
-                        "Command {!r} failed too many times."
-                        .format(cmd))
-                LOG.debug("Retrying...")
-                time.sleep(delay)
+                if not policy.is_retryable(exc):
+                    raise
+                LOG.debug("Streaming the command failed with %r.", exc)
+
+        raise exceptions.ArgusTimeoutError(
+            "Command {!r} failed too many times.".format(cmd))
 
     def run_command_until_condition(self, cmd, cond,
                                     retry_count=util.RETRY_COUNT,
                                     delay=util.RETRY_DELAY,
-                                    command_type=util.POWERSHELL):
+                                    command_type=util.POWERSHELL,
+                                    policy=None, remote_condition=None):
         """Run the given `cmd` until a condition `cond` occurs.
 
         :param cond:
             A callable which receives the standard output returned by
             executing the command. It should return a boolean value,
             which tells to this function to stop execution.
+        :param policy:
+            A :class:`argus.util.RetryPolicy`, which replaces
+            `retry_count` and `delay` when given.
+        :param remote_condition:
+            A PowerShell expression equivalent to `cond`, which can
+            refer to the output of the command as ``$output``.
+            When given, the PowerShell `cmd` is polled on the instance
+            until the expression holds, using a single request.
         :raises:
             `ArgusCLIError` if there is output found in the standard error.
 
         This method uses and behaves like `run_command_with_retry` but
         with an additional condition parameter.
         """
+        if policy is None:
+            # The command is tried once more than the number of retries.
+            policy = util.RetryPolicy(count=max(retry_count or 0, 0) + 1,
+                                      delay=delay)
 
-        # countdown normalization
-        if not retry_count or retry_count < 0:
-            retry_count = 0
+        if remote_condition is not None:
+            return self._wait_remotely(cmd, cond, remote_condition, policy)
 
-        while True:
+        for _ in policy:
             try:
                 stdout, stderr, exit_code = self.run_command(
                     cmd, command_type=command_type)
             except Exception as exc:  # pylint: disable=broad-except
+                if not policy.is_retryable(exc):
+                    raise
                 LOG.debug("Command failed with %r.", exc)
             else:
                 if stderr and exit_code:
@@ -289,11 +845,770 @@ class WinRemoteClient(base.BaseClient):
                 else:
                     LOG.debug("Condition not met, retrying...")
 
-            if retry_count > 0:
-                retry_count -= 1
-                LOG.debug("Retrying...")
-                time.sleep(delay)
+        raise exceptions.ArgusTimeoutError(
+            "Command {!r} failed too many times.".format(cmd))
+
+    @staticmethod
+    def _get_wait_timeout(policy):
+        """Get how long a retry policy would keep polling, in seconds."""
+        if policy.timeout is not None:
+            return policy.timeout
+        if policy.count is None:
+            return REMOTE_WAIT_TIMEOUT
+        return sum(policy.get_delay(retry)
+                   for retry in range(1, policy.count))
+
+    def _wait_remotely(self, cmd, cond, remote_condition, policy):
+        """Wait on the instance until the remote condition holds.
+
+        The waiting is restarted, for the time left, if the request
+        fails with an error accepted by the policy, for instance
+        when the instance reboots.
+        """
+        timeout = self._get_wait_timeout(policy)
+        deadline = time.time() + timeout
+        requests_policy = util.RetryPolicy(delay=policy.delay,
+                                           timeout=timeout,
+                                           retry_on=policy.retry_on)
+        for _ in requests_policy:
+            remaining = max(deadline - time.time(), 0)
+            script = _WAIT_SCRIPT.format(
+                command=cmd, condition=remote_condition,
+                timeout="{:.3f}".format(remaining),
+                interval=int(REMOTE_POLL_INTERVAL * 1000))
+            try:
+                stdout, _, _ = self.run_command(script)
+            except Exception as exc:  # pylint: disable=broad-except
+                if not policy.is_retryable(exc):
+                    raise
+                LOG.debug("Waiting failed with %r.", exc)
+                continue
+
+            met, _, output = stdout.partition("\n")
+            if met.strip() != "True":
+                break
+            if cond(output.strip()):
+                return
+            LOG.debug("The remote condition %r doesn't match the local "
+                      "one for %r.", remote_condition, output)
+
+        raise exceptions.ArgusTimeoutError(
+            "Condition {!r} not met in time for command {!r}."
+            .format(remote_condition, cmd))
+
+    def read_file(self, filepath):
+        """Get the content of the given text file."""
+        stream = io.BytesIO()
+        self._download(filepath, stream)
+        return _decode_text(stream.getvalue()).strip()
+
+    def upload_cached(self, filepath, remote_destination=None):
+        """Upload the given file, unless the instance already has it.
+
+        The content of the file is identified by its checksum. If the
+        remote destination already has the same content, nothing will
+        be transferred, otherwise the file is uploaded. Without a
+        remote destination, the file is stored in the upload cache
+        directory of the instance, under a name given by its checksum.
+
+        :returns: The remote path of the file.
+        """
+        checksum = hashlib.sha256()
+        with open(filepath, 'rb') as stream:
+            for chunk in iter(functools.partial(stream.read, 64 * 1024), b""):
+                checksum.update(chunk)
+        checksum = checksum.hexdigest()
+
+        if remote_destination is None:
+            _, extension = os.path.splitext(filepath)
+            remote_destination = ntpath.join(UPLOAD_CACHE_DIRECTORY,
+                                             checksum + extension)
+
+        script = _CACHE_CHECK_SCRIPT.format(path=_quote(remote_destination),
+                                            checksum=checksum)
+        stdout, _, _ = self.run_command_with_retry(
+            script, command_type=util.POWERSHELL)
+        if stdout == "True":
+            LOG.debug("%s is already uploaded to %s.", filepath,
+                      remote_destination)
+        else:
+            self.copy_file(filepath, remote_destination)
+        return remote_destination
+
+
+class WinRemoteClient(BaseWindowsClient):
+    """Get a remote client to a Windows instance.
+
+    :param hostname: The IP where the client should be connected.
+    :param username: The username of the client.
+    :param password: The password of the remote client.
+    :param transport_protocol:
+        The transport for the WinRM protocol. Only HTTP and HTTPS makes
+        sense.
+    :param port:
+        The port of the WinRM service, the default one of the
+        transport if it's not given.
+    :param cert_pem:
+        Client authentication certificate file path in PEM format.
+    :param cert_key:
+        Client authentication certificate key file path in PEM format.
+    :param shell_idle_timeout:
+        The number of seconds a remote shell can stay unused before
+        being reopened.
+    :param operation_timeout:
+        The number of seconds a WS-Management operation can take
+        on the server side. The requests receiving the output of
+        the commands already timed use a timeout tuned for them.
+    :param read_timeout:
+        The number of seconds to wait for an HTTP response.
+    :param use_runspace:
+        Run the PowerShell commands and scripts in a single PowerShell
+        process, kept running on the instance, instead of starting
+        a new one for each of them.
+    :param timings:
+        The :class:`argus.client.timing.CommandTimings` recording the
+        durations of the commands, used for tuning the operation
+        timeout of the requests receiving their output. The timings
+        shared by all the clients are used by default.
+    :param capture_limit:
+        The number of bytes of the output of a command kept in memory
+        while it runs, the rest being spooled to disk. The errors show
+        only the beginning and the end of the output.
+    :param max_parallel_shells:
+        The maximum number of shells running the commands given to
+        :meth:`submit` and :meth:`map` concurrently. Less are used
+        if the WinRM service doesn't allow so many.
+
+    The client keeps a single remote shell opened for all the commands
+    it runs. The shell is discarded when it fails or when it was unused
+    for more than `shell_idle_timeout` seconds, a new one being opened
+    for the next command. The same goes for the PowerShell runspace.
+    Call :meth:`close` for releasing them.
+    The independent commands given to :meth:`submit` and :meth:`map`
+    are run concurrently, on a pool of other shells.
+    The results of the commands marked as cacheable are reused until
+    they expire or until :meth:`invalidate_cache` is called.
+    The HTTP connections are kept alive and shared with all the
+    other clients connected to the same endpoint, the new HTTPS
+    connections resuming the TLS sessions of the previous ones.
+    """
+    def __init__(self, hostname, username, password,
+                 transport_protocol='http',
+                 cert_pem=None, cert_key=None,
+                 shell_idle_timeout=SHELL_IDLE_TIMEOUT,
+                 operation_timeout=OPERATION_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, use_runspace=False,
+                 port=None, capture_limit=OUTPUT_CAPTURE_LIMIT,
+                 timings=None, max_parallel_shells=MAX_PARALLEL_SHELLS):
+        super(WinRemoteClient, self).__init__(hostname, username, password,
+                                              cert_pem, cert_key)
+        self._hostname = "{protocol}://{hostname}:{port}/wsman".format(
+            protocol=transport_protocol,
+            hostname=hostname,
+            port=port or (5985 if transport_protocol == 'http' else 5986))
+        self._shell_idle_timeout = shell_idle_timeout
+        self._operation_timeout = operation_timeout
+        self._read_timeout = read_timeout
+        self._protocol = None
+        self._shell_id = None
+        self._shell_last_used = None
+        self._use_runspace = use_runspace
+        self._capture_limit = capture_limit
+        self.timings = timings or timing.COMMAND_TIMINGS
+        self._runspace = None
+        self._runspace_last_used = None
+        self._max_parallel_shells = max_parallel_shells
+        self._shell_pool = shell_pool.ShellPool(
+            self._open_worker_shell, self._close_worker_shell,
+            shell_idle_timeout, discard_errors=_SHELL_ERRORS)
+        self._lock = threading.RLock()
+        self.manager = get_windows_action_manager(self)
+
+    @staticmethod
+    def _run_command(protocol_client, shell_id, command,
+                     command_type=util.POWERSHELL,
+                     capture_limit=OUTPUT_CAPTURE_LIMIT,
+                     operation_timeout=None):
+        command_id = None
+        bare_command = command
+
+        command = util.get_command(command, command_type)
+        get_output = _get_output_function(protocol_client)
+        stdout, stderr = (_OutputCapture(capture_limit),
+                          _OutputCapture(capture_limit))
+
+        try:
+            command_id = protocol_client.run_command(shell_id, command)
+            done = False
+            with _operation_timeout(protocol_client, operation_timeout):
+                while not done:
+                    try:
+                        out, err, exit_code, done = get_output(shell_id,
+                                                               command_id)
+                    except winrm_exceptions.WinRMOperationTimeoutError:
+                        # No output yet, keep waiting for it.
+                        continue
+                    stdout.write(out)
+                    stderr.write(err)
+
+            if exit_code:
+                raise exceptions.ArgusError(
+                    "Executing command {command!r} with encoded Command"
+                    "{encoded_command!r} failed with exit code {exit_code!r}"
+                    " and output {output!r}."
+                    .format(command=bare_command,
+                            encoded_command=command,
+                            exit_code=exit_code,
+                            output=_get_error_output(stdout, stderr)))
+
+            return (util.sanitize_command_output(stdout.getvalue()),
+                    stderr.getvalue(), exit_code)
+        finally:
+            stdout.close()
+            stderr.close()
+            if command_id is not None:
+                protocol_client.cleanup_command(shell_id, command_id)
+
+    def _shell_expired(self):
+        idle_time = time.time() - self._shell_last_used
+        return idle_time > self._shell_idle_timeout
+
+    def _get_shell(self):
+        """Get the protocol and the ID of an usable remote shell.
+
+        The current shell is reused, unless it was idle for too long,
+        in which case it will be replaced with a new one.
+        """
+        if self._shell_id is not None and self._shell_expired():
+            LOG.debug("The remote shell %s expired, reopening it.",
+                      self._shell_id)
+            self._close_shell()
+
+        if self._shell_id is None:
+            if self._protocol is None:
+                self._protocol = self._get_protocol()
+            self._shell_id = self._protocol.open_shell(codepage=CODEPAGE_UTF8)
+            self._shell_last_used = time.time()
+        return self._protocol, self._shell_id
+
+    def _close_shell(self):
+        """Close and forget the current shell, ignoring any error."""
+        protocol_client, shell_id = self._protocol, self._shell_id
+        self._protocol = None
+        self._shell_id = None
+        self._shell_last_used = None
+        if shell_id is not None:
+            self._close_worker_shell((protocol_client, shell_id))
+
+    def close(self):
+        """Close the remote shells used by this client, if any."""
+        self._shutdown_executor()
+        self._shell_pool.close()
+        with self._lock:
+            self._close_shell()
+            self._close_runspace()
+
+    def _close_runspace(self):
+        runspace_client, self._runspace = self._runspace, None
+        if runspace_client is not None:
+            runspace_client.close()
+
+    def _get_runspace(self):
+        """Get the PowerShell runspace, starting it if needed."""
+        if self._runspace is not None:
+            idle_time = time.time() - self._runspace_last_used
+            if idle_time > self._shell_idle_timeout:
+                LOG.debug("The PowerShell runspace expired, restarting it.")
+                self._close_runspace()
+
+        if self._runspace is None:
+            runspace_client = runspace.PowerShellRunspace(
+                self._open_worker_shell())
+            try:
+                runspace_client.open()
+            except Exception:
+                runspace_client.close()
+                raise
+            self._runspace = runspace_client
+        return self._runspace
+
+    def _run_in_runspace(self, command, command_type):
+        stdout, stderr = (_OutputCapture(self._capture_limit),
+                          _OutputCapture(self._capture_limit))
+        try:
+            with self._lock:
+                runspace_client = self._get_runspace()
+                try:
+                    exit_code = runspace_client.run(
+                        runspace.get_script(command, command_type),
+                        stdout, stderr)
+                except (exceptions.ArgusError, ) + _SHELL_ERRORS:
+                    # The runspace will be restarted for the next command.
+                    LOG.debug("Discarding the PowerShell runspace.")
+                    self._close_runspace()
+                    raise
+                self._runspace_last_used = time.time()
+
+            if exit_code:
+                raise exceptions.ArgusError(
+                    "Executing command {command!r} in the PowerShell "
+                    "runspace failed with exit code {exit_code!r} and "
+                    "output {output!r}."
+                    .format(command=command, exit_code=exit_code,
+                            output=_get_error_output(stdout, stderr)))
+
+            return (util.sanitize_command_output(stdout.getvalue()),
+                    stderr.getvalue(), exit_code)
+        finally:
+            stdout.close()
+            stderr.close()
+
+    @contextlib.contextmanager
+    def _shell(self):
+        """Use the remote shell, discarding it if it becomes unusable.
+
+        The shell is used by a single thread at a time.
+        """
+        with self._lock:
+            protocol_client, shell_id = self._get_shell()
+            try:
+                yield protocol_client, shell_id
+            except _SHELL_ERRORS:
+                # The shell will be reopened for the next command.
+                LOG.debug("Discarding the remote shell %s.", shell_id)
+                self._close_shell()
+                raise
+            finally:
+                if self._shell_id is not None:
+                    self._shell_last_used = time.time()
+
+    def _get_operation_timeout(self, key):
+        """Get the operation timeout for receiving the output of a command."""
+        return self.timings.get_operation_timeout(key,
+                                                  self._operation_timeout)
+
+    def _run_in_shell(self, shell, command, command_type):
+        """Run the command in the given shell, measuring its duration."""
+        protocol_client, shell_id = shell
+        key = timing.get_command_key(command, command_type)
+        with self.timings.measure(key):
+            return self._run_command(
+                protocol_client, shell_id, command,
+                command_type=command_type,
+                capture_limit=self._capture_limit,
+                operation_timeout=self._get_operation_timeout(key))
+
+    def _run_commands(self, commands, commands_type=util.POWERSHELL):
+        results = []
+        for command in commands:
+            in_runspace = commands_type in runspace.RUNSPACE_COMMAND_TYPES
+            if self._use_runspace and in_runspace:
+                key = timing.get_command_key(command, commands_type)
+                with self.timings.measure(key):
+                    results.append(self._run_in_runspace(command,
+                                                         commands_type))
+                continue
+            try:
+                with self._shell() as shell:
+                    result = self._run_in_shell(shell, command,
+                                                commands_type)
+            except _SHELL_ERRORS as exc:
+                if not _is_shell_not_found(exc):
+                    raise
+                LOG.debug("The remote shell was not found, running the "
+                          "command again in a new one.")
+                with self._shell() as shell:
+                    result = self._run_in_shell(shell, command,
+                                                commands_type)
+            results.append(result)
+        return results
+
+    def _get_protocol(self):
+        protocol_client = protocol.Protocol(
+            endpoint=self._hostname,
+            transport='certificate' if self._cert_pem else 'plaintext',
+            username=self._username,
+            password=self._password,
+            server_cert_validation='ignore',
+            cert_pem=self._cert_pem,
+            cert_key_pem=self._cert_key,
+            read_timeout_sec=self._read_timeout,
+            operation_timeout_sec=self._operation_timeout)
+        session = protocol_client.transport.build_session()
+        pool.ENDPOINT_POOL.mount(session, self._hostname)
+        return protocol_client
+
+    def run_remote_cmd(self, cmd, command_type=util.POWERSHELL):
+        """Run the given remote command.
+
+        The command will be executed on the remote underlying server.
+        It will return a tuple of three elements, stdout, stderr
+        and the return code of the command.
+        """
+        return self._run_commands([cmd], command_type)[0]
+
+    @util.cached_property
+    def _max_envelope_size(self):
+        """The maximum size in bytes of a SOAP request for the server."""
+        cmd = r"(Get-Item WSMan:\localhost\MaxEnvelopeSizekb).Value"
+        try:
+            stdout, _, _ = self.run_command(cmd)
+            return int(stdout) * 1024
+        except (exceptions.ArgusError, ValueError) as exc:
+            LOG.debug("Could not get the maximum envelope size: %r", exc)
+            return DEFAULT_MAX_ENVELOPE_SIZE
+
+    @util.cached_property
+    def _parallel_shells(self):
+        """The number of shells which can run commands concurrently.
+
+        Each command takes a shell and an operation, for receiving
+        its output, so they're bounded by the maximum number of shells
+        and of concurrent operations allowed for a user.
+        """
+        cmd = (r"(Get-Item WSMan:\localhost\Shell\MaxShellsPerUser).Value;"
+               r" (Get-Item WSMan:\localhost\Service"
+               r"\MaxConcurrentOperationsPerUser).Value")
+        try:
+            stdout, _, _ = self.run_command(cmd)
+            max_shells, max_operations = (int(value)
+                                          for value in stdout.split())
+        except (exceptions.ArgusError, ValueError) as exc:
+            LOG.debug("Could not get the limits of the WinRM service: %r",
+                      exc)
+            max_shells = DEFAULT_MAX_SHELLS_PER_USER
+            max_operations = DEFAULT_MAX_OPERATIONS_PER_USER
+        return max(min(self._max_parallel_shells,
+                       max_shells - RESERVED_SHELLS,
+                       max_operations - RESERVED_SHELLS), 1)
+
+    def _get_upload_chunk_size(self):
+        """Get how many bytes can be sent with a single Send request.
+
+        Each chunk is base64 encoded into a line of text, which is
+        base64 encoded again into the body of the Send request.
+        """
+        line_size = (self._max_envelope_size - ENVELOPE_OVERHEAD) * 3 // 4
+        return max((line_size - 2) * 3 // 4 // 3 * 3, 3)
+
+    def _send_upload(self, payload, script, shell=None):
+        """Send the payload to the remote process started by the script.
+
+        The script is executed in the given shell, a tuple of a
+        protocol and a shell ID, or in the shell of the client.
+        Return the output of the script, the number of bytes sent and
+        their checksum.
+        """
+        if shell is None:
+            with self._shell() as shell:
+                return self._send_upload(payload, script, shell)
+
+        protocol_client, shell_id = shell
+        command = util.get_command(script, util.POWERSHELL)
+        chunk_size = self._get_upload_chunk_size()
+        checksum = hashlib.sha256()
+        sent = 0
+
+        command_id = protocol_client.run_command(shell_id, command)
+        try:
+            chunk = payload.read(chunk_size)
+            while True:
+                next_chunk = payload.read(chunk_size)
+                checksum.update(chunk)
+                sent += len(chunk)
+                protocol_client.send_command_input(
+                    shell_id, command_id, _encode(chunk) + "\r\n",
+                    end=not next_chunk)
+                if not next_chunk:
+                    break
+                chunk = next_chunk
+
+            stdout, stderr, exit_code = protocol_client.get_command_output(
+                shell_id, command_id)
+        finally:
+            protocol_client.cleanup_command(shell_id, command_id)
+
+        if exit_code:
+            raise exceptions.ArgusError(
+                "Executing the upload script failed with exit code {!r} "
+                "and output {!r}.".format(
+                    exit_code, util.sanitize_command_output(stderr)))
+        return util.sanitize_command_output(stdout), sent, checksum
+
+    def _upload(self, stream, remote_destination, append=False,
+                compress=None, shell=None):
+        """Write the content of a stream in the remote destination.
+
+        The content is sent through the standard input of a single
+        remote process, which decodes it into the remote destination
+        and returns the checksum of the written bytes, compared to
+        the checksum of the sent content.
+
+        :param compress:
+            If True, the content is sent gzip compressed and it is
+            decompressed on the instance. If None, the content is
+            compressed only if it is big enough and it compresses well.
+        :param shell:
+            A tuple of a protocol and a shell ID used for the upload,
+            instead of the shell of the client.
+        """
+        start = stream.tell()
+        size = _get_size(stream)
+
+        payload, checksum = stream, None
+        if compress or (compress is None and size >= COMPRESSION_MIN_SIZE):
+            compressed, checksum = _compress(stream)
+            if compress or _get_size(compressed) <= size * COMPRESSION_RATIO:
+                payload = compressed
             else:
-                raise exceptions.ArgusTimeoutError(
-                    "Command {!r} failed too many times."
-                    .format(cmd))
+                compressed.close()
+                stream.seek(start)
+                checksum = None
+
+        script = _UPLOAD_SCRIPT.format(
+            path=_quote(remote_destination),
+            mode="Append" if append else "Create",
+            compressed="$true" if payload is not stream else "$false")
+        try:
+            remote_checksum, sent, sent_checksum = self._send_upload(
+                payload, script, shell)
+        finally:
+            if payload is not stream:
+                payload.close()
+
+        checksum = checksum or sent_checksum.hexdigest()
+        if remote_checksum.lower() != checksum:
+            raise exceptions.ArgusError(
+                "Checksum mismatch for {!r}: expected {}, got {!r}."
+                .format(remote_destination, checksum, remote_checksum))
+        if payload is stream:
+            LOG.debug("Uploaded %d bytes to %s.", sent, remote_destination)
+        else:
+            LOG.debug("Uploaded %d bytes to %s, compressed to %d bytes, "
+                      "%d bytes saved.", size, remote_destination, sent,
+                      size - sent)
+
+    def _open_worker_shell(self):
+        """Open a new shell, separated from the shell of the client."""
+        protocol_client = self._get_protocol()
+        return protocol_client, protocol_client.open_shell(
+            codepage=CODEPAGE_UTF8)
+
+    @staticmethod
+    def _close_worker_shell(shell):
+        protocol_client, shell_id = shell
+        try:
+            protocol_client.close_shell(shell_id)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOG.debug("Closing the remote shell %s failed with %r.",
+                      shell_id, exc)
+
+    def _upload_part(self, filepath, offset, length, remote_destination,
+                     policy=None):
+        """Upload a range of the given file using a shell of the pool.
+
+        The part is uploaded again, in another shell if the one used
+        became unusable, until it succeeds or the `policy` gives up.
+        """
+        policy = policy or util.RetryPolicy.from_count()
+        for _ in policy:
+            try:
+                with self._shell_pool.shell() as shell:
+                    with open(filepath, 'rb') as stream:
+                        self._upload(_FileRange(stream, offset, length),
+                                     remote_destination, shell=shell)
+                return
+            except Exception as exc:  # pylint: disable=broad-except
+                if not policy.is_retryable(exc):
+                    raise
+                LOG.debug("Uploading the part %s failed with %r.",
+                          remote_destination, exc)
+
+        raise exceptions.ArgusTimeoutError(
+            "Uploading the part {!r} failed too many times."
+            .format(remote_destination))
+
+    def _upload_parallel(self, filepath, remote_destination, parts):
+        """Upload the file in parts, concurrently, over the pooled shells.
+
+        The parts are written in separate remote files, which are
+        joined in the remote destination after all of them were
+        uploaded. The checksum of the resulting file is compared
+        to the one of the local file.
+        """
+        size = os.path.getsize(filepath)
+        part_size = -(-size // parts)
+        # Find out the chunk size before the workers need it.
+        self._get_upload_chunk_size()
+        ranges = [(offset, min(part_size, size - offset))
+                  for offset in range(0, size, part_size)]
+        part_paths = ["{}.part{}".format(remote_destination, index)
+                      for index in range(len(ranges))]
+        LOG.debug("Uploading %s to %s in %d parts.", filepath,
+                  remote_destination, len(ranges))
+
+        errors = []
+
+        def _worker(part_path, offset, length):
+            try:
+                self._upload_part(filepath, offset, length, part_path)
+            except Exception as exc:  # pylint: disable=broad-except
+                errors.append(exc)
+
+        workers = [threading.Thread(target=_worker,
+                                    args=(part_path, offset, length))
+                   for part_path, (offset, length) in zip(part_paths, ranges)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        script = _JOIN_SCRIPT.format(
+            path=_quote(remote_destination),
+            parts=", ".join(_quote(part_path) for part_path in part_paths),
+            join="$false" if errors else "$true")
+        stdout, _, _ = self.run_command_with_retry(
+            script, command_type=util.POWERSHELL)
+        if errors:
+            raise exceptions.ArgusError(
+                "Uploading {!r} in parts failed with {!r}."
+                .format(filepath, errors[0]))
+
+        checksum = hashlib.sha256()
+        with open(filepath, 'rb') as stream:
+            for chunk in iter(functools.partial(stream.read, 64 * 1024), b""):
+                checksum.update(chunk)
+        if stdout.lower() != checksum.hexdigest():
+            raise exceptions.ArgusError(
+                "Checksum mismatch for {!r}: expected {}, got {!r}."
+                .format(remote_destination, checksum.hexdigest(), stdout))
+
+    def copy_file(self, filepath, remote_destination):
+        """Copy the given file-path in the remote destination.
+
+        The remote destination is the file name where the content
+        of file-path will be written. If it already exists, it will
+        be overwritten. Big files are uploaded in parts, concurrently,
+        using the shells of the pool.
+        """
+        parts = os.path.getsize(filepath) // PARALLEL_UPLOAD_PART_SIZE
+        if parts > 1:
+            parts = min(parts, self._parallel_shells)
+        if parts > 1:
+            self._upload_parallel(filepath, remote_destination, parts)
+            return
+
+        with open(filepath, 'rb') as stream:
+            self._upload(stream, remote_destination)
+
+    def write_file(self, data, remote_destination):
+        """Copy the given data in the remote destination.
+
+        The remote destination is the file name where the content
+        of file-path will be written. The data is appended to it,
+        followed by a new line.
+        """
+        if isinstance(data, six.text_type):
+            data = data.encode("utf-8")
+        self._upload(io.BytesIO(data + b"\r\n"), remote_destination,
+                     append=True)
+
+    def _get_file_info(self, remote_path):
+        script = _FILE_INFO_SCRIPT.format(path=_quote(remote_path))
+        stdout, _, _ = self.run_command(script)
+        size, checksum = stdout.split()
+        return int(size), checksum.lower()
+
+    def _read_range(self, remote_path, offset, length):
+        script = _READ_RANGE_SCRIPT.format(path=_quote(remote_path),
+                                           offset=offset, length=length)
+        stdout, _, _ = self.run_command(script)
+        data = base64.b64decode(stdout)
+        if len(data) != length:
+            raise exceptions.ArgusError(
+                "Expected {} bytes at offset {} of {!r}, got {}."
+                .format(length, offset, remote_path, len(data)))
+        return data
+
+    def _download(self, remote_path, stream, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                  policy=None):
+        """Write the content of the remote file in the given stream.
+
+        See :meth:`download_file` for the details.
+        """
+        policy = policy or util.RetryPolicy.from_count()
+        size, remote_checksum = _call_with_retry(
+            policy, self._get_file_info, remote_path)
+
+        checksum = hashlib.sha256()
+        offset = 0
+        while offset < size:
+            length = min(chunk_size, size - offset)
+            data = _call_with_retry(policy, self._read_range,
+                                    remote_path, offset, length)
+            stream.write(data)
+            checksum.update(data)
+            offset += length
+
+        if checksum.hexdigest() != remote_checksum:
+            raise exceptions.ArgusError(
+                "Checksum mismatch for {!r}: expected {}, got {}."
+                .format(remote_path, remote_checksum, checksum.hexdigest()))
+        LOG.debug("Downloaded %d bytes from %s.", size, remote_path)
+        return size
+
+    def download_file(self, remote_path, local_path,
+                      chunk_size=DOWNLOAD_CHUNK_SIZE, policy=None):
+        """Download the remote file in the local path.
+
+        The file is read in ranges of `chunk_size` bytes, sent base64
+        encoded and written to the local file as they are received.
+        Each range is retried according to the policy, so a failure
+        resumes the download from the last range received. The checksum
+        of the downloaded content is compared with the one of the remote
+        file. Only the bytes the file had when the download started are
+        downloaded, even if it grows in the meantime, like the logs.
+
+        :param chunk_size:
+            The number of bytes read from the remote file at once.
+        :param policy:
+            A :class:`argus.util.RetryPolicy` for reading each chunk.
+        :returns: The number of bytes downloaded.
+        """
+        with open(local_path, "wb") as stream:
+            return self._download(remote_path, stream, chunk_size, policy)
+
+    def _get_max_workers(self):
+        return self._parallel_shells
+
+    def _run_concurrently(self, cmd, command_type):
+        """Run the command in a shell of the pool of shells."""
+        with self._shell_pool.shell() as shell:
+            return self._run_in_shell(shell, cmd, command_type)
+
+    def _iter_command_output(self, cmd, command_type):
+        key = timing.get_command_key(cmd, command_type)
+        with self._shell() as (protocol_client, shell_id):
+            get_output = _get_output_function(protocol_client)
+            operation_timeout = self._get_operation_timeout(key)
+            with self.timings.measure(key):
+                command_id = protocol_client.run_command(
+                    shell_id, util.get_command(cmd, command_type))
+                try:
+                    done = False
+                    while not done:
+                        try:
+                            with _operation_timeout(protocol_client,
+                                                    operation_timeout):
+                                stdout, stderr, exit_code, done = get_output(
+                                    shell_id, command_id)
+                        except winrm_exceptions.WinRMOperationTimeoutError:
+                            # No output yet, keep waiting for it.
+                            continue
+                        if stdout:
+                            yield STDOUT, stdout
+                        if stderr:
+                            yield STDERR, stderr
+                finally:
+                    protocol_client.cleanup_command(shell_id, command_id)
+        yield None, exit_code
@@ -62,6 +62,43 @@ class ArgusOptions(conf_base.Options):
                             "checkout, clone or fetch a modified version of "
                             "Cloudbase-init, for replacing the present code "
                             "used by it."),
+            cfg.BoolOpt("powershell_runspace", default=False,
+                        help="Run the PowerShell commands and scripts in a "
+                             "single PowerShell process kept running on the "
+                             "instance, instead of starting a new one for "
+                             "each of them."),
+            cfg.IntOpt("output_capture_limit", default=4 * 1024 * 1024,
+                       help="The number of bytes of the output of a remote "
+                            "command kept in memory while it runs, the "
+                            "rest being spooled to disk."),
+            cfg.StrOpt("remote_transport", default="winrm",
+                       choices=["winrm", "ssh"],
+                       help="The transport used for running the commands "
+                            "on the Windows instances, WinRM or SSH. The "
+                            "instances need an SSH service for the latter, "
+                            "like Win32-OpenSSH, using cmd.exe as shell."),
+            cfg.StrOpt("facts_file", default=None,
+                       help="A JSON file keeping the facts which depend "
+                            "only on the image and on the Cloudbase-Init "
+                            "installer, like the OS version and the "
+                            "installation directory, across the runs. "
+                            "The known facts are only checked on the "
+                            "instances. If it isn't given, the facts are "
+                            "kept in the output directory, if there's one."),
+            cfg.BoolOpt("resource_server", default=False,
+                        help="Serve the resources to the instances from an "
+                             "HTTP server started on this machine, instead "
+                             "of downloading them from the location given "
+                             "by the resources option."),
+            cfg.IntOpt("resource_server_port", default=0,
+                       help="The port of the resource server, any free "
+                            "one if it's 0. The instances must be able "
+                            "to reach it."),
+            cfg.StrOpt("resource_server_address", default=None,
+                       help="The address of this machine used by the "
+                            "instances for reaching the resource server, "
+                            "the IP address of its default route if it "
+                            "isn't given."),
         ]
 
     def register(self):
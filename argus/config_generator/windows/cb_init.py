@@ -43,7 +43,7 @@ class BasePopulatedCBInitConfig(base.BaseWindowsConfig):
         self.conf.set(section, name, value)
 
     def _execute(self, cmd, count=util.RETRY_COUNT, delay=util.RETRY_DELAY,
-                 command_type=None):
+                 command_type=None, cacheable=False):
         """Execute until success and return only the standard output
 
         A positive exit code will trigger the failure
@@ -52,11 +52,13 @@ class BasePopulatedCBInitConfig(base.BaseWindowsConfig):
         will be raised.
         """
         return self._client.run_command_with_retry(
-            cmd, count=count, delay=delay, command_type=command_type)[0]
+            cmd, count=count, delay=delay, command_type=command_type,
+            cacheable=cacheable)[0]
 
     def _config_specific_paths(self):
         """Populate the ConfigParser object with instance specific values."""
-        cbinit_dir = introspect.get_cbinit_dir(self._execute)
+        cbinit_dir = introspect.get_cbinit_dir(
+            self._execute, self._client.manager.os_fingerprint)
 
         self.set_conf_value("bsdtar_path",
                             ntpath.join(cbinit_dir, r'bin\bsdtar.exe'))
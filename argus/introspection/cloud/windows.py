@@ -15,18 +15,17 @@
 
 
 import collections
-import contextlib
+import functools
+import json
 import ntpath
-import os
 import re
-import shutil
-import tempfile
 
 import six
 
 from argus import config as argus_config
 from argus import exceptions
 from argus.introspection.cloud import base
+from argus.introspection import facts
 from argus import util
 
 CONFIG = argus_config.CONFIG
@@ -39,26 +38,51 @@ NIC_KEYS = ["mac", "address", "gateway", "netmask", "dns", "dhcp"]
 Address = collections.namedtuple("Address", ["v4", "v6"])
 NICDetails = collections.namedtuple("NICDetails", NIC_KEYS)
 Interface = collections.namedtuple('Interface', ['name', 'mtu'])
-
-
-@contextlib.contextmanager
-def _create_tempdir():
-    tempdir = tempfile.mkdtemp(prefix="cloudbaseinit-ci-tests")
-    try:
-        yield tempdir
-    finally:
-        shutil.rmtree(tempdir)
-
-
-@contextlib.contextmanager
-def _create_tempfile(content=None):
-    with _create_tempdir() as temp:
-        file_desc, path = tempfile.mkstemp(dir=temp)
-        os.close(file_desc)
-        if content:
-            with open(path, 'w') as stream:
-                stream.write(content)
-        yield path
+OS_FINGERPRINT_FIELDS = ["major", "minor", "product_type", "nano_server",
+                         "architecture", "program_files", "program_files_x86",
+                         "powershell_version"]
+OSFingerprint = collections.namedtuple("OSFingerprint", OS_FINGERPRINT_FIELDS)
+
+# Prints the facts identifying the OS of the instance as a JSON object,
+# built by hand since ConvertTo-Json is missing from PowerShell 2.0.
+_OS_FINGERPRINT_SCRIPT = r"""
+$ErrorActionPreference = "Stop"
+function ConvertTo-JsonValue($value) {
+    if ($value -eq $null) { return "null" }
+    if ($value -is [bool]) { return $value.ToString().ToLower() }
+    if ($value -is [int]) { return $value.ToString() }
+    $text = ([string]$value).Replace('\', '\\').Replace('"', '\"')
+    return '"' + $text + '"'
+}
+$version = [System.Environment]::OSVersion.Version
+if (Get-Command Get-CimInstance -ErrorAction SilentlyContinue) {
+    $os = Get-CimInstance -Class Win32_OperatingSystem
+} else {
+    $os = Get-WmiObject -Class Win32_OperatingSystem
+}
+$levels = ("HKLM:\Software\Microsoft\Windows NT\CurrentVersion\Server\" +
+           "ServerLevels")
+$nano = (Test-Path $levels) -and ((Get-ItemProperty $levels).NanoServer -eq 1)
+$facts = @(
+    @("major", $version.Major),
+    @("minor", $version.Minor),
+    @("product_type", [int]$os.ProductType),
+    @("nano_server", [bool]$nano),
+    @("architecture", $ENV:PROCESSOR_ARCHITECTURE),
+    @("program_files", $ENV:ProgramFiles),
+    @("program_files_x86", ${ENV:ProgramFiles(x86)}),
+    @("powershell_version", $PSVersionTable.PSVersion.ToString())
+)
+$items = foreach ($fact in $facts) {
+    '"{0}": {1}' -f $fact[0], (ConvertTo-JsonValue $fact[1])
+}
+"{" + ($items -join ", ") + "}"
+"""
+# Prints the major and minor versions of the OS and its architecture,
+# for checking a known OS fingerprint.
+_OS_CHECK_SCRIPT = ('$version = [System.Environment]::OSVersion.Version; '
+                    '"{0} {1} {2}" -f $version.Major, $version.Minor, '
+                    '$ENV:PROCESSOR_ARCHITECTURE')
 
 
 def _get_ntp_peers(output):
@@ -129,26 +153,99 @@ def _get_nic_details(details):
     return NICDetails(**nic_details)
 
 
-def get_cbinit_dir(execute_function):
-    """Get the location of Cloudbase-Init from the instance."""
-    stdout = execute_function(
-        '$ENV:PROCESSOR_ARCHITECTURE', command_type=util.POWERSHELL)
-    architecture = stdout.strip()
+def _path_exists(execute_function, path, path_type="Any"):
+    status = execute_function(
+        'Test-Path -PathType {} "{}"'.format(path_type, escape_path(path)),
+        command_type=util.POWERSHELL, cacheable=True)
+    return status.strip().lower() == "true"
+
+
+def _probe_os_fingerprint(client):
+    stdout, _, _ = client.run_command_with_retry(
+        _OS_FINGERPRINT_SCRIPT, command_type=util.POWERSHELL, cacheable=True)
+    try:
+        return json.loads(stdout)
+    except ValueError:
+        raise exceptions.ArgusError(
+            "Invalid OS fingerprint {!r}.".format(stdout))
+
+
+def _check_os_fingerprint(client, fingerprint):
+    stdout, _, _ = client.run_command_with_retry(
+        _OS_CHECK_SCRIPT, command_type=util.POWERSHELL, cacheable=True)
+    expected = [fingerprint.get("major"), fingerprint.get("minor"),
+                fingerprint.get("architecture")]
+    return stdout.split() == [six.text_type(value) for value in expected]
+
 
-    locations = [execute_function('powershell "$ENV:ProgramFiles"',
-                                  command_type=util.CMD)]
-    if architecture == 'AMD64':
-        location = execute_function(
-            'powershell "${ENV:ProgramFiles(x86)}"',
-            command_type=util.CMD)
-        locations.append(location)
+def get_os_fingerprint(client):
+    """Get the facts identifying the OS of the instance, with one command.
+
+    The command is retried until the instance answers, and its result
+    is cached by the client. When the facts of the image are stored,
+    a cheaper command only checks the known fingerprint.
+
+    :rtype: OSFingerprint
+    """
+    image_facts = facts.get_image_facts()
+    if image_facts is None:
+        fingerprint = _probe_os_fingerprint(client)
+    else:
+        fingerprint = image_facts.lookup(
+            "os_fingerprint",
+            functools.partial(_probe_os_fingerprint, client),
+            functools.partial(_check_os_fingerprint, client))
+    return OSFingerprint(*[fingerprint.get(field)
+                           for field in OS_FINGERPRINT_FIELDS])
+
+
+def get_cbinit_dir(execute_function, fingerprint=None):
+    """Get the location of Cloudbase-Init from the instance.
+
+    When the facts of the image are stored, the known location
+    is only checked.
+
+    :param fingerprint:
+        The :class:`OSFingerprint` of the instance, if known, which
+        gives the locations of the program files.
+    """
+    image_facts = facts.get_image_facts()
+    if image_facts is None:
+        return _find_cbinit_dir(execute_function, fingerprint)
+    return image_facts.lookup(
+        "cbinit_dir",
+        functools.partial(_find_cbinit_dir, execute_function, fingerprint),
+        functools.partial(_path_exists, execute_function,
+                          path_type="Container"))
+
+
+def _find_cbinit_dir(execute_function, fingerprint):
+    if fingerprint is not None:
+        architecture = fingerprint.architecture
+        locations = [fingerprint.program_files]
+        if architecture == 'AMD64':
+            locations.append(fingerprint.program_files_x86)
+    else:
+        stdout = execute_function(
+            '$ENV:PROCESSOR_ARCHITECTURE', command_type=util.POWERSHELL,
+            cacheable=True)
+        architecture = stdout.strip()
+
+        locations = [execute_function('powershell "$ENV:ProgramFiles"',
+                                      command_type=util.CMD, cacheable=True)]
+        if architecture == 'AMD64':
+            location = execute_function(
+                'powershell "${ENV:ProgramFiles(x86)}"',
+                command_type=util.CMD, cacheable=True)
+            locations.append(location)
 
     for location in locations:
         location = location.strip()
         _location = escape_path(location)
         status = execute_function(
             'Test-Path "{}\\Cloudbase` Solutions"'.format(
-                _location), command_type=util.POWERSHELL).strip().lower()
+                _location), command_type=util.POWERSHELL,
+            cacheable=True).strip().lower()
 
         if status == "true":
             return ntpath.join(
@@ -173,12 +270,27 @@ def set_config_option(option, value, execute_function):
     execute_function(cmd, command_type=util.POWERSHELL)
 
 
-def get_python_dir(execute_function):
-    """Find python directory from the Cloudbase-Init installation."""
-    cbinit_dir = get_cbinit_dir(execute_function)
+def get_python_dir(execute_function, fingerprint=None):
+    """Find python directory from the Cloudbase-Init installation.
+
+    When the facts of the image are stored, the known directory
+    is only checked.
+    """
+    image_facts = facts.get_image_facts()
+    if image_facts is None:
+        return _find_python_dir(execute_function, fingerprint)
+    return image_facts.lookup(
+        "python_dir",
+        functools.partial(_find_python_dir, execute_function, fingerprint),
+        lambda python_dir: _path_exists(
+            execute_function, ntpath.join(python_dir, "python.exe"), "Leaf"))
+
+
+def _find_python_dir(execute_function, fingerprint):
+    cbinit_dir = get_cbinit_dir(execute_function, fingerprint)
     command = 'dir "{}" /b'.format(cbinit_dir)
-    stdout = execute_function(command,
-                              command_type=util.CMD).strip()
+    stdout = execute_function(command, command_type=util.CMD,
+                              cacheable=True).strip()
     names = list(filter(None, stdout.splitlines()))
     for name in names:
         if "python" in name.lower():
@@ -192,7 +304,8 @@ def get_cbinit_key(execute_function):
     key_x64 = ("HKLM:SOFTWARE\\Wow6432Node\\Cloudbase` Solutions\\"
                "Cloudbase-init")
     cmd = 'Test-Path {}'.format(key)
-    result = execute_function(cmd, command_type=util.POWERSHELL)
+    result = execute_function(cmd, command_type=util.POWERSHELL,
+                              cacheable=True)
     if result.strip().lower() == "true":
         return key
     return key_x64
@@ -206,7 +319,8 @@ def get_os_version(client, field):
     """
     cmd = "[System.Environment]::OSVersion.Version.{}".format(field)
     stdout, _, _ = client.run_command_with_retry(cmd,
-                                                 command_type=util.POWERSHELL)
+                                                 command_type=util.POWERSHELL,
+                                                 cacheable=True)
     return util.get_int_from_str(stdout.strip())
 
 
@@ -265,9 +379,7 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
             ".ssh", "authorized_keys")
 
     def get_instance_file_content(self, filepath):
-        cmd = '[io.file]::ReadAllText("%s")' % filepath
-        return self.remote_client.run_command_verbose(
-            cmd, command_type=util.POWERSHELL)
+        return self.remote_client.read_file(filepath)
 
     def get_userdata_executed_plugins(self):
         cmd = r'(Get-ChildItem -Path  C:\ *.txt).Count'
@@ -282,14 +394,11 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
         return parse_netsh_output(stdout)[0]
 
     def get_cloudbaseinit_traceback(self):
-        code = util.get_resource('windows/get_traceback.ps1')
-        remote_script = "C:\\{}.ps1".format(util.rand_name())
-        with _create_tempfile(content=code) as tmp:
-            self.remote_client.copy_file(tmp, remote_script)
-            stdout = self.remote_client.run_command_verbose(
-                remote_script,
-                command_type=util.POWERSHELL)
-            return stdout.strip()
+        remote_script = self.remote_client.upload_cached(
+            util.get_resource_path('windows/get_traceback.ps1'))
+        stdout = self.remote_client.run_command_verbose(
+            remote_script, command_type=util.POWERSHELL)
+        return stdout.strip()
 
     def _file_exist(self, filepath):
         stdout = self.remote_client.run_command_verbose(
@@ -339,9 +448,8 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
          Return a tuple of two elements, the major and the minor
          version.
         """
-        major_version = get_os_version(self.remote_client, 'Major')
-        minor_version = get_os_version(self.remote_client, 'Minor')
-        return (major_version, minor_version)
+        fingerprint = get_os_fingerprint(self.remote_client)
+        return (fingerprint.major, fingerprint.minor)
 
     def get_cloudconfig_executed_plugins(self):
         expected = {
@@ -349,11 +457,24 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
             'gzip', 'gzip_1',
             'gzip_base64', 'gzip_base64_1', 'gzip_base64_2'
         }
+        paths = [ntpath.join("C:\\", basefile)
+                 for basefile in sorted(expected)]
+        results = self.remote_client.manager.read_many(paths)
+        missing = [path for path, result in zip(paths, results)
+                   if result.content is None]
+        if missing:
+            raise exceptions.ArgusError(
+                "The cloud-config files {} are missing.".format(
+                    ", ".join(missing)))
+
         files = {}
-        for basefile in expected:
-            path = ntpath.join("C:\\", basefile)
-            content = self.get_instance_file_content(path)
-            files[basefile] = content.strip()
+        for path, result in zip(paths, results):
+            if result.truncated:
+                # Too big for the single read, so read it whole.
+                content = self.get_instance_file_content(path)
+            else:
+                content = result.content.decode("utf-8-sig")
+            files[ntpath.basename(path)] = content.strip()
         return files
 
     def get_timezone(self):
@@ -409,14 +530,12 @@ class InstanceIntrospection(base.CloudInstanceIntrospection):
         return nics
 
     def get_user_flags(self, user):
-        code = util.get_resource('windows/get_user_flags.ps1')
-        remote_script = "C:\\{}.ps1".format(util.rand_name())
-        with _create_tempfile(content=code) as tmp:
-            self.remote_client.copy_file(tmp, remote_script)
-            stdout = self.remote_client.run_command_verbose(
-                "{0} {1}".format(remote_script, user),
-                command_type=util.POWERSHELL_SCRIPT_BYPASS)
-            return stdout.strip()
+        remote_script = self.remote_client.upload_cached(
+            util.get_resource_path('windows/get_user_flags.ps1'))
+        stdout = self.remote_client.run_command_verbose(
+            "{0} {1}".format(remote_script, user),
+            command_type=util.POWERSHELL_SCRIPT_BYPASS)
+        return stdout.strip()
 
     def get_swap_status(self):
         """Get whether the swap memory is enabled or not.
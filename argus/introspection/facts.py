@@ -0,0 +1,158 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A persistent store of the facts depending only on the image."""
+
+import json
+import os
+import tempfile
+import threading
+
+from argus import config as argus_config
+from argus import util
+
+CONFIG = argus_config.CONFIG
+LOG = util.get_logger()
+
+# The name of the facts file in the output directory, used when
+# no facts file is configured.
+FACTS_FILE_NAME = "image_facts.json"
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_image_key():
+    """Get the key of the facts for the configured image and installer."""
+    return "{}/{}/{}".format(CONFIG.openstack.image_ref, CONFIG.argus.build,
+                             CONFIG.argus.arch)
+
+
+def get_facts_path():
+    """Get the path of the configured facts file, None if there's none."""
+    if CONFIG.argus.facts_file:
+        return CONFIG.argus.facts_file
+    if CONFIG.argus.output_directory:
+        return os.path.join(CONFIG.argus.output_directory, FACTS_FILE_NAME)
+    return None
+
+
+def get_image_facts():
+    """Get the facts of the configured image, None if they aren't stored."""
+    path = get_facts_path()
+    if path is None:
+        return None
+    with _STORES_LOCK:
+        store = _STORES.get(path)
+        if store is None:
+            store = _STORES[path] = FactsStore(path)
+    return store.get_facts(get_image_key())
+
+
+class FactsStore(object):
+    """Facts about the instances, kept in a JSON file across the runs.
+
+    The facts are grouped by a key identifying what they depend on,
+    like the image of the instances. The file is read again before
+    each change, so that multiple processes can share it, and it's
+    replaced atomically.
+
+    :param path: The path of the JSON file.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self._path) as stream:
+                return json.load(stream)
+        except (IOError, OSError):
+            return {}
+        except ValueError as exc:
+            LOG.warning("Ignoring the invalid facts file %s: %s",
+                        self._path, exc)
+            return {}
+
+    def _dump(self, facts):
+        directory = os.path.dirname(os.path.abspath(self._path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w") as stream:
+                json.dump(facts, stream, indent=2, sort_keys=True)
+            getattr(os, "replace", os.rename)(temp_path, self._path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def get(self, key, name):
+        """Get a fact, None if it isn't known."""
+        with self._lock:
+            return self._load().get(key, {}).get(name)
+
+    def set(self, key, name, value):
+        """Store a fact, replacing the previous value."""
+        with self._lock:
+            facts = self._load()
+            facts.setdefault(key, {})[name] = value
+            self._dump(facts)
+
+    def discard(self, key, name):
+        """Forget a fact, if it's known."""
+        with self._lock:
+            facts = self._load()
+            if facts.get(key, {}).pop(name, None) is not None:
+                self._dump(facts)
+
+    def get_facts(self, key):
+        """Get the facts grouped under the given key."""
+        return ImageFacts(self, key)
+
+
+class ImageFacts(object):
+    """The facts grouped under a key of a :class:`FactsStore`."""
+
+    def __init__(self, store, key):
+        self._store = store
+        self._key = key
+
+    def lookup(self, name, compute, check):
+        """Get a fact, computing it if it isn't known or if it's stale.
+
+        A known value which doesn't hold for the instance is kept
+        until another one is found, since the instance may not have
+        it yet, like a directory created by the installer.
+
+        :param compute:
+            A function finding the value of the fact on the instance,
+            which raises or returns None when it's not found.
+        :param check:
+            A function checking if the known value still holds for
+            the instance, which should be cheaper than `compute`.
+        """
+        known = self._store.get(self._key, name)
+        if known is not None and check(known):
+            return known
+
+        value = compute()
+        if value is not None and value != known:
+            if known is not None:
+                LOG.info("The known %s of the image %s is stale, %r.",
+                         name, self._key, known)
+            self._store.set(self._key, name, value)
+        return value
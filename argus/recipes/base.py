@@ -48,7 +48,7 @@ class BaseRecipe(object):
         self._backend = backend
 
     def _execute(self, cmd, count=RETRY_COUNT, delay=RETRY_DELAY,
-                 command_type=None):
+                 command_type=None, policy=None, cacheable=False):
         """Execute until success and return only the standard output."""
 
         # A positive exit code will trigger the failure
@@ -56,14 +56,16 @@ class BaseRecipe(object):
         # Also, if the retrying limit is reached, `ArgusTimeoutError`
         # will be raised.
         return self._backend.remote_client.run_command_with_retry(
-            cmd, count=count, delay=delay, command_type=command_type)[0]
+            cmd, count=count, delay=delay, command_type=command_type,
+            policy=policy, cacheable=cacheable)[0]
 
     def _execute_until_condition(self, cmd, cond, count=RETRY_COUNT,
-                                 delay=RETRY_DELAY, command_type=None):
+                                 delay=RETRY_DELAY, command_type=None,
+                                 policy=None):
         """Execute a command until the condition is met without returning."""
         self._backend.remote_client.run_command_until_condition(
             cmd, cond, retry_count=count,
-            delay=delay, command_type=command_type)
+            delay=delay, command_type=command_type, policy=policy)
 
     @abc.abstractmethod
     def prepare(self, **kwargs):
@@ -40,6 +40,11 @@ _CBINIT_TARGET_LOCATION = r"C:\cloudbaseinit"
 class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
     """Recipe for preparing a Windows instance."""
 
+    @property
+    def _os_fingerprint(self):
+        """The OS fingerprint of the instance, found by its client."""
+        return self._backend.remote_client.manager.os_fingerprint
+
     def wait_for_boot_completion(self):
         LOG.info("Waiting for first boot completion...")
         self._backend.remote_client.manager.wait_boot_completion()
@@ -78,7 +83,8 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
     def install_cbinit(self):
         """Proceed on checking if Cloudbase-Init should be installed."""
         try:
-            introspection.get_cbinit_dir(self._execute)
+            introspection.get_cbinit_dir(self._execute,
+                                         self._os_fingerprint)
         except exceptions.ArgusError:
             self._backend.remote_client.manager.install_cbinit()
             self._grab_cbinit_installation_log()
@@ -96,13 +102,12 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
                         "the log will not be grabbed.")
             return
 
-        content = self._backend.remote_client.read_file("C:\\installation.log")
         log_template = "installation-{}.log".format(
             self._backend.instance_server()['id'])
 
         path = os.path.join(CONFIG.argus.output_directory, log_template)
-        with open(path, 'w') as stream:
-            stream.write(content)
+        self._backend.remote_client.download_file("C:\\installation.log",
+                                                  path)
 
     def replace_install(self):
         """Replace the Cloudbase-Init installed files with the downloaded ones.
@@ -121,6 +126,9 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
         if link.startswith("\\\\"):
             cmd = 'copy "{}" "C:\\install.zip"'.format(link)
             self._execute(cmd, command_type=util.CMD)
+        elif os.path.isfile(link):
+            # A bundle built locally, upload it directly.
+            self._backend.remote_client.copy_file(link, r'C:\install.zip')
         else:
             location = r'C:\install.zip'
             self._backend.remote_client.manager.download(
@@ -134,7 +142,8 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
         self._execute(cmd, command_type=util.POWERSHELL)
 
         LOG.debug("Replace old files with the new ones.")
-        cbdir = introspection.get_cbinit_dir(self._execute)
+        cbdir = introspection.get_cbinit_dir(self._execute,
+                                             self._os_fingerprint)
         self._execute('xcopy /y /e /q "C:\\install"'
                       ' "{}"'.format(cbdir), command_type=util.CMD)
 
@@ -153,7 +162,8 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
 
         LOG.debug("Getting Cloudbase-Init location...")
         # Get Cloudbase-Init python location.
-        python_dir = introspection.get_python_dir(self._execute)
+        python_dir = introspection.get_python_dir(self._execute,
+                                                  self._os_fingerprint)
 
         # Remove everything from the Cloudbase-Init installation.
         LOG.debug("Recursively removing Cloudbase-Init...")
@@ -198,7 +208,8 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
         # monitoring the service, because on some OSes, just checking
         # if the service is stopped leads to errors, due to the
         # fact that the service starts later on.
-        python_dir = introspection.get_python_dir(self._execute)
+        python_dir = introspection.get_python_dir(self._execute,
+                                                  self._os_fingerprint)
         cbinit = ntpath.join(python_dir, 'Lib', 'site-packages',
                              'cloudbaseinit')
 
@@ -266,7 +277,8 @@ class CloudbaseinitRecipe(base.BaseCloudbaseinitRecipe):
 
     def inject_cbinit_config(self):
         """Inject the Cloudbase-Init config in the right place."""
-        cbinit_dir = introspection.get_cbinit_dir(self._execute)
+        cbinit_dir = introspection.get_cbinit_dir(self._execute,
+                                                  self._os_fingerprint)
 
         conf_dir = ntpath.join(cbinit_dir, "conf")
         needed_directories = [
@@ -475,7 +487,8 @@ class CloudbaseinitImageRecipe(CloudbaseinitRecipe):
     """Calibrate already sys-prepared Cloudbase-Init images."""
 
     def wait_cbinit_finalization(self):
-        cbdir = introspection.get_cbinit_dir(self._execute)
+        cbdir = introspection.get_cbinit_dir(self._execute,
+                                             self._os_fingerprint)
         paths = [ntpath.join(cbdir, "log", name)
                  for name in ["cloudbase-init-unattend.log",
                               "cloudbase-init.log"]]
@@ -0,0 +1,194 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""An HTTP server on the runner, serving the resources to the instances.
+
+The instances download the resources of argus, like the installation
+scripts, from the URL given by :func:`get_resources_url`. When the
+resource server is enabled, that's the URL of a server started on
+first use, which serves the ``argus/resources`` directory, instead of
+the remote location given by the ``resources`` config option.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+import warnings
+
+import cherrypy
+from cherrypy.lib import static
+from six.moves import queue
+
+from argus import config as argus_config
+from argus import exceptions
+from argus import util
+
+CONFIG = argus_config.CONFIG
+LOG = util.get_logger()
+
+# The URL path where the resources are served.
+SCRIPT_NAME = "/resources"
+
+# The number of threads serving the requests of the instances.
+THREAD_POOL = 16
+
+# The number of seconds waited for the server to start listening.
+START_TIMEOUT = 30
+
+_SERVER = None
+_SERVER_LOCK = threading.Lock()
+
+
+def get_resources_directory():
+    """Get the local directory with the resources of argus."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "resources")
+
+
+def _get_etag(path):
+    """Get an entity tag of a file, changing along with the file."""
+    stat = os.stat(path)
+    return '"{:x}-{:x}"'.format(int(stat.st_mtime * 10 ** 6), stat.st_size)
+
+
+class ResourceApp(object):
+    """Serve the files of a directory, with entity tags and ranges."""
+
+    def __init__(self, root):
+        self._root = os.path.abspath(root)
+
+    @cherrypy.expose
+    def default(self, *parts):
+        path = os.path.abspath(os.path.join(self._root, *parts))
+        if (not path.startswith(self._root + os.sep) or
+                not os.path.isfile(path)):
+            raise cherrypy.NotFound()
+
+        etag = _get_etag(path)
+        request = cherrypy.serving.request
+        # A partial response is sent only for the same version of
+        # the file, otherwise the whole file is sent.
+        if request.headers.get("If-Range", etag) != etag:
+            request.headers.pop("Range", None)
+        cherrypy.serving.response.headers["ETag"] = etag
+        return static.serve_file(path)
+
+
+def _serve(root, host, port, ports):
+    """Run the server, putting the port it listens on in `ports`."""
+    cherrypy.config.update({
+        "server.socket_host": host,
+        "server.socket_port": port,
+        "server.thread_pool": THREAD_POOL,
+        "engine.autoreload.on": False,
+        "checker.on": False,
+        "log.screen": False,
+    })
+    cherrypy.tree.mount(ResourceApp(root), SCRIPT_NAME,
+                        {"/": {"tools.etags.on": True}})
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        cherrypy.engine.start()
+    ports.put(cherrypy.server.bound_addr[1])
+    cherrypy.engine.block()
+
+
+class ResourceServer(object):
+    """An HTTP server of a directory, running in another process.
+
+    The files are served by a pool of threads, with entity tags and
+    support for the ``Range`` requests, so the downloads can be
+    validated and resumed.
+
+    :param root:
+        The directory which is served, the resources of argus
+        by default.
+    :param host:
+        The address the server listens on.
+    :param port:
+        The port the server listens on, any free one by default.
+    :param address:
+        The address of the server reached by the instances, the IP
+        address of this machine by default.
+    """
+
+    def __init__(self, root=None, host="0.0.0.0", port=0, address=None):
+        self._root = root or get_resources_directory()
+        self._host = host
+        self._port = port
+        self._address = address
+        self._process = None
+
+    @property
+    def url(self):
+        """The URL of the directory, ending with a slash."""
+        if self._process is None:
+            raise exceptions.ArgusError("The resource server isn't running.")
+        return "http://{}:{}{}/".format(
+            self._address or util.get_local_ip(), self._port, SCRIPT_NAME)
+
+    def start(self):
+        """Start the server, waiting for it to listen."""
+        ports = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_serve, args=(self._root, self._host, self._port, ports))
+        process.daemon = True
+        process.start()
+        try:
+            self._port = ports.get(timeout=START_TIMEOUT)
+        except queue.Empty:
+            process.terminate()
+            process.join()
+            raise exceptions.ArgusError(
+                "The resource server didn't start in {} seconds.".format(
+                    START_TIMEOUT))
+        self._process = process
+        LOG.info("Serving %s at %s", self._root, self.url)
+
+    def stop(self):
+        """Stop the server."""
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def get_resources_url():
+    """Get the URL of the resources, as downloaded by the instances.
+
+    The resource server is started when it's enabled and it isn't
+    running already, then it's kept until the process exits.
+    """
+    global _SERVER  # pylint: disable=global-statement
+    if not CONFIG.argus.resource_server:
+        return CONFIG.argus.resources
+
+    with _SERVER_LOCK:
+        if _SERVER is None:
+            server = ResourceServer(
+                port=CONFIG.argus.resource_server_port,
+                address=CONFIG.argus.resource_server_address)
+            server.start()
+            atexit.register(server.stop)
+            _SERVER = server
+    return _SERVER.url
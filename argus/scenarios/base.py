@@ -113,6 +113,12 @@ class BaseScenario(unittest.TestCase):
     This can be anything as long as the underlying back-end supports it.
     """
 
+    remote_transport = None
+    """The transport of the remote clients, ``winrm`` or ``ssh``.
+
+    The configured one is used when it's not given.
+    """
+
     availability_zone = None
     backend = None
     introspection = None
@@ -143,6 +149,8 @@ class BaseScenario(unittest.TestCase):
             cls.backend = cls.backend_type(cls.__name__,
                                            cls.userdata, cls.metadata,
                                            cls.availability_zone)
+            if cls.remote_transport:
+                cls.backend.remote_transport = cls.remote_transport
             cls.backend.setup_instance()
 
             cls.prepare_instance()
@@ -62,10 +62,11 @@ class BaseTestPassword(base.BaseTestCase):
         # Test that the proper password was set.
         remote_client = self._backend.get_remote_client(
             CONFIG.cloudbaseinit.created_user, password)
-
-        stdout = remote_client.run_command_verbose(
-            cmd, command_type=util.CMD)
-        return stdout
+        try:
+            return remote_client.run_command_verbose(
+                cmd, command_type=util.CMD)
+        finally:
+            remote_client.close()
 
     def is_password_set(self, password):
         stdout = self._run_remote_command("echo 1", password)
@@ -180,7 +181,10 @@ class TestCloudstackUpdatePasswordSmoke(base.BaseTestCase):
     def _wait_for_completion(self, password):
         remote_client = self._backend.get_remote_client(
             CONFIG.cloudbaseinit.created_user, password)
-        remote_client.manager.wait_cbinit_service()
+        try:
+            remote_client.manager.wait_cbinit_service()
+        finally:
+            remote_client.close()
 
     def _test_password(self, password, expected):
         # Set the password in the Password Server.
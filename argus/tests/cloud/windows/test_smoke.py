@@ -99,8 +99,11 @@ class TestSmoke(smoke.TestsBaseSmoke):
             CONFIG.openstack.image_username,
             CONFIG.openstack.image_password,
             protocol='https')
-        stdout = remote_client.run_command_verbose(
-            'echo 1', command_type=util.CMD)
+        try:
+            stdout = remote_client.run_command_verbose(
+                'echo 1', command_type=util.CMD)
+        finally:
+            remote_client.close()
         self.assertEqual('1', stdout.strip())
 
     @test_util.skip_unless_dnsmasq_configured
@@ -171,8 +174,11 @@ class TestCertificateWinRM(base.BaseTestCase):
             "argus.resources", "key.pem")
         client = self._backend.get_remote_client(cert_pem=cert_pem,
                                                  cert_key=cert_key)
-        stdout = client.run_command_verbose(
-            "echo 1", command_type=util.CMD)
+        try:
+            stdout = client.run_command_verbose(
+                "echo 1", command_type=util.CMD)
+        finally:
+            client.close()
         self.assertEqual(stdout.strip(), "1")
 
 
@@ -184,7 +190,10 @@ class TestNextLogonPassword(base.BaseTestCase):
         remote_client = self._backend.get_remote_client(
             CONFIG.openstack.image_username,
             CONFIG.openstack.image_password)
-        remote_client.manager.wait_boot_completion()
+        try:
+            remote_client.manager.wait_boot_completion()
+        finally:
+            remote_client.close()
 
     def test_next_logon_password_not_changed(self):
         self._wait_for_completion()
@@ -18,6 +18,7 @@
 # pylint: disable=no-value-for-parameter, too-many-lines, protected-access
 # pylint: disable=too-many-public-methods
 
+import itertools
 import unittest
 
 try:
@@ -30,6 +31,7 @@ import requests
 from six.moves import urllib_parse as urlparse
 
 from argus.action_manager import windows as action_manager
+from argus.client import cache
 from argus import config as argus_config
 from argus import exceptions
 from argus.introspection.cloud import windows as introspection
@@ -79,7 +81,7 @@ class WindowsActionManagerTest(unittest.TestCase):
 
         self._client.run_command_with_retry.assert_called_with(
             cmd, count=util.RETRY_COUNT, delay=util.RETRY_DELAY,
-            command_type=util.POWERSHELL)
+            command_type=util.POWERSHELL, policy=None)
 
     def test_download_exception(self):
         (self._client.run_command_with_retry
@@ -101,7 +103,7 @@ class WindowsActionManagerTest(unittest.TestCase):
         self._action_manager.download_resource(
             test_utils.RESOURCE_LOCATION, test_utils.LOCATION)
         mock_download.assert_called_once_with(
-            expected_uri, test_utils.LOCATION)
+            expected_uri, test_utils.LOCATION, policy=None)
 
     def test_download_resource_exception(self):
         self._test_download_resource(
@@ -124,7 +126,20 @@ class WindowsActionManagerTest(unittest.TestCase):
         self._action_manager.download_resource(
             test_utils.RESOURCE_LOCATION, test_utils.LOCATION)
         mock_download.assert_called_once_with(
-            expected_uri, test_utils.LOCATION)
+            expected_uri, test_utils.LOCATION, policy=None)
+
+    @mock.patch('argus.resource_server.get_resources_url')
+    @mock.patch('argus.action_manager.windows.WindowsActionManager.download')
+    def test_download_resource_from_resource_server(self, mock_download,
+                                                    mock_get_resources_url):
+        mock_get_resources_url.return_value = (
+            "http://10.0.0.1:8000/resources/")
+
+        self._action_manager.download_resource(
+            test_utils.RESOURCE_LOCATION, test_utils.LOCATION)
+        mock_download.assert_called_once_with(
+            "http://10.0.0.1:8000/resources/" + test_utils.RESOURCE_LOCATION,
+            test_utils.LOCATION, policy=None)
 
     @mock.patch('argus.action_manager.windows.WindowsActionManager'
                 '.download_resource')
@@ -158,10 +173,10 @@ class WindowsActionManagerTest(unittest.TestCase):
             script_type = util.CMD
 
         mock_download_resource.assert_called_once_with(
-            test_utils.RESOURCE_LOCATION, instance_location)
+            test_utils.RESOURCE_LOCATION, instance_location, policy=None)
         self._client.run_command_with_retry.assert_called_once_with(
             cmd, count=util.RETRY_COUNT,
-            delay=util.RETRY_DELAY, command_type=script_type)
+            delay=util.RETRY_DELAY, command_type=script_type, policy=None)
 
     def test_execute_resource_script_bat_script(self):
         self._test_execute_resource_script(script_type=util.BAT_SCRIPT)
@@ -196,7 +211,7 @@ class WindowsActionManagerTest(unittest.TestCase):
         mock_execute_script.assert_called_once_with(
             resource_location=test_utils.RESOURCE_LOCATION,
             parameters=test_utils.PARAMETERS,
-            script_type=script_type)
+            script_type=script_type, policy=None)
 
     def test_execute_powershell_resource_script_successful(self):
         test_method = self._action_manager.execute_powershell_resource_script
@@ -310,13 +325,14 @@ class WindowsActionManagerTest(unittest.TestCase):
     @mock.patch('argus.action_manager.windows.WindowsActionManager.'
                 'rmdir')
     @mock.patch('argus.action_manager.windows.WindowsActionManager.'
-                'is_dir')
+                'stat')
     @mock.patch('argus.action_manager.windows.WindowsActionManager.'
                 'exists')
-    def test_git_clone_exception(self, mock_exists, mock_is_dir,
+    def test_git_clone_exception(self, mock_exists, mock_stat,
                                  mock_rmdir, mock_time):
-        mock_exists.side_effect = [False, True, True]
-        mock_is_dir.return_value = True
+        mock_exists.return_value = False
+        mock_stat.return_value = action_manager.PathStat(
+            True, self._action_manager._DIRECTORY, 0, 0)
         mock_rmdir.side_effect = None
         mock_time.return_value = True
         self._client.run_command.side_effect = exceptions.ArgusError
@@ -324,6 +340,24 @@ class WindowsActionManagerTest(unittest.TestCase):
                                              test_utils.LOCATION,
                                              count=2)
         self.assertFalse(res)
+        self.assertEqual(mock_rmdir.call_count, 2)
+
+    @mock.patch('argus.action_manager.windows.WindowsActionManager.'
+                'stat')
+    @mock.patch('argus.action_manager.windows.WindowsActionManager.'
+                'exists')
+    def test_git_clone_not_retryable(self, mock_exists, mock_stat):
+        mock_exists.return_value = False
+        self._client.run_command.side_effect = exceptions.ArgusCLIError
+        policy = util.RetryPolicy(
+            count=2, delay=0, retry_on=(exceptions.ArgusTimeoutError, ))
+
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._action_manager.git_clone(test_utils.URL,
+                                           test_utils.LOCATION,
+                                           policy=policy)
+        self.assertEqual(self._client.run_command.call_count, 1)
+        mock_stat.assert_not_called()
 
     def _test_wait_cbinit_service(self, run_command_exc=None):
         if run_command_exc:
@@ -362,15 +396,23 @@ class WindowsActionManagerTest(unittest.TestCase):
         self._test_check_cbinit_service(
             run_command_exc=exceptions.ArgusTimeoutError)
 
-    def test_check_cbinit_service_fail_clierror(self):
-        self._client.run_command_until_condition = mock.Mock(
-            side_effect=[None, exceptions.ArgusCLIError, None])
+    def test_check_cbinit_service_single_command(self):
+        self._client.run_command_until_condition = mock.Mock()
+
+        self._action_manager.check_cbinit_service(test_utils.SEARCHED_PATHS)
 
-        with self.assertRaises(exceptions.ArgusCLIError):
-            self._action_manager.check_cbinit_service(
-                test_utils.SEARCHED_PATHS)
         self.assertEqual(
-            self._client.run_command_until_condition.call_count, 2)
+            self._client.run_command_until_condition.call_count, 1)
+        cmd = self._client.run_command_until_condition.call_args[0][0]
+        for path in test_utils.SEARCHED_PATHS:
+            self.assertIn("'{}'".format(path), cmd)
+
+    def test_check_cbinit_service_no_paths(self):
+        self._client.run_command_until_condition = mock.Mock()
+
+        self._action_manager.check_cbinit_service()
+
+        self.assertFalse(self._client.run_command_until_condition.called)
 
     @test_utils.ConfPatcher('image_username', test_utils.USERNAME, 'openstack')
     @mock.patch('argus.action_manager.windows.wait_boot_completion')
@@ -400,120 +442,187 @@ class WindowsActionManagerTest(unittest.TestCase):
                              ["Prepare something specific"
                               " for OS Type {}".format(self._os_type)])
 
-    @mock.patch('argus.action_manager.windows.WindowsActionManager'
-                '.exists')
-    @mock.patch('argus.action_manager.windows.WindowsActionManager'
-                '.is_file')
-    def _test_remove(self, mock_is_file, mock_exists,
-                     is_file=True, exists=True,
-                     is_file_exc=None, exists_exc=None, run_exc=None):
-        cmd = "Remove-Item -Force -Path '{path}'".format(path=test_utils.PATH)
-
-        mock_exists.return_value = exists
-        mock_is_file.return_value = is_file
-
-        if not exists or not is_file:
-            with self.assertRaises(exceptions.ArgusCLIError):
-                self._action_manager.remove(test_utils.PATH)
-            return
+    def _set_output(self, output):
+        self._client.run_command.return_value = (output + "\r\n", "", 0)
 
-        if exists_exc:
-            mock_exists.side_effect = exists_exc
-            with self.assertRaises(exists_exc):
-                self._action_manager.remove(test_utils.PATH)
-            return
+    def _set_many_output(self, output):
+        self._client.run_command_with_retry.return_value = (
+            output + "\r\n", "", 0)
 
-        if is_file_exc:
-            mock_exists.side_effect = is_file_exc
-            with self.assertRaises(is_file_exc):
-                self._action_manager.remove(test_utils.PATH)
-            return
+    def _assert_script_run(self, script):
+        self._client.run_command.assert_called_once_with(
+            "$path = '{}'; {}".format(test_utils.PATH, script),
+            command_type=util.POWERSHELL)
 
-        if run_exc:
-            self._client.run_command_with_retry.side_effect = run_exc
-            with self.assertRaises(run_exc):
-                self._action_manager.remove(test_utils.PATH)
-            return
+    def test_check_and_act_quoted(self):
+        self._set_output("Done")
+        self.assertEqual(
+            self._action_manager._check_and_act("C:\\it's", "'Done'"),
+            "Done")
+        self._client.run_command.assert_called_once_with(
+            "$path = 'C:\\it''s'; 'Done'", command_type=util.POWERSHELL)
+
+    def test_check_and_act_retried(self):
+        self._client.run_command.side_effect = [
+            exceptions.ArgusError, ("Missing\r\n", "", 0)]
+        self.assertEqual(
+            self._action_manager._check_and_act(
+                test_utils.PATH, "'Missing'", acted=("Missing", ),
+                policy=util.RetryPolicy(count=2, delay=0)),
+            "Done")
+
+    def test_check_and_act_not_retried(self):
+        self._set_output("Missing")
+        self.assertEqual(
+            self._action_manager._check_and_act(
+                test_utils.PATH, "'Missing'", acted=("Missing", )),
+            "Missing")
 
-        self._action_manager.remove(test_utils.PATH)
+    def test_check_and_act_not_retryable(self):
+        self._client.run_command.side_effect = exceptions.ArgusError
+        with self.assertRaises(exceptions.ArgusError):
+            self._action_manager._check_and_act(
+                test_utils.PATH, "'Done'",
+                policy=util.RetryPolicy(retry_on=(ValueError, )))
+        self.assertEqual(self._client.run_command.call_count, 1)
+
+    @mock.patch('time.sleep')
+    def test_check_and_act_timeout(self, _):
+        self._client.run_command.side_effect = exceptions.ArgusError
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._action_manager._check_and_act(test_utils.PATH, "'Done'")
+        self.assertEqual(self._client.run_command.call_count,
+                         util.RETRY_COUNT)
+
+    def test_stat_file(self):
+        self._set_output("File 42 {}".format(
+            action_manager._FILE_TIME_EPOCH + 5 * 10 ** 7))
+        self.assertEqual(self._action_manager.stat(test_utils.PATH),
+                         action_manager.PathStat(True, "File", 42, 5.0))
+        self._assert_script_run(self._action_manager._STAT_SCRIPT)
+
+    def test_stat_directory(self):
+        self._set_output(
+            "Directory 0 {}".format(action_manager._FILE_TIME_EPOCH))
+        self.assertEqual(self._action_manager.stat(test_utils.PATH),
+                         action_manager.PathStat(True, "Directory", 0, 0.0))
+
+    def test_stat_missing(self):
+        self._set_output("Missing")
+        self.assertEqual(self._action_manager.stat(test_utils.PATH),
+                         action_manager.PathStat(False, None, None, None))
+
+    def test_stat_unexpected_output(self):
+        self._set_output("Unexpected")
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._action_manager.stat(test_utils.PATH)
+
+    def test_stat_many(self):
+        self._set_many_output(
+            "File 42 {0}\r\nMissing\r\nDirectory 0 {0}".format(
+                action_manager._FILE_TIME_EPOCH))
+        paths = [r"C:\file", r"C:\missing", r"C:\it's"]
+
+        self.assertEqual(
+            self._action_manager.stat_many(paths),
+            [action_manager.PathStat(True, "File", 42, 0.0),
+             action_manager.PathStat(False, None, None, None),
+             action_manager.PathStat(True, "Directory", 0, 0.0)])
         self._client.run_command_with_retry.assert_called_once_with(
-            cmd, command_type=util.POWERSHELL)
+            "foreach ($path in @('C:\\file','C:\\missing','C:\\it''s')) "
+            "{ " + self._action_manager._STAT_SCRIPT + " }",
+            command_type=util.POWERSHELL)
 
-    def test_remove_successful(self):
-        self._test_remove()
+    @mock.patch('argus.action_manager.windows.PATHS_MAX_SIZE', 20)
+    def test_stat_many_split(self):
+        self._client.run_command_with_retry.side_effect = [
+            ("Missing\r\nMissing\r\n", "", 0), ("Missing\r\n", "", 0)]
 
-    def test_remove_not_exists(self):
-        self._test_remove(exists=False)
+        stats = self._action_manager.stat_many(["a" * 5, "b" * 5, "c" * 10])
 
-    def test_remove_is_not_file(self):
-        self._test_remove(is_file=False)
+        self.assertEqual([path_stat.exists for path_stat in stats],
+                         [False] * 3)
+        self.assertEqual(self._client.run_command_with_retry.call_count, 2)
 
-    def test_remove_exists_exception(self):
-        self._test_remove(exists_exc=exceptions.ArgusTimeoutError)
+    def test_stat_many_missing_output(self):
+        self._set_many_output("Missing")
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._action_manager.stat_many([r"C:\first", r"C:\second"])
 
-    def test_remove_is_file_exception(self):
-        self._test_remove(is_file_exc=exceptions.ArgusTimeoutError)
+    def test_read_many(self):
+        self._set_many_output("File 7 {0} NDI=\r\nFile 0 {0} \r\n"
+                              "Directory 0 {0}\r\nMissing".format(
+                                  action_manager._FILE_TIME_EPOCH))
+        paths = [r"C:\first", r"C:\empty", r"C:\directory", r"C:\missing"]
 
-    def test_remove_run_command_exception(self):
-        self._test_remove(run_exc=exceptions.ArgusTimeoutError)
+        results = self._action_manager.read_many(paths, max_size=2)
 
-    @mock.patch('argus.action_manager.windows.WindowsActionManager'
-                '.exists')
-    @mock.patch('argus.action_manager.windows.WindowsActionManager'
-                '.is_dir')
-    def _test_rmdir(self, mock_is_dir, mock_exists,
-                    is_dir=True, exists=True,
-                    is_dir_exc=None, exists_exc=None, run_exc=None):
-        cmd = "Remove-Item -Force -Recurse -Path '{path}'".format(
-            path=test_utils.PATH)
-
-        mock_exists.return_value = exists
-        mock_is_dir.return_value = is_dir
-
-        if not exists or not is_dir:
-            with self.assertRaises(exceptions.ArgusCLIError):
-                self._action_manager.rmdir(test_utils.PATH)
-            return
+        self.assertEqual([result.content for result in results],
+                         [b"42", b"", None, None])
+        self.assertEqual([result.truncated for result in results],
+                         [True, False, False, False])
+        self.assertEqual(results[0].stat.size, 7)
+        cmd = self._client.run_command_with_retry.call_args[0][0]
+        self.assertTrue(cmd.startswith("$maxSize = 2; foreach"))
 
-        if exists_exc:
-            mock_exists.side_effect = exists_exc
-            with self.assertRaises(exists_exc):
-                self._action_manager.rmdir(test_utils.PATH)
-            return
+    @mock.patch('argus.action_manager.windows.READ_OUTPUT_MAX_SIZE', 1000)
+    def test_read_many_split(self):
+        self._client.run_command_with_retry.side_effect = [
+            ("Missing\r\nMissing\r\n", "", 0), ("Missing\r\n", "", 0)]
 
-        if is_dir_exc:
-            mock_exists.side_effect = is_dir_exc
-            with self.assertRaises(is_dir_exc):
-                self._action_manager.rmdir(test_utils.PATH)
-            return
+        self._action_manager.read_many(["first", "second", "third"],
+                                       max_size=300)
 
-        if run_exc:
-            self._client.run_command_with_retry.side_effect = run_exc
-            with self.assertRaises(run_exc):
-                self._action_manager.rmdir(test_utils.PATH)
-            return
+        self.assertEqual(self._client.run_command_with_retry.call_count, 2)
 
-        self._action_manager.rmdir(test_utils.PATH)
-        self._client.run_command_with_retry.assert_called_once_with(
-            cmd, command_type=util.POWERSHELL)
+    def test_remove_successful(self):
+        self._set_output("Done")
+        self.assertIsNone(self._action_manager.remove(test_utils.PATH))
+        self._assert_script_run(self._action_manager._REMOVE_SCRIPT)
 
-    def test_rmdir_successful(self):
-        self._test_rmdir()
+    def test_remove_invalid_path(self):
+        self._set_output("Invalid")
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._action_manager.remove(test_utils.PATH)
+
+    def test_remove_missing_path(self):
+        self._set_output("Missing")
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._action_manager.remove(test_utils.PATH)
+
+    @mock.patch('time.sleep')
+    def test_remove_retried_after_acting(self, _):
+        self._client.run_command.side_effect = [
+            requests.ConnectionError, ("Missing\r\n", "", 0)]
+        self.assertIsNone(self._action_manager.remove(test_utils.PATH))
 
-    def test_rmdir_not_exists(self):
-        self._test_rmdir(exists=False)
+    @mock.patch('time.sleep')
+    def test_remove_run_command_exception(self, _):
+        self._client.run_command.side_effect = exceptions.ArgusTimeoutError
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._action_manager.remove(test_utils.PATH)
 
-    def test_rmdir_is_not_file(self):
-        self._test_rmdir(is_dir=False)
+    def test_rmdir_successful(self):
+        self._set_output("Done")
+        self.assertIsNone(self._action_manager.rmdir(test_utils.PATH))
+        self._assert_script_run(self._action_manager._RMDIR_SCRIPT)
 
-    def test_rmdir_exists_exception(self):
-        self._test_rmdir(exists_exc=exceptions.ArgusTimeoutError)
+    def test_rmdir_invalid_path(self):
+        self._set_output("Invalid")
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._action_manager.rmdir(test_utils.PATH)
 
-    def test_rmdir_is_dir_exception(self):
-        self._test_rmdir(is_dir_exc=exceptions.ArgusTimeoutError)
+    @mock.patch('time.sleep')
+    def test_rmdir_retried_after_acting(self, _):
+        self._client.run_command.side_effect = [
+            requests.ConnectionError, ("Missing\r\n", "", 0)]
+        self.assertIsNone(self._action_manager.rmdir(test_utils.PATH))
 
-    def test_rmdir_run_command_exception(self):
-        self._test_rmdir(run_exc=exceptions.ArgusTimeoutError)
+    @mock.patch('time.sleep')
+    def test_rmdir_run_command_exception(self, _):
+        self._client.run_command.side_effect = exceptions.ArgusTimeoutError
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._action_manager.rmdir(test_utils.PATH)
 
     def _test__exists(self, fail=False, run_command_exc=None):
         cmd = 'Test-Path -PathType {} -Path "{}"'.format(
@@ -634,208 +743,69 @@ class WindowsActionManagerTest(unittest.TestCase):
     def test_is_dir_fail_exception(self):
         self._test_is_dir(exc=exceptions.ArgusTimeoutError)
 
-    def _test_new_item(self, run_command_exc=None):
-        cmd = "New-Item -Path '{}' -Type {} -Force".format(
-            test_utils.PATH, test_utils.ITEM_TYPE)
-
-        if run_command_exc:
-            self._client.run_command_with_retry = mock.Mock(
-                side_effect=run_command_exc)
-            with self.assertRaises(run_command_exc):
-                self._action_manager._new_item(
-                    test_utils.PATH, test_utils.ITEM_TYPE)
-        else:
-            self._client.run_command_with_retry = mock.Mock()
-            self.assertIsNone(
-                self._action_manager._new_item(
-                    test_utils.PATH, test_utils.ITEM_TYPE))
-            self._client.run_command_with_retry.assert_called_once_with(
-                cmd=cmd, command_type=util.POWERSHELL)
-
-    def test_new_item_successful(self):
-        self._test_new_item()
-
-    def test_new_item_fail(self):
-        self._test_new_item(run_command_exc=exceptions.ArgusTimeoutError)
-
-    @mock.patch('argus.action_manager.windows.WindowsActionManager'
-                '.exists')
-    @mock.patch('argus.action_manager.windows.WindowsActionManager'
-                '._new_item')
-    def _test_mkdir(self, mock_new_item, mock_exists, exists=False,
-                    exists_exc=None, new_item_exc=None):
-        if exists_exc:
-            mock_exists.side_effect = exists_exc
-            with self.assertRaises(exists_exc):
-                self._action_manager.mkdir(test_utils.PATH)
-            return
-
-        mock_exists.return_value = exists
-
-        if exists:
-            with self.assertRaises(exceptions.ArgusCLIError):
-                self._action_manager.mkdir(test_utils.PATH)
-            return
-
-        if new_item_exc:
-            mock_new_item.side_effect = new_item_exc
-            with self.assertRaises(new_item_exc):
-                self._action_manager.mkdir(test_utils.PATH)
-            return
-
-        self.assertIsNone(self._action_manager.mkdir(test_utils.PATH))
-
     def test_mkdir_successful(self):
-        self._test_mkdir()
+        self._set_output("Done")
+        self.assertIsNone(self._action_manager.mkdir(test_utils.PATH))
+        self._assert_script_run(self._action_manager._MKDIR_SCRIPT)
 
     def test_mkdir_exists_fail(self):
-        self._test_mkdir(exists=True)
-
-    def test_mkdir_exists_fail_exception(self):
-        self._test_mkdir(exists_exc=exceptions.ArgusTimeoutError)
-
-    def test_mkdir_new_item_fail_exception(self):
-        self._test_mkdir(new_item_exc=exceptions.ArgusTimeoutError)
-
-    @mock.patch('argus.action_manager.windows.WindowsActionManager'
-                '.is_file')
-    @mock.patch('argus.action_manager.windows.WindowsActionManager'
-                '.is_dir')
-    @mock.patch('argus.action_manager.windows.WindowsActionManager'
-                '._new_item')
-    def _test_mkfile(self, mock_new_item, mock_is_dir, mock_is_file,
-                     is_file=False, is_dir=False, is_file_exc=None,
-                     is_dir_exc=None, new_item_exc=None, run_command_exc=None):
-        self._client.run_command_with_retry = mock.Mock()
-
-        mock_is_file.return_value = is_file
-        mock_is_dir.return_value = is_dir
-
-        if is_file and not run_command_exc:
-            log = ("File '{}' already exists. LastWriteTime and"
-                   " LastAccessTime will be updated.".format(test_utils.PATH))
-
-            with test_utils.LogSnatcher('argus.action_manager.windows.Windows'
-                                        'ActionManager.mkfile') as snatcher:
-                self.assertIsNone(self._action_manager.mkfile(test_utils.PATH))
-            self.assertEqual(snatcher.output, [log])
-            self._client.run_command_with_retry.assert_called_once_with(
-                "echo $null >> '{}'".format(test_utils.PATH),
-                command_type=util.POWERSHELL)
-            return
-
-        if is_file_exc:
-            mock_is_file.side_effect = is_file_exc
-            with self.assertRaises(is_file_exc):
-                self._action_manager.mkfile(test_utils.PATH)
-            return
-
-        if is_file and run_command_exc:
-            self._client.run_command_with_retry.side_effect = run_command_exc
-            with self.assertRaises(run_command_exc):
-                self._action_manager.mkfile(test_utils.PATH)
-            return
-
-        if not is_file and is_dir:
-            with self.assertRaises(exceptions.ArgusCLIError):
-                self._action_manager.mkfile(test_utils.PATH)
-            return
+        self._set_output("Exists")
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._action_manager.mkdir(test_utils.PATH)
 
-        if not is_file and is_dir_exc:
-            mock_is_dir.side_effect = is_dir_exc
-            with self.assertRaises(is_dir_exc):
-                self._action_manager.mkfile(test_utils.PATH)
-            return
+    def test_mkdir_directory_exists_fail(self):
+        self._set_output("Directory")
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._action_manager.mkdir(test_utils.PATH)
 
-        if not is_file and not is_dir and new_item_exc:
-            mock_new_item.side_effect = new_item_exc
-            with self.assertRaises(new_item_exc):
-                self._action_manager.mkfile(test_utils.PATH)
-            return
+    @mock.patch('time.sleep')
+    def test_mkdir_retried_after_acting(self, _):
+        self._client.run_command.side_effect = [
+            requests.ConnectionError, ("Directory\r\n", "", 0)]
+        self.assertIsNone(self._action_manager.mkdir(test_utils.PATH))
 
-        self._action_manager.mkfile(test_utils.PATH)
-        mock_new_item.assert_called_once_with(
-            test_utils.PATH, self._action_manager._FILE)
+    @mock.patch('time.sleep')
+    def test_mkdir_run_command_exception(self, _):
+        self._client.run_command.side_effect = exceptions.ArgusTimeoutError
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._action_manager.mkdir(test_utils.PATH)
 
     def test_mkfile_new_item_successful(self):
-        self._test_mkfile()
-
-    def test_mkfile_new_item_exception(self):
-        self._test_mkfile(new_item_exc=exceptions.ArgusTimeoutError)
+        self._set_output("Done")
+        self.assertIsNone(self._action_manager.mkfile(test_utils.PATH))
+        self._assert_script_run(self._action_manager._MKFILE_SCRIPT)
 
     def test_mkfile_is_file_successful(self):
-        self._test_mkfile(is_file=True)
-
-    def test_mkfile_is_file_exception(self):
-        self._test_mkfile(is_file_exc=exceptions.ArgusTimeoutError)
+        self._set_output("File")
+        log = ("File '{}' already exists. LastWriteTime and"
+               " LastAccessTime will be updated.".format(test_utils.PATH))
 
-    def test_mkfile_run_command_exception(self):
-        self._test_mkfile(
-            is_file=True, run_command_exc=exceptions.ArgusTimeoutError)
+        with test_utils.LogSnatcher('argus.action_manager.windows.Windows'
+                                    'ActionManager.mkfile') as snatcher:
+            self.assertIsNone(self._action_manager.mkfile(test_utils.PATH))
+        self.assertEqual(snatcher.output, [log])
 
-    def test_mkfile_is_dir_successful(self):
-        self._test_mkfile(is_dir=True)
-
-    def test_mkfile_is_dir_exception(self):
-        self._test_mkfile(is_dir_exc=exceptions.ArgusTimeoutError)
-
-    @mock.patch('argus.action_manager.windows.WindowsActionManager'
-                '.is_dir')
-    @mock.patch('argus.action_manager.windows.WindowsActionManager'
-                '.mkfile')
-    def _test_touch(self, mock_mkfile, mock_is_dir, is_dir=False,
-                    is_dir_exc=None, run_command_exc=None, mkfile_exc=None):
-        mock_is_dir.return_value = is_dir
-
-        if is_dir:
-            self._client.run_command_with_retry = mock.Mock()
-
-            if run_command_exc:
-                (self._client.run_command_with_retry.
-                 side_effect) = run_command_exc
-                with self.assertRaises(run_command_exc):
-                    self._action_manager.touch(test_utils.PATH)
-                return
-
-            cmd = ("$datetime = get-date;"
-                   "$dir = Get-Item '{}';"
-                   "$dir.LastWriteTime = $datetime;"
-                   "$dir.LastAccessTime = $datetime;").format(test_utils.PATH)
-
-            self.assertIsNone(self._action_manager.touch(test_utils.PATH))
-            self._client.run_command_with_retry.assert_called_once_with(
-                cmd, command_type=util.POWERSHELL)
-            return
-
-        if is_dir_exc:
-            mock_is_dir.side_effect = is_dir_exc
-            with self.assertRaises(is_dir_exc):
-                self._action_manager.touch(test_utils.PATH)
-            return
-
-        if mkfile_exc:
-            mock_mkfile.side_effect = mkfile_exc
-            with self.assertRaises(mkfile_exc):
-                self._action_manager.touch(test_utils.PATH)
-            return
+    def test_mkfile_is_dir_fail(self):
+        self._set_output("Directory")
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._action_manager.mkfile(test_utils.PATH)
 
-        self.assertIsNone(self._action_manager.touch(test_utils.PATH))
+    @mock.patch('time.sleep')
+    def test_mkfile_run_command_exception(self, _):
+        self._client.run_command.side_effect = exceptions.ArgusTimeoutError
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._action_manager.mkfile(test_utils.PATH)
 
     def test_touch_successful(self):
-        self._test_touch()
-
-    def test_touch_mkfile_exception(self):
-        self._test_touch(mkfile_exc=exceptions.ArgusTimeoutError)
-
-    def test_touch_run_command_exception(self):
-        self._test_touch(
-            is_dir=True, run_command_exc=exceptions.ArgusTimeoutError)
-
-    def test_touch_is_dir_successful(self):
-        self._test_touch(is_dir=True)
+        self._set_output("Done")
+        self.assertIsNone(self._action_manager.touch(test_utils.PATH))
+        self._assert_script_run(self._action_manager._TOUCH_SCRIPT)
 
-    def test_touch_is_dir__exception(self):
-        self._test_touch(is_dir_exc=exceptions.ArgusTimeoutError)
+    @mock.patch('time.sleep')
+    def test_touch_run_command_exception(self, _):
+        self._client.run_command.side_effect = exceptions.ArgusTimeoutError
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._action_manager.touch(test_utils.PATH)
 
     def _test_execute(self, exc=None):
         if exc:
@@ -855,7 +825,8 @@ class WindowsActionManagerTest(unittest.TestCase):
                 command_type=util.CMD), test_utils.STDOUT)
             self._client.run_command_with_retry.assert_called_once_with(
                 test_utils.CMD, count=util.RETRY_COUNT,
-                delay=util.RETRY_DELAY, command_type=util.CMD)
+                delay=util.RETRY_DELAY, command_type=util.CMD,
+                cacheable=False)
 
     def test_execute(self):
         self._test_execute()
@@ -866,18 +837,18 @@ class WindowsActionManagerTest(unittest.TestCase):
     def test_execute_argus_error(self):
         self._test_execute(exceptions.ArgusError)
 
-    def _test_check_cbinit_installation(self, get_python_dir_exc=None,
+    @mock.patch('argus.introspection.cloud.windows.get_python_dir')
+    def _test_check_cbinit_installation(self, mock_get_python_dir,
+                                        get_python_dir_exc=None,
                                         run_remote_cmd_exc=None):
         if get_python_dir_exc:
-            introspection.get_python_dir = mock.Mock(
-                side_effect=get_python_dir_exc)
+            mock_get_python_dir.side_effect = get_python_dir_exc
             self.assertFalse(self._action_manager.check_cbinit_installation())
             return
 
         cmd = r'& "{}\python.exe" -c "import cloudbaseinit"'.format(
             test_utils.PYTHON_DIR)
-        introspection.get_python_dir = mock.Mock(
-            return_value=test_utils.PYTHON_DIR)
+        mock_get_python_dir.return_value = test_utils.PYTHON_DIR
         if run_remote_cmd_exc:
             self._client.run_remote_cmd = mock.Mock(
                 side_effect=run_remote_cmd_exc)
@@ -900,17 +871,16 @@ class WindowsActionManagerTest(unittest.TestCase):
         self._test_check_cbinit_installation(
             run_remote_cmd_exc=exceptions.ArgusError)
 
+    @mock.patch('argus.introspection.cloud.windows.get_cbinit_dir')
     @mock.patch('argus.action_manager.windows.WindowsActionManager.rmdir')
-    def _test_cbinit_cleanup(self, mock_rmdir, get_cbinit_dir_exc=None,
-                             rmdir_exc=None):
+    def _test_cbinit_cleanup(self, mock_rmdir, mock_get_cbinit_dir,
+                             get_cbinit_dir_exc=None, rmdir_exc=None):
         if get_cbinit_dir_exc:
-            introspection.get_cbinit_dir = mock.Mock(
-                side_effect=get_cbinit_dir_exc)
+            mock_get_cbinit_dir.side_effect = get_cbinit_dir_exc
             self.assertFalse(self._action_manager.cbinit_cleanup())
             return
 
-        introspection.get_cbinit_dir = mock.Mock(
-            return_value=test_utils.CBINIT_DIR)
+        mock_get_cbinit_dir.return_value = test_utils.CBINIT_DIR
         if rmdir_exc:
             mock_rmdir.side_effect = rmdir_exc
             self.assertFalse(self._action_manager.cbinit_cleanup())
@@ -1027,19 +997,98 @@ class WindowsActionManagerTest(unittest.TestCase):
         self.assertEqual(mock_deploy.call_count, util.RETRY_COUNT)
         self.assertEqual(mock_cleanup.call_count, 2 * util.RETRY_COUNT)
 
+    @mock.patch('argus.util.time')
     @mock.patch('argus.action_manager.windows.WindowsActionManager'
-                '.execute_powershell_resource_script')
-    def _test_run_installation_script(self, mock_execute_script, exc=None):
+                '.cbinit_cleanup')
+    @mock.patch('argus.action_manager.windows.WindowsActionManager'
+                '.check_cbinit_installation')
+    @mock.patch('argus.action_manager.windows.WindowsActionManager'
+                '._deploy_using_scheduled_task')
+    @mock.patch('argus.action_manager.windows.WindowsActionManager'
+                '._run_installation_script')
+    def test_install_cbinit_deadline(self, mock_run, mock_deploy,
+                                     mock_check, mock_cleanup, mock_time):
+        mock_check.return_value = False
+        mock_time.time.side_effect = itertools.chain(
+            [0, 100], itertools.repeat(action_manager.INSTALL_TIMEOUT))
+
+        self.assertFalse(self._action_manager.install_cbinit())
+
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertEqual(mock_deploy.call_count, 1)
+        self.assertEqual(mock_cleanup.call_count, 2)
+        # The commands of the installation methods end by the deadline.
+        self.assertEqual(mock_run.call_args[1]["policy"].timeout,
+                         action_manager.INSTALL_TIMEOUT - 100)
+        self.assertEqual(mock_deploy.call_args[1]["policy"].timeout, 0)
+
+    @mock.patch('argus.introspection.facts.get_image_facts')
+    @mock.patch('argus.action_manager.windows.WindowsActionManager.rmdir')
+    @mock.patch('argus.action_manager.windows.WindowsActionManager'
+                '._deploy_using_scheduled_task')
+    @mock.patch('argus.action_manager.windows.WindowsActionManager'
+                '._run_installation_script')
+    def test_install_cbinit_failed_cleanup(self, mock_run, mock_deploy,
+                                           mock_rmdir, mock_get_facts):
+        mock_get_facts.return_value = None
+        result_cache = cache.ResultCache()
+        installed = []
+
+        def run_command_with_retry(cmd, command_type=None, cacheable=False,
+                                   **kwargs):
+            def run():
+                found = "Cloudbase` Solutions" in cmd and bool(installed)
+                return str(found), "", 0
+            if cacheable:
+                return result_cache.get((cmd, command_type), run)
+            return run()
+
+        def partial_install(installer, policy=None):
+            installed.append(installer)
+            raise exceptions.ArgusError("fake-install-failure")
+
+        self._client.run_command_with_retry.side_effect = (
+            run_command_with_retry)
+        self._client.invalidate_cache.side_effect = result_cache.invalidate
+        mock_run.side_effect = partial_install
+        mock_deploy.side_effect = exceptions.ArgusError
+        self._action_manager.os_fingerprint = introspection.OSFingerprint(
+            *[None] * len(introspection.OS_FINGERPRINT_FIELDS))._replace(
+                architecture="x86", program_files="C:\\Program Files")
+        # The lookup made before the installation caches the missing
+        # directory.
+        with self.assertRaises(exceptions.ArgusError):
+            introspection.get_cbinit_dir(self._action_manager._execute,
+                                         self._action_manager.os_fingerprint)
+
+        self.assertFalse(self._action_manager.install_cbinit(
+            policy=util.RetryPolicy(count=1, delay=0)))
+
+        mock_rmdir.assert_called_with(
+            "C:\\Program Files\\Cloudbase Solutions")
+
+    @mock.patch('argus.action_manager.windows.WindowsActionManager'
+                '.download_resource')
+    def _test_run_installation_script(self, mock_download_resource,
+                                      exc=None):
+        self._client.stream_command_with_retry = mock.Mock()
         if exc:
-            mock_execute_script.side_effect = exc
+            self._client.stream_command_with_retry.side_effect = exc
             with self.assertRaises(exc):
                 self._action_manager._run_installation_script(
                     test_utils.INSTALLER)
         else:
             self._action_manager._run_installation_script(test_utils.INSTALLER)
-            mock_execute_script.assert_called_once_with(
-                resource_location='windows/installCBinit.ps1',
-                parameters='-installer {}'.format(test_utils.INSTALLER))
+            mock_download_resource.assert_called_once_with(
+                'windows/installCBinit.ps1', r"C:\installCBinit.ps1",
+                policy=None)
+            self._client.stream_command_with_retry.assert_called_once_with(
+                r'"C:\installCBinit.ps1" -installer {}'.format(
+                    test_utils.INSTALLER),
+                command_type=util.POWERSHELL_SCRIPT_BYPASS,
+                on_line=mock.ANY,
+                spool="installCBinit-{}.log".format(test_utils.INSTALLER),
+                policy=None)
 
     def test_run_installation_script(self):
         self._test_run_installation_script()
@@ -1063,7 +1112,7 @@ class WindowsActionManagerTest(unittest.TestCase):
                 test_utils.INSTALLER)
             mock_execute_script.assert_called_once_with(
                 'windows/schedule_installer.ps1',
-                '{}'.format(test_utils.INSTALLER))
+                '{}'.format(test_utils.INSTALLER), policy=None)
 
     def test_deploy_using_scheduled_task(self):
         self._test_deploy_using_scheduled_task()
@@ -1084,3 +1133,19 @@ class WindowsActionManagerTest(unittest.TestCase):
             self.assertEqual(snatcher.output,
                              ["Config Cloudbase-Init"
                               " for {}".format(self._os_type)])
+
+    @mock.patch('argus.introspection.cloud.windows.get_os_fingerprint')
+    def test_get_windows_action_manager(self, mock_get_os_fingerprint):
+        fingerprint = introspection.OSFingerprint(
+            major=6, minor=1, product_type=3, nano_server=False,
+            architecture="AMD64", program_files=r"C:\Program Files",
+            program_files_x86=r"C:\Program Files (x86)",
+            powershell_version="2.0")
+        mock_get_os_fingerprint.return_value = fingerprint
+
+        manager = action_manager.get_windows_action_manager(self._client)
+
+        self.assertIsInstance(manager,
+                              action_manager.WindowsServer2008ActionManager)
+        self.assertEqual(manager.os_fingerprint, fingerprint)
+        mock_get_os_fingerprint.assert_called_once_with(self._client)
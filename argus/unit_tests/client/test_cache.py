@@ -0,0 +1,98 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from argus.client import cache
+from argus import exceptions
+
+
+class ResultCacheTest(unittest.TestCase):
+    """Tests for the cache of the remote results."""
+
+    def setUp(self):
+        self._cache = cache.ResultCache(ttl=10)
+
+    def test_get_cached(self):
+        func = mock.Mock(return_value="fake-result")
+
+        self.assertEqual(self._cache.get("key", func), "fake-result")
+        self.assertEqual(self._cache.get("key", func), "fake-result")
+        self.assertEqual(self._cache.peek("key"), "fake-result")
+        func.assert_called_once_with()
+
+    @mock.patch('time.time')
+    def test_get_expired(self, mock_time):
+        mock_time.return_value = 100
+        func = mock.Mock(side_effect=["first", "second"])
+
+        self.assertEqual(self._cache.get("key", func), "first")
+        mock_time.return_value = 111
+        self.assertIsNone(self._cache.peek("key"))
+        self.assertEqual(self._cache.get("key", func), "second")
+
+    def test_errors_not_cached(self):
+        func = mock.Mock(side_effect=[exceptions.ArgusError, "fake-result"])
+
+        with self.assertRaises(exceptions.ArgusError):
+            self._cache.get("key", func)
+        self.assertEqual(self._cache.get("key", func), "fake-result")
+
+    def test_invalidate(self):
+        self._cache.put("key", "fake-result")
+        self._cache.invalidate()
+
+        self.assertIsNone(self._cache.peek("key"))
+
+    def test_invalidate_while_pending(self):
+        def func():
+            self._cache.invalidate()
+            return "stale-result"
+
+        self.assertEqual(self._cache.get("key", func), "stale-result")
+        self.assertIsNone(self._cache.peek("key"))
+
+    def test_concurrent_requests_collapsed(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def func():
+            calls.append(None)
+            started.set()
+            release.wait()
+            return "fake-result"
+
+        def get():
+            results.append(self._cache.get("key", func))
+
+        threads = [threading.Thread(target=get) for _ in range(4)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["fake-result"] * 4)
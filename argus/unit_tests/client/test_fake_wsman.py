@@ -0,0 +1,390 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# pylint: disable=protected-access
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+import pkg_resources
+from winrm import exceptions as winrm_exceptions
+
+from argus.action_manager import windows as action_manager
+from argus.client import pool
+from argus import exceptions
+from argus.introspection.cloud import windows as introspection
+from argus.unit_tests import fake_wsman
+from argus.unit_tests import test_utils
+from argus import util
+
+
+class FakeWSManServerTest(unittest.TestCase):
+    """Tests for the Windows client talking with the fake WinRM service."""
+
+    def setUp(self):
+        self._server = fake_wsman.FakeWSManServer(
+            test_utils.USERNAME, test_utils.PASSWORD)
+        self._server.start()
+        self.addCleanup(self._server.stop)
+        self._instance = fake_wsman.FakeWindowsInstance()
+        self._instance.install(self._server)
+        self._client = self._server.get_client()
+        self.addCleanup(self._client.close)
+        self._server.reset_stats()
+        self._tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tempdir)
+
+    def test_action_manager_selected(self):
+        self.assertIsInstance(self._client.manager,
+                              action_manager.WindowsSever2012R2ActionManager)
+
+    def test_run_command(self):
+        self._server.add_handler(r"^Get-Answer$",
+                                 lambda command, match: ("42", "", 0))
+
+        stdout, _, _ = self._client.run_command("Get-Answer")
+        self.assertEqual(stdout, "42")
+        stdout, _, _ = self._client.run_command(
+            'powershell "$ENV:ProgramFiles"', command_type=util.CMD)
+        self.assertEqual(stdout, r"C:\Program Files")
+
+        self.assertEqual(self._server.requests,
+                         {"Command": 2, "Receive": 2, "Signal": 2})
+        self.assertEqual([command.text for command in self._server.commands],
+                         ["Get-Answer", 'powershell "$ENV:ProgramFiles"'])
+
+    def test_run_command_failed(self):
+        with self.assertRaises(exceptions.ArgusError):
+            self._client.run_command("Get-Unknown")
+
+    def test_wrong_credentials(self):
+        self._server.password = "other-password"
+
+        with self.assertRaises(winrm_exceptions.InvalidCredentialsError):
+            self._client.run_remote_cmd("echo 'test'")
+
+    def test_shell_recreated(self):
+        self._client.run_command("echo 'first'")
+        self._server.shells.clear()
+
+        stdout, _, _ = self._client.run_command("echo 'second'")
+        self.assertEqual(stdout, "second")
+        self.assertEqual(self._server.requests["Create"], 1)
+
+    def test_injected_failure_retried(self):
+        self._server.inject_failure("Receive")
+
+        stdout, _, _ = self._client.run_command_with_retry(
+            "echo 'test'", policy=util.RetryPolicy(count=2, delay=0))
+        self.assertEqual(stdout, "test")
+        self.assertEqual(self._server.requests["Command"], 2)
+
+    def test_latency(self):
+        self._server.latency = 0.05
+
+        start = time.time()
+        self._client.run_command("echo 'test'")
+        self.assertGreaterEqual(time.time() - start, 0.15)
+
+    def test_streamed_output(self):
+        def handler(command, _):
+            command.write("first\r\n")
+            command.write("second\r\n")
+            command.finish(0)
+
+        self._server.add_handler(r"^Get-Lines$", handler)
+
+        lines = []
+        self._client.stream_command(
+            "Get-Lines", on_line=lambda name, line: lines.append(line))
+        self.assertEqual(lines, ["first", "second"])
+
+    def test_receive_timeout(self):
+        self._server.receive_timeout = 0.1
+        self._server.add_handler(
+            r"^Wait-Forever$",
+            lambda command, _: threading.Timer(
+                0.3, finish, args=(command, )).start())
+
+        def finish(command):
+            command.write("done\r\n")
+            command.finish(0)
+
+        stdout, _, _ = self._client.run_command("Wait-Forever")
+        self.assertEqual(stdout, "done")
+        self.assertGreater(self._server.requests["Receive"], 1)
+
+    def test_action_manager(self):
+        manager = self._client.manager
+        path = r"C:\argus\file.txt"
+
+        manager.mkdir(r"C:\argus")
+        manager.mkfile(path)
+        self.assertTrue(manager.is_dir(r"C:\argus"))
+        self.assertTrue(manager.is_file(path))
+
+        manager.remove(path)
+        self.assertFalse(manager.exists(path))
+        with self.assertRaises(exceptions.ArgusCLIError):
+            manager.remove(path)
+
+        self.assertTrue(manager.git_clone("fake-repo", r"C:\argus\repo"))
+        self.assertEqual(self._instance.cloned, ["fake-repo"])
+
+    def test_bulk_path_actions(self):
+        manager = self._client.manager
+        basefiles = ["b64", "b64_1", "gzip", "gzip_1", "gzip_base64",
+                     "gzip_base64_1", "gzip_base64_2"]
+        for basefile in basefiles:
+            self._instance.add_file("C:\\" + basefile, b"42\r\n")
+        self._instance.add_file(r"C:\it's (x86).bin", b"\x00\xff" * 10)
+
+        stats = manager.stat_many([r"C:\b64", r"C:\missing", "C:"])
+        self.assertEqual([path_stat.type for path_stat in stats],
+                         ["File", None, "Directory"])
+        results = manager.read_many([r"C:\it's (x86).bin", r"C:\missing"],
+                                    max_size=5)
+        self.assertEqual(results[0].stat.size, 20)
+        self.assertEqual(results[0].content, b"\x00\xff\x00\xff\x00")
+        self.assertTrue(results[0].truncated)
+        self.assertIsNone(results[1].content)
+        files = introspection.InstanceIntrospection(
+            self._client).get_cloudconfig_executed_plugins()
+        self.assertEqual(files, {basefile: "42" for basefile in basefiles})
+        manager.check_cbinit_service(
+            ["C:\\" + basefile for basefile in basefiles])
+        self.assertEqual(self._server.requests["Command"], 4)
+
+        del self._instance.files["c:\\gzip_1"]
+        with self.assertRaises(exceptions.ArgusError):
+            introspection.InstanceIntrospection(
+                self._client).get_cloudconfig_executed_plugins()
+
+    def test_compound_path_actions(self):
+        manager = self._client.manager
+        path = r"C:\argus\it's.txt"
+
+        manager.mkdir(r"C:\argus")
+        manager.mkfile(path)
+        manager.touch(path)
+        with self.assertRaises(exceptions.ArgusCLIError):
+            manager.mkdir(r"C:\argus")
+        with self.assertRaises(exceptions.ArgusCLIError):
+            manager.mkfile(r"C:\argus")
+        with self.assertRaises(exceptions.ArgusCLIError):
+            manager.rmdir(path)
+        # Each check is done along with its action, by a single command.
+        self.assertEqual(self._server.requests["Command"], 6)
+
+        self._instance.add_file(path, b"content")
+        path_stat = manager.stat(path)
+        self.assertEqual(path_stat[:3], (True, "File", 7))
+        self.assertAlmostEqual(path_stat.mtime, time.time(), delta=60)
+        self.assertEqual(manager.stat(r"C:\argus")[:3],
+                         (True, "Directory", 0))
+        self.assertFalse(manager.stat(r"C:\missing").exists)
+
+        manager.rmdir(r"C:\argus")
+        self.assertEqual(self._instance.files, {})
+
+    @mock.patch('time.sleep')
+    def test_path_actions_retried(self, _):
+        manager = self._client.manager
+        path = r"C:\argus\it's [1].txt"
+
+        # Each action is done before its response is lost, so only
+        # its retry finds it done.
+        for action, action_path in ((manager.mkdir, r"C:\argus"),
+                                    (manager.mkfile, path),
+                                    (manager.remove, path),
+                                    (manager.rmdir, r"C:\argus")):
+            self._server.inject_failure("Receive")
+            action(action_path)
+        self.assertFalse(manager.stat(r"C:\argus").exists)
+        self.assertEqual(self._server.requests["Command"], 9)
+
+    def test_download_file(self):
+        content = bytes(bytearray(range(256))) * 10
+        self._instance.add_file(r"C:\it's.bin", content)
+        path = os.path.join(self._tempdir, "file")
+
+        self._client.download_file(r"C:\it's.bin", path, chunk_size=1000)
+
+        with open(path, "rb") as stream:
+            self.assertEqual(stream.read(), content)
+        self.assertEqual(self._server.requests["Command"], 4)
+
+    def test_service_status(self):
+        self._instance.services["cloudbase-init"] = "Stopped"
+
+        self._client.manager.wait_cbinit_service()
+        self.assertEqual(self._server.requests["Command"], 1)
+
+    def test_runspace(self):
+        client = self._server.get_client(use_runspace=True)
+        self.addCleanup(client.close)
+        self._server.reset_stats()
+
+        for _ in range(3):
+            self.assertTrue(client.manager.exists("C:"))
+
+        # The runspace was started when the action manager was chosen.
+        self.assertEqual(self._server.requests["Command"], 0)
+        self.assertEqual(self._server.requests["Send"], 3)
+
+    def test_map(self):
+        self._instance.max_shells_per_user = 4
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def handler(command, match):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            threading.Timer(0.1, finish,
+                            args=(command, match.group(1))).start()
+
+        def finish(command, output):
+            with lock:
+                running[0] -= 1
+            command.write(output)
+            command.finish(0)
+
+        self._server.add_handler(r"^Get-Slow (\d+)$", handler)
+
+        results = self._client.map(
+            ["Get-Slow {}".format(index) for index in range(6)])
+
+        self.assertEqual([stdout for stdout, _, _ in results],
+                         [str(index) for index in range(6)])
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(self._server.requests["Create"], 2)
+
+    def test_map_failed_command(self):
+        with self.assertRaises(exceptions.ArgusError):
+            self._client.map(["echo 'first'", "Get-Unknown"])
+
+    def test_os_fingerprint(self):
+        self._instance.powershell_version = "5.1"
+
+        client, requests = fake_wsman.count_requests(self._server,
+                                                     self._server.get_client)
+        self.addCleanup(client.close)
+
+        self.assertEqual(requests, {"Create": 1, "Command": 1, "Receive": 1,
+                                    "Signal": 1})
+        fingerprint = client.manager.os_fingerprint
+        self.assertEqual(fingerprint.powershell_version, "5.1")
+        self.assertEqual(fingerprint.program_files_x86,
+                         r"C:\Program Files (x86)")
+
+    def test_image_facts(self):
+        path = os.path.join(self._tempdir, "facts.json")
+        self._instance.add_directory(
+            r"C:\Program Files\Cloudbase Solutions\Cloudbase-Init")
+
+        def get_cbinit_dir(client):
+            return introspection.get_cbinit_dir(
+                client.manager._execute, client.manager.os_fingerprint)
+
+        with test_utils.ConfPatcher("facts_file", path, "argus"):
+            client = self._server.get_client()
+            self.addCleanup(client.close)
+            get_cbinit_dir(client)
+
+            # The known facts are only checked.
+            self._server.reset_stats()
+            client = self._server.get_client()
+            self.addCleanup(client.close)
+            cbinit_dir = get_cbinit_dir(client)
+            self.assertEqual(
+                cbinit_dir,
+                r"C:\Program Files\Cloudbase Solutions\Cloudbase-Init")
+            self.assertEqual(self._server.requests["Command"], 2)
+            self.assertIn("OSVersion.Version;",
+                          self._server.commands[0].text)
+
+            # The stale facts are found again.
+            self._instance.os_version["Minor"] = 2
+            self._instance._remove(r"C:\Program Files\Cloudbase Solutions")
+            client = self._server.get_client()
+            self.addCleanup(client.close)
+            self.assertEqual(client.manager.os_fingerprint.minor, 2)
+            with self.assertRaises(exceptions.ArgusError):
+                get_cbinit_dir(client)
+
+            # The directory missing before the installation is kept.
+            self._instance.add_directory(cbinit_dir)
+            client.invalidate_cache()
+            self._server.reset_stats()
+            self.assertEqual(get_cbinit_dir(client), cbinit_dir)
+            self.assertEqual(self._server.requests["Command"], 1)
+
+    def test_count_requests(self):
+        _, requests = fake_wsman.count_requests(
+            self._server, self._client.manager.exists, "C:")
+
+        self.assertEqual(requests, {"Command": 1, "Receive": 1, "Signal": 1})
+
+
+@unittest.skipUnless(pool.TLS_SESSION_RESUMPTION,
+                     "TLS sessions can't be resumed.")
+class FakeWSManServerTLSTest(unittest.TestCase):
+    """Tests for the Windows client talking with the fake service over TLS."""
+
+    def setUp(self):
+        self._server = fake_wsman.FakeWSManServer(
+            test_utils.USERNAME, test_utils.PASSWORD,
+            certfile=pkg_resources.resource_filename(
+                "argus.resources", "cert.pem"),
+            keyfile=pkg_resources.resource_filename(
+                "argus.resources", "key.pem"))
+        self._server.start()
+        self.addCleanup(self._server.stop)
+        self.addCleanup(pool.ENDPOINT_POOL.release, self._server.endpoint)
+        fake_wsman.FakeWindowsInstance().install(self._server)
+
+    def _get_client(self):
+        client = self._server.get_client()
+        self.addCleanup(client.close)
+        return client
+
+    def test_connection_kept_alive(self):
+        client = self._get_client()
+        self._server.reset_stats()
+
+        for _ in range(3):
+            stdout, _, _ = client.run_command("echo 'test'")
+            self.assertEqual(stdout, "test")
+        self._get_client().run_command("echo 'test'")
+        self.assertEqual(self._server.handshakes, {})
+
+    def test_session_resumed(self):
+        self._get_client().run_command("echo 'first'")
+        pool.ENDPOINT_POOL.release(self._server.endpoint)
+
+        stdout, _, _ = self._get_client().run_command("echo 'second'")
+        self.assertEqual(stdout, "second")
+        self.assertEqual(self._server.handshakes, {"full": 1, "resumed": 1})
@@ -0,0 +1,95 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+import requests
+
+from argus.client import pool
+
+ENDPOINT = "http://fake-host:5985/wsman"
+OTHER_ENDPOINT = "https://fake-host:5986/wsman"
+
+
+class EndpointPoolTest(unittest.TestCase):
+    """Tests for the endpoint connection pools."""
+
+    def setUp(self):
+        self._pool = pool.EndpointPool(maxsize=2)
+
+    def test_get_adapter_same_endpoint(self):
+        adapter = self._pool.get_adapter(ENDPOINT)
+
+        self.assertIs(adapter, self._pool.get_adapter(ENDPOINT + "/other"))
+        self.assertIsNot(adapter, self._pool.get_adapter(OTHER_ENDPOINT))
+        self.assertEqual(adapter._pool_maxsize, 2)
+
+    def test_get_adapter_per_certificate(self):
+        cert = ("fake-cert.pem", "fake-key.pem")
+        adapter = self._pool.get_adapter(OTHER_ENDPOINT, cert)
+
+        self.assertIs(adapter,
+                      self._pool.get_adapter(OTHER_ENDPOINT, list(cert)))
+        self.assertIsNot(adapter, self._pool.get_adapter(OTHER_ENDPOINT))
+
+    @unittest.skipUnless(pool.TLS_SESSION_RESUMPTION,
+                         "TLS sessions can't be resumed.")
+    def test_ssl_context_kept_after_release(self):
+        adapter = self._pool.get_adapter(OTHER_ENDPOINT)
+        self.assertIsInstance(adapter._ssl_context, pool.ResumingSSLContext)
+        self.assertIs(adapter.poolmanager.connection_pool_kw["ssl_context"],
+                      adapter._ssl_context)
+
+        self._pool.release(OTHER_ENDPOINT)
+        self.assertIs(self._pool.get_adapter(OTHER_ENDPOINT)._ssl_context,
+                      adapter._ssl_context)
+        self.assertIsNone(self._pool.get_adapter(ENDPOINT)._ssl_context)
+
+    def test_mount_shared_between_sessions(self):
+        first, second = requests.Session(), requests.Session()
+        self._pool.mount(first, ENDPOINT)
+        self._pool.mount(second, ENDPOINT)
+
+        adapter = first.get_adapter(ENDPOINT)
+        self.assertIsInstance(adapter, pool.SharedHTTPAdapter)
+        self.assertIs(adapter, second.get_adapter(ENDPOINT))
+
+    def test_session_close_keeps_connections(self):
+        session = requests.Session()
+        self._pool.mount(session, ENDPOINT)
+        adapter = session.get_adapter(ENDPOINT)
+
+        with mock.patch.object(adapter.poolmanager, 'clear') as mock_clear:
+            session.close()
+            mock_clear.assert_not_called()
+
+            self._pool.release(ENDPOINT)
+            mock_clear.assert_called_once_with()
+        self.assertIsNot(adapter, self._pool.get_adapter(ENDPOINT))
+
+    def test_release_all(self):
+        adapters = [self._pool.get_adapter(ENDPOINT),
+                    self._pool.get_adapter(OTHER_ENDPOINT)]
+
+        with mock.patch.object(pool.SharedHTTPAdapter,
+                               'release') as mock_release:
+            self._pool.release()
+        self.assertEqual(mock_release.call_count, len(adapters))
+        self.assertIsNot(adapters[0], self._pool.get_adapter(ENDPOINT))
@@ -0,0 +1,320 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# pylint: disable=protected-access
+
+import base64
+import io
+import subprocess
+import unittest
+
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from winrm import exceptions as winrm_exceptions
+
+from argus.client import runspace
+from argus.client import windows
+from argus import exceptions
+from argus.unit_tests import test_utils
+from argus import util
+
+# PowerShell Core, for running the host of the runspace locally.
+PWSH = which("pwsh")
+
+
+class FakeRunspaceProtocol(object):
+    """A WinRM protocol emulating the PowerShell host of a runspace.
+
+    The scripts are passed to the `handler`, which returns their
+    output, errors and exit code.
+    """
+
+    def __init__(self, handler, chunk_size=None):
+        self._handler = handler
+        self._chunk_size = chunk_size
+        self._input = b""
+        self._output = []
+        self.scripts = []
+        self.shells = []
+        self.closed_shells = []
+        self.commands = []
+        self.exited = False
+
+    def open_shell(self, codepage=None):
+        shell_id = "shell-{}".format(len(self.shells))
+        self.shells.append(shell_id)
+        return shell_id
+
+    def close_shell(self, shell_id):
+        self.closed_shells.append(shell_id)
+
+    def run_command(self, shell_id, command):
+        self.commands.append(command)
+        return test_utils.COMMAND_ID
+
+    def send_command_input(self, shell_id, command_id, data, end=False):
+        self._input += data.encode()
+        while b"\r\n" in self._input:
+            request, self._input = self._input.split(b"\r\n", 1)
+            self._handle(request)
+        if end:
+            self.exited = True
+
+    def _handle(self, request):
+        request_id, payload = request.split(b" ", 1)
+        script = base64.b64decode(payload).decode("utf-8")
+        self.scripts.append(script)
+        stdout, stderr, exit_code = self._handler(script)
+        # Some console output, followed by the response split in chunks.
+        response = "{} {} {} {} {}\r\n".format(
+            runspace.RESPONSE_MARKER, request_id.decode(), exit_code,
+            base64.b64encode(stdout).decode(),
+            base64.b64encode(stderr).decode()).encode()
+        chunk_size = self._chunk_size or 10
+        self._output.append(b"written by Write-Host\r\n")
+        self._output.extend(response[offset:offset + chunk_size]
+                            for offset in range(0, len(response), chunk_size))
+
+    def get_command_output_raw(self, shell_id, command_id):
+        if self.exited:
+            return b"", b"", 0, True
+        if not self._output:
+            raise winrm_exceptions.WinRMOperationTimeoutError()
+        return self._output.pop(0), b"", -1, False
+
+    def cleanup_command(self, shell_id, command_id):
+        pass
+
+
+class LocalPowerShellProtocol(object):
+    """A WinRM protocol running the host of a runspace in a local pwsh."""
+
+    def __init__(self):
+        self._process = None
+
+    def run_command(self, shell_id, command):
+        args = command.split()
+        args[0] = PWSH
+        self._process = subprocess.Popen(args, stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE)
+        return test_utils.COMMAND_ID
+
+    def send_command_input(self, shell_id, command_id, data, end=False):
+        self._process.stdin.write(data.encode())
+        self._process.stdin.flush()
+        if end:
+            self._process.stdin.close()
+
+    def get_command_output_raw(self, shell_id, command_id):
+        line = self._process.stdout.readline()
+        if not line:
+            return b"", b"", self._process.wait(), True
+        return line, b"", -1, False
+
+    def cleanup_command(self, shell_id, command_id):
+        self._process.wait()
+        self._process.stdout.close()
+
+    def close_shell(self, shell_id):
+        pass
+
+
+class PowerShellRunspaceTest(unittest.TestCase):
+    """Tests for the PowerShell runspace."""
+
+    def setUp(self):
+        self._protocol = FakeRunspaceProtocol(self._handler)
+        self._runspace = runspace.PowerShellRunspace(
+            (self._protocol, test_utils.SHELL_ID))
+        self._runspace.open()
+
+    @staticmethod
+    def _handler(script):
+        if script == "fail":
+            return b"", b"fake-error", 1
+        return script.upper().encode(), b"", 0
+
+    def _run(self, script):
+        stdout, stderr = io.BytesIO(), io.BytesIO()
+        exit_code = self._runspace.run(script, stdout, stderr)
+        return stdout.getvalue(), stderr.getvalue(), exit_code
+
+    def test_open(self):
+        self.assertEqual(self._protocol.commands,
+                         [runspace.get_host_command()])
+
+    def test_run(self):
+        self.assertEqual(self._run("first"), (b"FIRST", b"", 0))
+        self.assertEqual(self._run(u"second \u00e9"),
+                         (u"SECOND \u00c9".encode(), b"", 0))
+        self.assertEqual(self._run("fail"), (b"", b"fake-error", 1))
+        self.assertEqual(self._protocol.scripts,
+                         ["first", u"second \u00e9", "fail"])
+
+    @mock.patch('argus.client.runspace.INPUT_CHUNK_SIZE', 4)
+    def test_run_big_script(self):
+        self.assertEqual(self._run("x" * 100), (b"X" * 100, b"", 0))
+
+    def test_run_output_decoded_in_chunks(self):
+        self._protocol._chunk_size = 3
+        stdout = mock.Mock()
+
+        exit_code = self._runspace.run("x" * 100, stdout, io.BytesIO())
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(b"".join(call[0][0] for call in
+                                  stdout.write.call_args_list),
+                         b"X" * 100)
+        self.assertGreater(stdout.write.call_count, 10)
+        self.assertEqual(self._run("next"), (b"NEXT", b"", 0))
+
+    def test_run_host_exited(self):
+        self._protocol.exited = True
+
+        with self.assertRaises(exceptions.ArgusError):
+            self._run("first")
+
+    def test_close(self):
+        self._runspace.close()
+
+        self.assertTrue(self._protocol.exited)
+        self.assertEqual(self._protocol.closed_shells, [test_utils.SHELL_ID])
+        with self.assertRaises(exceptions.ArgusError):
+            self._run("first")
+
+    def test_get_script(self):
+        self.assertEqual(runspace.get_script(test_utils.CMD, util.POWERSHELL),
+                         test_utils.CMD)
+        self.assertEqual(
+            runspace.get_script(r'"C:\script.ps1" -a b',
+                                util.POWERSHELL_SCRIPT_BYPASS),
+            r'& "C:\script.ps1" -a b')
+
+
+@unittest.skipUnless(PWSH, "PowerShell isn't available.")
+class PowerShellHostTest(unittest.TestCase):
+    """Tests for the PowerShell host of the runspace."""
+
+    def setUp(self):
+        self._runspace = runspace.PowerShellRunspace(
+            (LocalPowerShellProtocol(), test_utils.SHELL_ID))
+        self._runspace.open()
+        self.addCleanup(self._runspace.close)
+
+    def _run(self, script):
+        stdout, stderr = io.BytesIO(), io.BytesIO()
+        exit_code = self._runspace.run(script, stdout, stderr)
+        return stdout.getvalue().strip(), stderr.getvalue(), exit_code
+
+    def test_run(self):
+        self.assertEqual(self._run(u'"first \u00e9"'),
+                         (u"first \u00e9".encode("utf-8"), b"", 0))
+
+    def test_preferences_reset(self):
+        stdout, _, exit_code = self._run(
+            '$ErrorActionPreference = "Stop"; '
+            '$global:ErrorActionPreference = "Stop"; "stop"')
+        self.assertEqual((stdout, exit_code), (b"stop", 0))
+
+        stdout, stderr, exit_code = self._run(
+            'Write-Error "fake-error"; "continued"')
+        self.assertEqual((stdout, exit_code), (b"continued", 1))
+        self.assertIn(b"fake-error", stderr)
+
+    def test_scope(self):
+        self._run('$local = "local"; $global:kept = "global"')
+
+        self.assertEqual(self._run('"$local-$kept"'), (b"-global", b"", 0))
+
+    def test_exit_code(self):
+        self.assertEqual(self._run("exit 3")[2], 3)
+        self.assertEqual(self._run('throw "fake-error"')[2], 1)
+        self.assertEqual(self._run('"alive"'), (b"alive", b"", 0))
+
+
+class WinRemoteClientRunspaceTest(unittest.TestCase):
+    """Tests for running the commands of a client in a runspace."""
+
+    @mock.patch('argus.client.windows.get_windows_action_manager')
+    def setUp(self, _):
+        self._client = windows.WinRemoteClient(
+            test_utils.HOSTNAME, test_utils.USERNAME, test_utils.PASSWORD,
+            use_runspace=True)
+        self._protocol = FakeRunspaceProtocol(
+            lambda script: (b"fake-stdout", b"", 0))
+        self._client._get_protocol = mock.Mock(return_value=self._protocol)
+        self._client._run_command = mock.Mock(
+            return_value=("fake-cmd-stdout", "", 0))
+
+    def test_run_command(self):
+        for _ in range(3):
+            self.assertEqual(self._client.run_command(test_utils.CMD),
+                             ("fake-stdout", b"", 0))
+
+        self.assertEqual(len(self._protocol.shells), 1)
+        self.assertEqual(self._protocol.scripts, [test_utils.CMD] * 3)
+        self._client._run_command.assert_not_called()
+
+    def test_run_command_not_powershell(self):
+        self._client.run_command(test_utils.CMD, command_type=util.CMD)
+
+        self.assertEqual(self._protocol.scripts, [])
+        self._client._run_command.assert_called_once_with(
+            self._protocol, "shell-0", test_utils.CMD,
+            command_type=util.CMD,
+            capture_limit=windows.OUTPUT_CAPTURE_LIMIT,
+            operation_timeout=mock.ANY)
+
+    def test_run_command_failed(self):
+        self._protocol._handler = lambda script: (b"", b"fake-stderr", 1)
+
+        with self.assertRaises(exceptions.ArgusError):
+            self._client.run_command(test_utils.CMD)
+        self.assertIsNotNone(self._client._runspace)
+
+    def test_run_command_output_spooled(self):
+        self._client._capture_limit = 8
+        self._protocol._handler = lambda script: (
+            b"0123456789abcdef", b"", 0)
+
+        stdout, _, _ = self._client.run_command(test_utils.CMD)
+        self.assertEqual(stdout, "0123456789abcdef")
+
+    def test_runspace_restarted(self):
+        self._client.run_command(test_utils.CMD)
+        self._protocol.exited = True
+
+        with self.assertRaises(exceptions.ArgusError):
+            self._client.run_command(test_utils.CMD)
+        self.assertIsNone(self._client._runspace)
+
+        self._protocol.exited = False
+        self._client.run_command(test_utils.CMD)
+        self.assertEqual(len(self._protocol.commands), 2)
+
+    def test_close(self):
+        self._client.run_command(test_utils.CMD)
+        self._client.close()
+
+        self.assertIsNone(self._client._runspace)
+        self.assertEqual(self._protocol.closed_shells, ["shell-0"])
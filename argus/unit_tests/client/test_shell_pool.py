@@ -0,0 +1,84 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import itertools
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from argus.client import shell_pool
+from argus import exceptions
+
+
+class ShellPoolTest(unittest.TestCase):
+    """Tests for the pool of remote shells."""
+
+    def setUp(self):
+        counter = itertools.count()
+        self._open_shell = mock.Mock(
+            side_effect=lambda: ("fake-protocol", next(counter)))
+        self._close_shell = mock.Mock()
+        self._pool = shell_pool.ShellPool(
+            self._open_shell, self._close_shell, idle_timeout=10,
+            discard_errors=(ValueError, ))
+
+    def test_shell_reused(self):
+        with self._pool.shell() as first:
+            with self._pool.shell() as second:
+                self.assertNotEqual(first, second)
+        # The most recently used shell is reused first.
+        with self._pool.shell() as third:
+            self.assertEqual(third, first)
+
+        self.assertEqual(self._open_shell.call_count, 2)
+        self._close_shell.assert_not_called()
+
+    @mock.patch('time.time')
+    def test_expired_shell_closed(self, mock_time):
+        mock_time.return_value = 0
+        with self._pool.shell() as first:
+            pass
+
+        mock_time.return_value = 11
+        with self._pool.shell() as second:
+            self.assertNotEqual(first, second)
+        self._close_shell.assert_called_once_with(first)
+
+    def test_shell_discarded_on_error(self):
+        with self.assertRaises(ValueError):
+            with self._pool.shell() as first:
+                raise ValueError()
+        with self.assertRaises(exceptions.ArgusError):
+            with self._pool.shell() as second:
+                raise exceptions.ArgusError()
+        with self._pool.shell() as third:
+            pass
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(second, third)
+        self._close_shell.assert_called_once_with(first)
+
+    def test_close(self):
+        with self._pool.shell() as first:
+            with self._pool.shell() as second:
+                pass
+            self._pool.close()
+            self._close_shell.assert_called_once_with(second)
+
+        self._close_shell.assert_called_with(first)
+        self.assertEqual(self._close_shell.call_count, 2)
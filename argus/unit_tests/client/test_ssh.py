@@ -0,0 +1,167 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# pylint: disable=protected-access
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from argus.action_manager import windows as action_manager
+from argus.client import ssh
+from argus import exceptions
+from argus.unit_tests import fake_sshd
+from argus.unit_tests import fake_wsman
+from argus.unit_tests import test_utils
+from argus import util
+
+
+class TestSSHPaths(unittest.TestCase):
+
+    def test_get_sftp_path(self):
+        self.assertEqual(ssh._get_sftp_path(r"C:\argus\file.txt"),
+                         "/C:/argus/file.txt")
+        self.assertEqual(ssh._get_sftp_path(r"argus\file.txt"),
+                         "argus/file.txt")
+
+
+class FakeSSHServerTest(unittest.TestCase):
+    """Tests for the SSH client talking with the fake SSH service."""
+
+    def setUp(self):
+        self._server = fake_sshd.FakeSSHServer(test_utils.USERNAME,
+                                               test_utils.PASSWORD)
+        self._server.start()
+        self.addCleanup(self._server.stop)
+        self._instance = self._server.instance
+        self._client = self._server.get_client()
+        self.addCleanup(self._client.close)
+        self._server.reset_stats()
+        self._tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tempdir)
+
+    def test_action_manager_selected(self):
+        self.assertIsInstance(self._client.manager,
+                              action_manager.WindowsSever2012R2ActionManager)
+
+    def test_run_command(self):
+        stdout, _, _ = self._client.run_command("echo 'test'")
+        self.assertEqual(stdout, "test")
+        stdout, _, _ = self._client.run_command(
+            'powershell "$ENV:ProgramFiles"', command_type=util.CMD)
+        self.assertEqual(stdout, r"C:\Program Files")
+
+        self.assertEqual(self._server.connections, 0)
+        self.assertEqual(self._server.channels, {"exec": 2})
+
+    def test_run_command_failed(self):
+        self._server.add_handler(
+            r"^Get-Failure$", lambda command, match: ("out", "err", 3))
+
+        with self.assertRaises(exceptions.ArgusError) as context:
+            self._client.run_command("Get-Failure")
+        self.assertIn("exit code 3", str(context.exception))
+        self.assertIn("err", str(context.exception))
+
+    def test_streamed_output(self):
+        def handler(command, _):
+            command.write("first\r\n")
+            command.write("warning\r\n", fake_wsman.STDERR)
+            command.write("second\r\n")
+            command.finish(0)
+
+        self._server.add_handler(r"^Get-Lines$", handler)
+
+        lines = []
+        self._client.stream_command(
+            "Get-Lines", on_line=lambda name, line: lines.append((name, line)))
+        # The order of the lines is kept only within each stream.
+        self.assertEqual(sorted(lines, key=lambda line: line[0]),
+                         [("stderr", "warning"),
+                          ("stdout", "first"),
+                          ("stdout", "second")])
+
+    def test_map(self):
+        lock = threading.Lock()
+        running = [0]
+        peak = [0]
+
+        def handler(command, match):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            threading.Timer(0.1, finish,
+                            args=(command, match.group(1))).start()
+
+        def finish(command, output):
+            with lock:
+                running[0] -= 1
+            command.write(output)
+            command.finish(0)
+
+        self._server.add_handler(r"^Get-Slow (\d+)$", handler)
+
+        results = self._client.map(
+            ["Get-Slow {}".format(index) for index in range(6)])
+
+        self.assertEqual([stdout for stdout, _, _ in results],
+                         [str(index) for index in range(6)])
+        self.assertGreater(peak[0], 1)
+        self.assertEqual(self._server.connections, 0)
+        self.assertEqual(self._server.channels, {"exec": 6})
+
+    def test_reconnect(self):
+        self._server.drop_connections()
+
+        stdout, _, _ = self._client.run_command("echo 'test'")
+        self.assertEqual(stdout, "test")
+        self.assertEqual(self._server.connections, 1)
+
+    def test_copy_file(self):
+        content = bytes(bytearray(range(256))) * 10
+        path = os.path.join(self._tempdir, "file")
+        with open(path, "wb") as stream:
+            stream.write(content)
+
+        self._client.copy_file(path, r"C:\argus\file.bin")
+
+        self.assertEqual(self._instance.files[r"c:\argus\file.bin"], content)
+        self.assertTrue(self._client.manager.is_file(r"C:\argus\file.bin"))
+
+    def test_write_file(self):
+        self._client.write_file("first", r"C:\argus\file.txt")
+        self._client.write_file(u"second", r"C:\argus\file.txt")
+
+        self.assertEqual(self._client.read_file(r"C:\argus\file.txt"),
+                         "first\r\nsecond")
+
+    def test_download_file(self):
+        content = bytes(bytearray(range(256))) * 1000
+        self._instance.add_file(r"C:\it's.bin", content)
+        path = os.path.join(self._tempdir, "file")
+
+        size = self._client.download_file(r"C:\it's.bin", path)
+
+        self.assertEqual(size, len(content))
+        with open(path, "rb") as stream:
+            self.assertEqual(stream.read(), content)
+        self.assertEqual(self._server.channels, {"sftp": 1})
+
+    def test_download_missing_file(self):
+        with self.assertRaises(IOError):
+            self._client.download_file(r"C:\missing.txt",
+                                       os.path.join(self._tempdir, "file"))
@@ -0,0 +1,106 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from argus.client import timing
+from argus import exceptions
+from argus import util
+
+
+class CommandTimingsTest(unittest.TestCase):
+    """Tests for the timings of the remote commands."""
+
+    def setUp(self):
+        self._timings = timing.CommandTimings(min_timeout=5, max_timeout=100)
+
+    def test_get_command_key(self):
+        self.assertEqual(
+            timing.get_command_key("Test-Path C:\\argus", util.POWERSHELL),
+            (util.POWERSHELL, "test-path"))
+        self.assertEqual(timing.get_command_key("", util.CMD),
+                         (util.CMD, ""))
+        self.assertEqual(
+            timing.get_command_key(r'"C:\installCBinit.ps1" -installer a',
+                                   util.POWERSHELL_SCRIPT_BYPASS),
+            (util.POWERSHELL_SCRIPT_BYPASS, r"c:\installcbinit.ps1"))
+
+    def test_get_script_key(self):
+        first = timing.get_command_key(
+            "$path = 'C:\\first'; Test-Path $path", util.POWERSHELL)
+        second = timing.get_command_key(
+            "$path = 'C:\\second';\r\n  Test-Path $path", util.POWERSHELL)
+        other = timing.get_command_key(
+            "$path = 'C:\\first'; Remove-Item $path", util.POWERSHELL)
+
+        self.assertEqual(first,
+                         (util.POWERSHELL, "$path = ?; test-path $path"))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_get_long_script_key(self):
+        script = "; ".join("Get-Item {}".format(index) for index in range(9))
+        other = script.replace("Get-Item", "Get-ChildItem")
+
+        _, key = timing.get_command_key(script, util.POWERSHELL)
+        self.assertTrue(key.startswith("get-item ?; get-item ?"))
+        self.assertEqual(len(key), timing.SCRIPT_KEY_SIZE + 13)
+        self.assertEqual(
+            timing.get_command_key(script.replace("8", "80"),
+                                   util.POWERSHELL)[1], key)
+        self.assertNotEqual(
+            timing.get_command_key(other, util.POWERSHELL)[1], key)
+
+    def test_record(self):
+        self._timings.record("key", 10)
+        self._timings.record("key", 20)
+
+        self.assertEqual(self._timings.get("key"),
+                         timing.CommandTiming(2, 13, 20, 20))
+        self.assertIsNone(self._timings.get("other-key"))
+        self.assertEqual(list(self._timings.get_all()), ["key"])
+
+    def test_get_operation_timeout(self):
+        self.assertEqual(self._timings.get_operation_timeout("key", 60), 60)
+
+        self._timings.record("key", 0.2)
+        self.assertEqual(self._timings.get_operation_timeout("key", 60), 5)
+
+        self._timings.record("key", 20)
+        self.assertEqual(self._timings.get_operation_timeout("key", 60), 40)
+
+        self._timings.record("key", 3600)
+        self.assertEqual(self._timings.get_operation_timeout("key", 60), 100)
+
+    @mock.patch('time.time')
+    def test_measure(self, mock_time):
+        mock_time.side_effect = [0, 2, 10, 13, 20]
+
+        with self._timings.measure("key"):
+            pass
+        with self.assertRaises(exceptions.ArgusError):
+            with self._timings.measure("key"):
+                raise exceptions.ArgusError()
+        with self.assertRaises(ValueError):
+            with self._timings.measure("key"):
+                raise ValueError()
+
+        self.assertEqual(self._timings.get("key").count, 2)
+        self.assertEqual(self._timings.get("key").last, 3)
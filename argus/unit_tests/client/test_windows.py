@@ -0,0 +1,852 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# pylint: disable=protected-access
+
+import base64
+import gzip
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+import requests
+import six
+from winrm import exceptions as winrm_exceptions
+
+from argus.client import timing
+from argus.client import windows
+from argus import exceptions
+from argus.unit_tests import test_utils
+from argus import util
+
+
+def _get_protocol_mock():
+    protocol_client = mock.Mock()
+    protocol_client.operation_timeout_sec = windows.OPERATION_TIMEOUT
+    protocol_client.transport.read_timeout_sec = windows.READ_TIMEOUT
+    protocol_client.open_shell.return_value = test_utils.SHELL_ID
+    protocol_client.run_command.return_value = test_utils.COMMAND_ID
+    return protocol_client
+
+
+class WinRemoteClientTest(unittest.TestCase):
+    """Tests for the Windows remote client."""
+
+    @mock.patch('argus.client.windows.get_windows_action_manager')
+    def setUp(self, _):
+        self._client = windows.WinRemoteClient(
+            test_utils.HOSTNAME, test_utils.USERNAME, test_utils.PASSWORD)
+        self._protocol = _get_protocol_mock()
+        self._protocol.get_command_output_raw.return_value = (
+            b"fake-stdout", b"", 0, True)
+        self._client._get_protocol = mock.Mock(return_value=self._protocol)
+
+    def test_shell_reused(self):
+        self._client.run_remote_cmd(test_utils.CMD)
+        self._client.run_remote_cmd(test_utils.CMD)
+
+        self._client._get_protocol.assert_called_once_with()
+        self._protocol.open_shell.assert_called_once_with(
+            codepage=windows.CODEPAGE_UTF8)
+        self.assertEqual(self._protocol.run_command.call_count, 2)
+        self._protocol.close_shell.assert_not_called()
+
+    @mock.patch('time.time')
+    def test_shell_idle_expired(self, mock_time):
+        mock_time.return_value = 0
+        self._client.run_remote_cmd(test_utils.CMD)
+
+        mock_time.return_value = windows.SHELL_IDLE_TIMEOUT + 1
+        self._client.run_remote_cmd(test_utils.CMD)
+
+        self._protocol.close_shell.assert_called_once_with(
+            test_utils.SHELL_ID)
+        self.assertEqual(self._protocol.open_shell.call_count, 2)
+
+    def test_shell_discarded_on_transport_error(self):
+        self._protocol.get_command_output_raw.side_effect = [
+            winrm_exceptions.WinRMTransportError('http', 'fake-error'),
+            (b"fake-stdout", b"", 0, True),
+        ]
+
+        with self.assertRaises(winrm_exceptions.WinRMTransportError):
+            self._client.run_remote_cmd(test_utils.CMD)
+        self.assertIsNone(self._client._shell_id)
+
+        self._protocol.close_shell.assert_called_once_with(
+            test_utils.SHELL_ID)
+
+        stdout, _, _ = self._client.run_remote_cmd(test_utils.CMD)
+        self.assertEqual(stdout, "fake-stdout")
+        self.assertEqual(self._client._get_protocol.call_count, 2)
+        self.assertEqual(self._protocol.open_shell.call_count, 2)
+
+    @staticmethod
+    def _get_shell_not_found_errors():
+        fault = winrm_exceptions.WinRMError("fake-fault")
+        fault.wsman_fault_code = windows.WSMAN_SHELL_NOT_FOUND
+        # As raised by the older pywinrm versions.
+        transport_error = winrm_exceptions.WinRMTransportError(
+            'http', 500, '<f:WSManFault Code="{}"/>'.format(
+                windows.WSMAN_SHELL_NOT_FOUND))
+        return fault, transport_error
+
+    def test_shell_not_found_retried(self):
+        for error in self._get_shell_not_found_errors():
+            self._client._close_shell()
+            self._protocol.reset_mock()
+            self._protocol.get_command_output_raw.side_effect = [
+                error, (b"fake-stdout", b"", 0, True)]
+
+            stdout, _, _ = self._client.run_remote_cmd(test_utils.CMD)
+
+            self.assertEqual(stdout, "fake-stdout")
+            self.assertEqual(self._protocol.open_shell.call_count, 2)
+            self.assertEqual(self._protocol.run_command.call_count, 2)
+            self._protocol.close_shell.assert_called_once_with(
+                test_utils.SHELL_ID)
+
+    def test_shell_not_found_retried_once(self):
+        fault, _ = self._get_shell_not_found_errors()
+        self._protocol.get_command_output_raw.side_effect = fault
+
+        with self.assertRaises(winrm_exceptions.WinRMError):
+            self._client.run_remote_cmd(test_utils.CMD)
+        self.assertEqual(self._protocol.run_command.call_count, 2)
+        self.assertIsNone(self._client._shell_id)
+
+    def test_shell_kept_on_command_failure(self):
+        self._protocol.get_command_output_raw.return_value = (
+            b"", b"fake-stderr", 1, True)
+
+        with self.assertRaises(exceptions.ArgusError):
+            self._client.run_remote_cmd(test_utils.CMD, util.CMD)
+
+        self.assertEqual(self._client._shell_id, test_utils.SHELL_ID)
+        self._protocol.cleanup_command.assert_called_once_with(
+            test_utils.SHELL_ID, test_utils.COMMAND_ID)
+
+    def test_output_spooled(self):
+        self._client._capture_limit = 8
+        self._protocol.get_command_output_raw.side_effect = [
+            (b"0123456789", b"", 0, False),
+            (b"abcdef", b"", 0, True),
+        ]
+
+        stdout, _, _ = self._client.run_remote_cmd(test_utils.CMD)
+        self.assertEqual(stdout, "0123456789abcdef")
+
+    def test_error_output_preview(self):
+        self._protocol.get_command_output_raw.return_value = (
+            b"a" * windows.ERROR_OUTPUT_PREVIEW * 3, b"", 1, True)
+
+        with self.assertRaises(exceptions.ArgusError) as context:
+            self._client.run_remote_cmd(test_utils.CMD)
+        self.assertIn(
+            "[... {} bytes omitted ...]".format(
+                windows.ERROR_OUTPUT_PREVIEW),
+            str(context.exception))
+
+    def test_output_capture_spilled(self):
+        capture = windows._OutputCapture(limit=4)
+        self.addCleanup(capture.close)
+        capture.write(b"0123")
+        self.assertFalse(capture._file._rolled)
+        capture.write(b"45")
+
+        self.assertTrue(capture._file._rolled)
+        self.assertEqual(capture.preview(3), b"012345")
+        self.assertEqual(capture.preview(2),
+                         b"01\n[... 2 bytes omitted ...]\n45")
+        self.assertEqual(capture.getvalue(), b"012345")
+
+    def test_operation_timeout_tuned(self):
+        self._client.timings = timing.CommandTimings()
+        self._client.timings.record(
+            timing.get_command_key(test_utils.CMD, util.POWERSHELL), 0.1)
+        timeouts = []
+
+        def get_output(*_):
+            timeouts.append((self._protocol.operation_timeout_sec,
+                             self._protocol.transport.read_timeout_sec))
+            return b"fake-stdout", b"", 0, True
+
+        self._protocol.get_command_output_raw.side_effect = get_output
+
+        self._client.run_remote_cmd(test_utils.CMD)
+        self._client.run_remote_cmd("Get-Other")
+
+        margin = windows.READ_TIMEOUT - windows.OPERATION_TIMEOUT
+        self.assertEqual(timeouts, [
+            (timing.MIN_OPERATION_TIMEOUT,
+             timing.MIN_OPERATION_TIMEOUT + margin),
+            (windows.OPERATION_TIMEOUT, windows.READ_TIMEOUT),
+        ])
+        self.assertEqual(self._protocol.operation_timeout_sec,
+                         windows.OPERATION_TIMEOUT)
+        self.assertEqual(self._client.timings.get(
+            timing.get_command_key("Get-Other", util.POWERSHELL)).count, 1)
+
+    def test_parallel_shells(self):
+        self._client.run_command = mock.Mock(side_effect=[
+            ("30\r\n1500", "", 0), ("3\r\n1500", "", 0),
+            exceptions.ArgusError])
+
+        self.assertEqual(self._client._parallel_shells,
+                         windows.MAX_PARALLEL_SHELLS)
+        del self._client._parallel_shells
+        self.assertEqual(self._client._parallel_shells, 1)
+        del self._client._parallel_shells
+        self.assertEqual(self._client._parallel_shells,
+                         min(windows.MAX_PARALLEL_SHELLS,
+                             windows.DEFAULT_MAX_SHELLS_PER_USER -
+                             windows.RESERVED_SHELLS))
+
+    def test_map_ordered(self):
+        self._client._parallel_shells = 2
+        self._client._run_concurrently = mock.Mock(
+            side_effect=lambda cmd, _: (cmd.upper(), "", 0))
+        self.addCleanup(self._client.close)
+
+        results = self._client.map(["first", "second", "third"])
+
+        self.assertEqual([stdout for stdout, _, _ in results],
+                         ["FIRST", "SECOND", "THIRD"])
+
+    def test_close(self):
+        self._client.run_remote_cmd(test_utils.CMD)
+        self._client.close()
+
+        self._protocol.close_shell.assert_called_once_with(
+            test_utils.SHELL_ID)
+        self.assertIsNone(self._client._shell_id)
+
+    def test_close_ignores_errors(self):
+        self._protocol.close_shell.side_effect = (
+            winrm_exceptions.WinRMError)
+        self._client.run_remote_cmd(test_utils.CMD)
+
+        self._client.close()
+        self.assertIsNone(self._client._shell_id)
+
+    def test_close_without_shell(self):
+        self._client.close()
+        self._protocol.close_shell.assert_not_called()
+
+    def test_run_command_cacheable(self):
+        for _ in range(2):
+            self.assertEqual(
+                self._client.run_command(test_utils.CMD, cacheable=True),
+                ("fake-stdout", b"", 0))
+        self._client.run_command(test_utils.CMD)
+        self.assertEqual(self._protocol.run_command.call_count, 2)
+
+        self._client.invalidate_cache()
+        self._client.run_command(test_utils.CMD, cacheable=True)
+        self.assertEqual(self._protocol.run_command.call_count, 3)
+
+    @mock.patch('argus.client.pool.ENDPOINT_POOL')
+    @mock.patch('winrm.protocol.Protocol')
+    def test_get_protocol(self, mock_protocol, mock_pool):
+        endpoint = "http://{}:5985/wsman".format(test_utils.HOSTNAME)
+
+        protocol_client = windows.WinRemoteClient._get_protocol(self._client)
+
+        self.assertIs(protocol_client, mock_protocol.return_value)
+        mock_protocol.assert_called_once_with(
+            endpoint=endpoint, transport='plaintext',
+            username=test_utils.USERNAME, password=test_utils.PASSWORD,
+            server_cert_validation='ignore', cert_pem=None, cert_key_pem=None,
+            read_timeout_sec=windows.READ_TIMEOUT,
+            operation_timeout_sec=windows.OPERATION_TIMEOUT)
+        mock_pool.mount.assert_called_once_with(
+            protocol_client.transport.build_session.return_value, endpoint)
+
+    @mock.patch('argus.client.pool.ENDPOINT_POOL')
+    @mock.patch('winrm.protocol.Protocol')
+    def test_get_protocol_certificate(self, mock_protocol, _):
+        with mock.patch('argus.client.windows.get_windows_action_manager'):
+            client = windows.WinRemoteClient(
+                test_utils.HOSTNAME, test_utils.USERNAME, None,
+                transport_protocol='https', cert_pem="fake-cert.pem",
+                cert_key="fake-key.pem")
+
+        client._get_protocol()
+
+        _, kwargs = mock_protocol.call_args
+        self.assertEqual(kwargs['endpoint'],
+                         "https://{}:5986/wsman".format(test_utils.HOSTNAME))
+        self.assertEqual(kwargs['transport'], 'certificate')
+        self.assertEqual(kwargs['cert_pem'], "fake-cert.pem")
+        self.assertEqual(kwargs['cert_key_pem'], "fake-key.pem")
+
+    @mock.patch('time.sleep')
+    def test_run_command_with_retry_policy(self, mock_sleep):
+        self._client.run_command = mock.Mock(side_effect=[
+            exceptions.ArgusTimeoutError, (test_utils.STDOUT, "", 0)])
+        policy = util.RetryPolicy(count=2, delay=1, backoff=2)
+
+        output = self._client.run_command_with_retry(test_utils.CMD,
+                                                     policy=policy)
+
+        self.assertEqual(output, (test_utils.STDOUT, "", 0))
+        mock_sleep.assert_called_once_with(1)
+
+    def test_run_command_with_retry_not_retryable(self):
+        self._client.run_command = mock.Mock(
+            side_effect=exceptions.ArgusCLIError)
+        policy = util.RetryPolicy(
+            count=5, delay=0, retry_on=(exceptions.ArgusTimeoutError, ))
+
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._client.run_command_with_retry(test_utils.CMD,
+                                                policy=policy)
+        self._client.run_command.assert_called_once_with(
+            test_utils.CMD, command_type=util.POWERSHELL, cacheable=False)
+
+    @mock.patch('time.sleep')
+    def test_run_command_until_condition_retry_count(self, mock_sleep):
+        self._client.run_command = mock.Mock(return_value=("Running", "", 0))
+
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._client.run_command_until_condition(
+                test_utils.CMD, lambda stdout: False, retry_count=2, delay=3)
+        self.assertEqual(self._client.run_command.call_count, 3)
+        self.assertEqual(mock_sleep.mock_calls, [mock.call(3)] * 2)
+
+    @mock.patch('time.time')
+    def test_run_command_until_remote_condition(self, mock_time):
+        mock_time.return_value = 0
+        self._client.run_command = mock.Mock(
+            return_value=("True\r\nStopped", "", 0))
+
+        self._client.run_command_until_condition(
+            test_utils.CMD, lambda stdout: stdout == "Stopped",
+            retry_count=2, delay=10,
+            remote_condition="$output.Trim() -eq 'Stopped'")
+
+        self._client.run_command.assert_called_once_with(
+            windows._WAIT_SCRIPT.format(
+                command=test_utils.CMD,
+                condition="$output.Trim() -eq 'Stopped'",
+                timeout="20.000", interval=1000))
+
+    def test_run_command_until_remote_condition_timeout(self):
+        self._client.run_command = mock.Mock(
+            return_value=("False\r\nRunning", "", 0))
+
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._client.run_command_until_condition(
+                test_utils.CMD, lambda stdout: stdout == "Stopped",
+                remote_condition="$output.Trim() -eq 'Stopped'")
+        self._client.run_command.assert_called_once_with(mock.ANY)
+
+    @mock.patch('time.sleep')
+    def test_run_command_until_remote_condition_request_failed(
+            self, mock_sleep):
+        self._client.run_command = mock.Mock(side_effect=[
+            exceptions.ArgusError, ("True\r\nStopped", "", 0)])
+
+        self._client.run_command_until_condition(
+            test_utils.CMD, lambda stdout: stdout == "Stopped",
+            retry_count=2, delay=10,
+            remote_condition="$output.Trim() -eq 'Stopped'")
+
+        self.assertEqual(self._client.run_command.call_count, 2)
+        self.assertEqual(mock_sleep.call_count, 1)
+
+
+class WinRemoteClientUploadTest(unittest.TestCase):
+    """Tests for uploading files with the Windows remote client."""
+
+    @mock.patch('argus.client.windows.get_windows_action_manager')
+    def setUp(self, _):
+        self._client = windows.WinRemoteClient(
+            test_utils.HOSTNAME, test_utils.USERNAME, test_utils.PASSWORD)
+        self._protocol = _get_protocol_mock()
+        self._client._get_protocol = mock.Mock(return_value=self._protocol)
+        # The chunk size will be of 6 bytes.
+        self._client._max_envelope_size = windows.ENVELOPE_OVERHEAD + 16
+        self._tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir)
+
+    def _set_remote_checksum(self, data):
+        checksum = hashlib.sha256(data).hexdigest()
+        self._protocol.get_command_output.return_value = (
+            checksum.encode(), b"", 0)
+
+    def _get_sent_data(self):
+        lines = [call[0][2]
+                 for call in self._protocol.send_command_input.call_args_list]
+        ends = [call[1]['end']
+                for call in self._protocol.send_command_input.call_args_list]
+        self.assertEqual(ends, [False] * (len(ends) - 1) + [True])
+        for line in lines:
+            self.assertTrue(line.endswith("\r\n"))
+        return b"".join(six.moves.map(windows.base64.b64decode, lines))
+
+    def _write_local_file(self, data):
+        path = os.path.join(self._tempdir, "file")
+        with open(path, "wb") as stream:
+            stream.write(data)
+        return path
+
+    def test_get_upload_chunk_size(self):
+        self.assertEqual(self._client._get_upload_chunk_size(), 6)
+
+    def test_copy_file(self):
+        data = b"\x00\x01binary\xffcontent"
+        self._set_remote_checksum(data)
+
+        self._client.copy_file(self._write_local_file(data), test_utils.PATH)
+
+        self.assertEqual(self._get_sent_data(), data)
+        self.assertEqual(self._protocol.send_command_input.call_count, 3)
+        command = self._protocol.run_command.call_args[0][1]
+        self.assertEqual(
+            command, util.get_command(windows._UPLOAD_SCRIPT.format(
+                path=windows._quote(test_utils.PATH), mode="Create",
+                compressed="$false"),
+                util.POWERSHELL))
+        self._protocol.cleanup_command.assert_called_once_with(
+            test_utils.SHELL_ID, test_utils.COMMAND_ID)
+
+    def test_copy_empty_file(self):
+        self._set_remote_checksum(b"")
+
+        self._client.copy_file(self._write_local_file(b""), test_utils.PATH)
+
+        self._protocol.send_command_input.assert_called_once_with(
+            test_utils.SHELL_ID, test_utils.COMMAND_ID, "\r\n", end=True)
+
+    def test_copy_file_checksum_mismatch(self):
+        self._set_remote_checksum(b"other content")
+
+        with self.assertRaises(exceptions.ArgusError):
+            self._client.copy_file(self._write_local_file(b"content"),
+                                   test_utils.PATH)
+
+    def test_copy_file_remote_failure(self):
+        self._protocol.get_command_output.return_value = (
+            b"", b"fake-stderr", 1)
+
+        with self.assertRaises(exceptions.ArgusError):
+            self._client.copy_file(self._write_local_file(b"content"),
+                                   test_utils.PATH)
+        self._protocol.cleanup_command.assert_called_once_with(
+            test_utils.SHELL_ID, test_utils.COMMAND_ID)
+
+    def test_write_file_appends(self):
+        self._set_remote_checksum(b"data\r\n")
+
+        self._client.write_file(u"data", test_utils.PATH)
+
+        self.assertEqual(self._get_sent_data(), b"data\r\n")
+        command = self._protocol.run_command.call_args[0][1]
+        self.assertEqual(
+            command, util.get_command(windows._UPLOAD_SCRIPT.format(
+                path=windows._quote(test_utils.PATH), mode="Append",
+                compressed="$false"),
+                util.POWERSHELL))
+
+    def _test_copy_file_compression(self, data, compress=None):
+        self._client._max_envelope_size = windows.DEFAULT_MAX_ENVELOPE_SIZE
+        self._set_remote_checksum(data)
+
+        with test_utils.LogSnatcher('argus.client.windows') as snatcher:
+            self._client._upload(six.BytesIO(data), test_utils.PATH,
+                                 compress=compress)
+
+        sent = self._get_sent_data()
+        command = self._protocol.run_command.call_args[0][1]
+        compressed = command == util.get_command(
+            windows._UPLOAD_SCRIPT.format(
+                path=windows._quote(test_utils.PATH), mode="Create",
+                compressed="$true"),
+            util.POWERSHELL)
+        if compressed:
+            self.assertEqual(gzip.GzipFile(fileobj=six.BytesIO(sent)).read(),
+                             data)
+            self.assertIn("{} bytes saved".format(len(data) - len(sent)),
+                          snatcher.output[-1])
+        else:
+            self.assertEqual(sent, data)
+        return compressed
+
+    def test_upload_compressed(self):
+        data = b"[DEFAULT]\r\nusername=Admin\r\n" * 1024
+        self.assertTrue(self._test_copy_file_compression(data))
+
+    def test_upload_small_not_compressed(self):
+        data = b"[DEFAULT]\r\n" * 10
+        self.assertFalse(self._test_copy_file_compression(data))
+
+    def test_upload_incompressible_not_compressed(self):
+        data = os.urandom(64 * 1024)
+        self.assertFalse(self._test_copy_file_compression(data))
+
+    def test_upload_forced_compression(self):
+        data = b"[DEFAULT]"
+        self.assertTrue(self._test_copy_file_compression(data, True))
+
+    def test_upload_compression_disabled(self):
+        data = b"[DEFAULT]\r\nusername=Admin\r\n" * 1024
+        self.assertFalse(self._test_copy_file_compression(data, False))
+
+    @mock.patch('argus.client.windows.PARALLEL_UPLOAD_PART_SIZE', 4)
+    def _test_copy_file_parallel(self, part_exc=None, checksum=None):
+        data = b"0123456789ab"
+        path = self._write_local_file(data)
+        self._client._parallel_shells = 4
+        self._client._upload_part = mock.Mock(side_effect=part_exc)
+        self._client.run_command_with_retry = mock.Mock(return_value=(
+            checksum or hashlib.sha256(data).hexdigest(), "", 0))
+        parts = ["{}.part{}".format(test_utils.PATH, index)
+                 for index in range(3)]
+
+        if part_exc or checksum:
+            with self.assertRaises(exceptions.ArgusError):
+                self._client.copy_file(path, test_utils.PATH)
+        else:
+            self._client.copy_file(path, test_utils.PATH)
+
+        self.assertEqual(
+            sorted(call[0] for call in
+                   self._client._upload_part.call_args_list),
+            [(path, 0, 4, parts[0]), (path, 4, 4, parts[1]),
+             (path, 8, 4, parts[2])])
+        self._client.run_command_with_retry.assert_called_once_with(
+            windows._JOIN_SCRIPT.format(
+                path=windows._quote(test_utils.PATH),
+                parts=", ".join(windows._quote(part) for part in parts),
+                join="$false" if part_exc else "$true"),
+            command_type=util.POWERSHELL)
+        self._protocol.send_command_input.assert_not_called()
+
+    def test_copy_file_parallel(self):
+        self._test_copy_file_parallel()
+
+    def test_copy_file_parallel_part_failed(self):
+        self._test_copy_file_parallel(part_exc=exceptions.ArgusError)
+
+    def test_copy_file_parallel_checksum_mismatch(self):
+        self._test_copy_file_parallel(checksum="fake-checksum")
+
+    @mock.patch('argus.client.windows.PARALLEL_UPLOAD_PART_SIZE', 4)
+    def test_copy_file_parts_bounded(self):
+        data = b"0123456789ab"
+        path = self._write_local_file(data)
+        self._client._parallel_shells = 2
+        self._client._upload_parallel = mock.Mock()
+
+        self._client.copy_file(path, test_utils.PATH)
+
+        self._client._upload_parallel.assert_called_once_with(
+            path, test_utils.PATH, 2)
+
+    def test_upload_part(self):
+        data = b"0123456789ab"
+        self._set_remote_checksum(data[4:8])
+
+        self._client._upload_part(self._write_local_file(data), 4, 4,
+                                  test_utils.PATH)
+
+        self.assertEqual(self._get_sent_data(), data[4:8])
+        self.assertEqual(self._protocol.open_shell.call_count, 1)
+        self._protocol.close_shell.assert_not_called()
+        self.assertIsNone(self._client._shell_id)
+
+        # The shell is taken from the pool, which keeps it.
+        self._client._upload_part(self._write_local_file(data), 4, 4,
+                                  test_utils.PATH)
+        self.assertEqual(self._protocol.open_shell.call_count, 1)
+
+    def test_upload_part_retried(self):
+        data = b"0123456789ab"
+        self._set_remote_checksum(data[4:8])
+        self._client._upload = mock.Mock(side_effect=[
+            winrm_exceptions.WinRMTransportError("http", "fake-error"),
+            None])
+
+        self._client._upload_part(self._write_local_file(data), 4, 4,
+                                  test_utils.PATH,
+                                  policy=util.RetryPolicy(count=2, delay=0))
+
+        self.assertEqual(self._client._upload.call_count, 2)
+        self.assertEqual(self._protocol.open_shell.call_count, 2)
+        self._protocol.close_shell.assert_called_once_with(
+            test_utils.SHELL_ID)
+
+    def test_upload_part_failed(self):
+        self._client._upload = mock.Mock(side_effect=exceptions.ArgusError)
+
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._client._upload_part(
+                self._write_local_file(b"0123456789ab"), 4, 4,
+                test_utils.PATH, policy=util.RetryPolicy(count=2, delay=0))
+        self.assertEqual(self._client._upload.call_count, 2)
+
+    def test_file_range(self):
+        stream = six.BytesIO(b"0123456789ab")
+        file_range = windows._FileRange(stream, 4, 6)
+
+        self.assertEqual(file_range.read(2), b"45")
+        self.assertEqual(file_range.tell(), 2)
+        self.assertEqual(file_range.read(), b"6789")
+        self.assertEqual(file_range.read(), b"")
+        file_range.seek(0)
+        self.assertEqual(windows._get_size(file_range), 6)
+        file_range.seek(-1, os.SEEK_END)
+        self.assertEqual(file_range.read(10), b"9")
+
+    def _test_upload_cached(self, cached, remote_destination=None):
+        data = b"fake-script"
+        checksum = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self._tempdir, "script.ps1")
+        with open(path, "wb") as stream:
+            stream.write(data)
+        self._client.run_command_with_retry = mock.Mock(
+            return_value=(str(cached), "", 0))
+        self._client.copy_file = mock.Mock()
+        expected_destination = remote_destination or (
+            windows.UPLOAD_CACHE_DIRECTORY + "\\" + checksum + ".ps1")
+
+        result = self._client.upload_cached(path, remote_destination)
+
+        self.assertEqual(result, expected_destination)
+        self._client.run_command_with_retry.assert_called_once_with(
+            windows._CACHE_CHECK_SCRIPT.format(
+                path=windows._quote(expected_destination),
+                checksum=checksum),
+            command_type=util.POWERSHELL)
+        if cached:
+            self._client.copy_file.assert_not_called()
+        else:
+            self._client.copy_file.assert_called_once_with(
+                path, expected_destination)
+
+    def test_upload_cached_hit(self):
+        self._test_upload_cached(cached=True)
+
+    def test_upload_cached_miss(self):
+        self._test_upload_cached(cached=False)
+
+    def test_upload_cached_destination(self):
+        self._test_upload_cached(cached=False,
+                                 remote_destination=test_utils.PATH)
+
+    def test_quote(self):
+        self.assertEqual(windows._quote("C:\\it's"), "'C:\\it''s'")
+
+
+class WinRemoteClientDownloadTest(unittest.TestCase):
+    """Tests for downloading files with the Windows remote client."""
+
+    @mock.patch('argus.client.windows.get_windows_action_manager')
+    def setUp(self, _):
+        self._client = windows.WinRemoteClient(
+            test_utils.HOSTNAME, test_utils.USERNAME, test_utils.PASSWORD)
+        self._client.run_command = mock.Mock(side_effect=self._run_command)
+        self._content = b"\x00\x01binary\xff\r\ncontent"
+        self._ranges = []
+        self._tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tempdir)
+
+    def _run_command(self, script):
+        if "ComputeHash" in script:
+            checksum = hashlib.sha256(self._content).hexdigest().upper()
+            return "{} {}".format(len(self._content), checksum), "", 0
+
+        offset, length = (int(value) for value in re.search(
+            r"Seek\((\d+),.*byte\[\] (\d+)", script, re.DOTALL).groups())
+        self._ranges.append((offset, length))
+        data = self._content[offset:offset + length]
+        return base64.b64encode(data).decode(), "", 0
+
+    def test_download_file(self):
+        path = os.path.join(self._tempdir, "file")
+
+        size = self._client.download_file(test_utils.PATH, path, chunk_size=8)
+
+        self.assertEqual(size, len(self._content))
+        with open(path, "rb") as stream:
+            self.assertEqual(stream.read(), self._content)
+        self.assertEqual(self._ranges, [(0, 8), (8, 8), (16, 2)])
+
+    @mock.patch('time.sleep')
+    def test_download_resumed(self, _):
+        path = os.path.join(self._tempdir, "file")
+        # Reading the second range fails.
+        self._client.run_command.side_effect = self._failing_after(2)
+
+        self._client.download_file(test_utils.PATH, path, chunk_size=8)
+
+        with open(path, "rb") as stream:
+            self.assertEqual(stream.read(), self._content)
+        # The failed range is read again, but not the previous ones.
+        self.assertEqual(self._ranges, [(0, 8), (8, 8), (16, 2)])
+
+    def _failing_after(self, calls):
+        def side_effect(script):
+            side_effect.calls += 1
+            if side_effect.calls == calls + 1:
+                raise exceptions.ArgusError("fake-error")
+            return self._run_command(script)
+
+        side_effect.calls = 0
+        return side_effect
+
+    def test_download_checksum_mismatch(self):
+        self._client._get_file_info = mock.Mock(
+            return_value=(len(self._content), "fake-checksum"))
+
+        with self.assertRaises(exceptions.ArgusError):
+            self._client.download_file(
+                test_utils.PATH, os.path.join(self._tempdir, "file"))
+
+    def test_download_truncated(self):
+        self._client._get_file_info = mock.Mock(
+            return_value=(len(self._content) + 1, "fake-checksum"))
+
+        with self.assertRaises(exceptions.ArgusError):
+            self._client.download_file(
+                test_utils.PATH, os.path.join(self._tempdir, "file"),
+                policy=util.RetryPolicy(count=1))
+
+    def test_read_file(self):
+        self._content = u"\ufeffutf-16 content\r\n".encode("utf-16-le")
+
+        self.assertEqual(self._client.read_file(test_utils.PATH),
+                         u"utf-16 content")
+
+
+class WinRemoteClientStreamTest(unittest.TestCase):
+    """Tests for streaming the output of the commands."""
+
+    @mock.patch('argus.client.windows.get_windows_action_manager')
+    def setUp(self, _):
+        self._client = windows.WinRemoteClient(
+            test_utils.HOSTNAME, test_utils.USERNAME, test_utils.PASSWORD)
+        self._protocol = _get_protocol_mock()
+        self._protocol.get_command_output_raw.side_effect = [
+            (b"first li", b"", -1, False),
+            winrm_exceptions.WinRMOperationTimeoutError(),
+            (b"ne\r\nsecond line\r\nlast", b"warning\r\n", -1, False),
+            (b"", b"", 0, True),
+        ]
+        self._client._get_protocol = mock.Mock(return_value=self._protocol)
+        self._lines = []
+
+    def _on_line(self, stream, line):
+        self._lines.append((stream, line))
+
+    def test_iter_command_output(self):
+        output = list(self._client.iter_command_output(test_utils.CMD))
+
+        self.assertEqual(output, [
+            (windows.STDOUT, b"first li"),
+            (windows.STDOUT, b"ne\r\nsecond line\r\nlast"),
+            (windows.STDERR, b"warning\r\n"),
+        ])
+        self._protocol.cleanup_command.assert_called_once_with(
+            test_utils.SHELL_ID, test_utils.COMMAND_ID)
+
+    def test_iter_command_output_closed_early(self):
+        output = self._client.iter_command_output(test_utils.CMD)
+        next(output)
+        output.close()
+
+        self.assertEqual(
+            self._protocol.get_command_output_raw.call_count, 1)
+        self._protocol.cleanup_command.assert_called_once_with(
+            test_utils.SHELL_ID, test_utils.COMMAND_ID)
+
+    def test_stream_command(self):
+        result = self._client.stream_command(test_utils.CMD,
+                                             on_line=self._on_line)
+
+        self.assertEqual(result, "first line\nsecond line\nlast")
+        self.assertEqual(self._lines, [
+            (windows.STDOUT, "first line"),
+            (windows.STDOUT, "second line"),
+            (windows.STDERR, "warning"),
+            (windows.STDOUT, "last"),
+        ])
+
+    def test_stream_command_failed(self):
+        self._protocol.get_command_output_raw.side_effect = [
+            (b"fake-stdout\r\n", b"fake-stderr\r\n", 1, True)]
+
+        with self.assertRaises(exceptions.ArgusError) as context:
+            self._client.stream_command(test_utils.CMD)
+        self.assertIn("fake-stdout\\nfake-stderr", str(context.exception))
+
+    def test_stream_command_aborted(self):
+        def _on_line(stream, line):
+            raise exceptions.ArgusCLIError(line)
+
+        with self.assertRaises(exceptions.ArgusCLIError):
+            self._client.stream_command(test_utils.CMD, on_line=_on_line)
+        self.assertEqual(
+            self._protocol.get_command_output_raw.call_count, 3)
+        self._protocol.cleanup_command.assert_called_once_with(
+            test_utils.SHELL_ID, test_utils.COMMAND_ID)
+
+    @mock.patch('time.sleep')
+    def test_stream_command_with_retry(self, _):
+        self._client.stream_command = mock.Mock(side_effect=[
+            winrm_exceptions.WinRMTransportError("http", "fake-error"),
+            requests.ConnectionError, "fake-output"])
+
+        result = self._client.stream_command_with_retry(
+            test_utils.CMD, on_line=self._on_line, spool="fake.log")
+
+        self.assertEqual(result, "fake-output")
+        self.assertEqual(self._client.stream_command.call_count, 3)
+        self._client.stream_command.assert_called_with(
+            test_utils.CMD, command_type=util.POWERSHELL,
+            on_line=self._on_line, spool="fake.log")
+
+    @mock.patch('time.sleep')
+    def test_stream_command_with_retry_failed(self, _):
+        self._client.stream_command = mock.Mock(
+            side_effect=requests.ConnectionError)
+
+        with self.assertRaises(exceptions.ArgusTimeoutError):
+            self._client.stream_command_with_retry(
+                test_utils.CMD, policy=util.RetryPolicy(count=2, delay=0))
+        self.assertEqual(self._client.stream_command.call_count, 2)
+
+    @mock.patch('argus.client.windows.CONFIG')
+    def test_stream_command_spooled(self, mock_config):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        mock_config.argus.output_directory = directory
+
+        self._client.stream_command(test_utils.CMD, spool="fake.log")
+
+        with open(os.path.join(directory, "fake.log"), "rb") as stream:
+            self.assertEqual(stream.read(),
+                             b"first line\r\nsecond line\r\nlastwarning\r\n")
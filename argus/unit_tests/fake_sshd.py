@@ -0,0 +1,273 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A fake SSH server, for running the SSH client without an instance.
+
+The commands are run by the handlers of a
+:class:`argus.unit_tests.fake_wsman.FakeWSManServer`, which isn't
+started, and the SFTP requests work on the files of a
+:class:`argus.unit_tests.fake_wsman.FakeWindowsInstance`::
+
+    with FakeSSHServer("user", "password") as server:
+        client = server.get_client()
+        client.manager.mkdir(r"C:\\argus")
+        print(server.channels)
+"""
+
+# pylint: disable=protected-access
+
+import collections
+import io
+import os
+import socket
+import stat
+import threading
+
+import paramiko
+
+from argus.client import ssh
+from argus.unit_tests import fake_wsman
+from argus import util
+
+LOG = util.get_logger()
+
+# The number of seconds between the checks for stopping the server.
+SERVE_POLL_INTERVAL = 0.05
+
+
+def _get_windows_path(path):
+    """Get the Windows path of an SFTP path, like ``/C:/argus/file``."""
+    return path.lstrip("/").replace("/", "\\")
+
+
+class FakeSSHServer(object):
+    """An SSH server emulating the SSH service of an instance.
+
+    :param username:
+    :param password:
+        The credentials expected by the server.
+    :param instance:
+        The :class:`fake_wsman.FakeWindowsInstance` whose handlers
+        run the commands and whose files are used by SFTP.
+    """
+
+    def __init__(self, username, password, instance=None,
+                 host="127.0.0.1", port=0):
+        self.username = username
+        self.password = password
+        self.instance = instance or fake_wsman.FakeWindowsInstance()
+        self.commands = fake_wsman.FakeWSManServer(username, password)
+        self.instance.install(self.commands)
+        self.connections = 0
+        self.channels = collections.Counter()
+        self._host_key = paramiko.RSAKey.generate(2048)
+        self._transports = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self._socket.listen(5)
+        self._socket.settimeout(SERVE_POLL_INTERVAL)
+
+    @property
+    def host(self):
+        return self._socket.getsockname()[0]
+
+    @property
+    def port(self):
+        return self._socket.getsockname()[1]
+
+    def start(self):
+        """Serve the connections in a background thread."""
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+        LOG.debug("Fake SSH server listening on %s:%d.", self.host, self.port)
+
+    def stop(self):
+        """Close the connections and stop the server."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._socket.close()
+        self.drop_connections()
+        self.commands.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def get_client(self, **kwargs):
+        """Get an SSH client connected to this server."""
+        kwargs.setdefault("port", self.port)
+        return ssh.SSHRemoteClient(self.host, self.username, self.password,
+                                   **kwargs)
+
+    def add_handler(self, pattern, handler):
+        """Run the commands matching the regular expression with `handler`."""
+        self.commands.add_handler(pattern, handler)
+
+    def drop_connections(self):
+        """Close the connections opened so far, like a reboot would."""
+        with self._lock:
+            transports, self._transports = self._transports, []
+        for transport in transports:
+            transport.close()
+
+    def reset_stats(self):
+        """Forget the connections and the channels opened so far."""
+        with self._lock:
+            self.connections = 0
+            self.channels.clear()
+        self.commands.reset_stats()
+
+    def _serve(self):
+        while not self._stopped.is_set():
+            try:
+                sock, _ = self._socket.accept()
+            except socket.timeout:
+                continue
+            sock.settimeout(None)
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(self._host_key)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer,
+                                            _SFTPInterface, self)
+            with self._lock:
+                self.connections += 1
+                self._transports.append(transport)
+            transport.start_server(event=threading.Event(),
+                                   server=_ServerInterface(self))
+
+    def count_channel(self, kind):
+        with self._lock:
+            self.channels[kind] += 1
+
+    def run(self, channel, command_line):
+        """Run the command line, sending its output through the channel."""
+        command = fake_wsman.FakeCommand(
+            command_line, fake_wsman.decode_command(command_line))
+        self.commands.commands.append(command)
+        self.commands.start_command(command)
+        exit_code = None
+        while exit_code is None:
+            try:
+                output, exit_code = command.receive(fake_wsman.RECEIVE_TIMEOUT)
+            except fake_wsman.WSManFault:
+                continue
+            for stream, data in output:
+                if stream == fake_wsman.STDERR:
+                    channel.sendall_stderr(data)
+                else:
+                    channel.sendall(data)
+        channel.send_exit_status(exit_code)
+        # The channel is closed by the client, since closing it here
+        # could happen before the exec request gets its reply.
+        channel.shutdown_write()
+
+
+class _ServerInterface(paramiko.ServerInterface):
+
+    def __init__(self, server):
+        self._server = server
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if (username, password) == (self._server.username,
+                                    self._server.password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_subsystem_request(self, channel, name):
+        self._server.count_channel(name)
+        return super(_ServerInterface, self).check_channel_subsystem_request(
+            channel, name)
+
+    def check_channel_exec_request(self, channel, command):
+        self._server.count_channel("exec")
+        thread = threading.Thread(target=self._server.run,
+                                  args=(channel, command.decode("utf-8")))
+        thread.daemon = True
+        thread.start()
+        return True
+
+
+class _SFTPHandle(paramiko.SFTPHandle):
+
+    def __init__(self, instance, path, content, flags):
+        super(_SFTPHandle, self).__init__(flags)
+        self._instance = instance
+        self._path = path
+        self._writable = flags & (os.O_WRONLY | os.O_RDWR)
+        self._stream = io.BytesIO(content)
+        if flags & os.O_APPEND:
+            self._stream.seek(0, os.SEEK_END)
+        self.readfile = self.writefile = self._stream
+
+    def stat(self):
+        attributes = paramiko.SFTPAttributes()
+        attributes.st_size = len(self._stream.getvalue())
+        attributes.st_mode = stat.S_IFREG | 0o644
+        return attributes
+
+    def close(self):
+        if self._writable:
+            self._instance.add_file(self._path, self._stream.getvalue())
+        super(_SFTPHandle, self).close()
+
+
+class _SFTPInterface(paramiko.SFTPServerInterface):
+
+    def __init__(self, server, fake_server, *args, **kwargs):
+        super(_SFTPInterface, self).__init__(server, *args, **kwargs)
+        self._instance = fake_server.instance
+
+    def stat(self, path):
+        path = _get_windows_path(path)
+        attributes = paramiko.SFTPAttributes()
+        if self._instance._is_file(path):
+            content = self._instance.files[self._instance._normalize(path)]
+            attributes.st_size = len(content)
+            attributes.st_mode = stat.S_IFREG | 0o644
+        elif self._instance._is_dir(path):
+            attributes.st_mode = stat.S_IFDIR | 0o755
+        else:
+            return paramiko.SFTP_NO_SUCH_FILE
+        return attributes
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        path = _get_windows_path(path)
+        content = self._instance.files.get(self._instance._normalize(path))
+        if content is None:
+            if not flags & os.O_CREAT:
+                return paramiko.SFTP_NO_SUCH_FILE
+            content = b""
+        elif flags & os.O_TRUNC:
+            content = b""
+        return _SFTPHandle(self._instance, path, content, flags)
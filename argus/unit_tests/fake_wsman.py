@@ -0,0 +1,965 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A fake WS-Management server, for running the clients without an instance.
+
+The server implements the operations of the Windows remote shell used
+by :class:`argus.client.windows.WinRemoteClient` (Create, Command, Send,
+Receive, Signal and Delete), running the commands it receives through
+pluggable handlers. The latency, the throughput and the failures of
+the requests can be configured, and the requests are counted, so the
+behaviour and the cost of the clients, the action managers and the
+recipes can be measured offline::
+
+    with FakeWSManServer() as server:
+        FakeWindowsInstance().install(server)
+        client = server.get_client()
+        client.manager.mkdir(r"C:\\argus")
+        print(server.requests)
+"""
+
+import base64
+import collections
+import hashlib
+import json
+import ntpath
+import random
+import re
+import ssl
+import threading
+import time
+import uuid
+from xml.etree import ElementTree
+from xml.sax import saxutils
+
+import six
+# pylint: disable=import-error
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+from argus.client import runspace
+from argus.client import windows
+from argus import util
+
+LOG = util.get_logger()
+
+NAMESPACES = {
+    "s": "http://www.w3.org/2003/05/soap-envelope",
+    "a": "http://schemas.xmlsoap.org/ws/2004/08/addressing",
+    "x": "http://schemas.xmlsoap.org/ws/2004/09/transfer",
+    "w": "http://schemas.dmtf.org/wbem/wsman/1/wsman.xsd",
+    "rsp": "http://schemas.microsoft.com/wbem/wsman/1/windows/shell",
+    "f": "http://schemas.microsoft.com/wbem/wsman/1/wsmanfault",
+}
+
+STDOUT = "stdout"
+STDERR = "stderr"
+
+# The number of seconds a Receive request waits for some output,
+# when the request doesn't limit it even more.
+RECEIVE_TIMEOUT = 1
+
+# The number of seconds between the checks for stopping the server.
+SERVE_POLL_INTERVAL = 0.05
+
+# The WS-Management fault codes of the errors raised by the server.
+FAULT_OPERATION_TIMEOUT = 2150858793
+FAULT_SHELL_NOT_FOUND = 2150858843
+
+_COMMAND_STATE = NAMESPACES["rsp"] + "/CommandState/{}"
+
+_ENVELOPE = (
+    '<s:Envelope xmlns:s="{s}" xmlns:a="{a}" xmlns:x="{x}" xmlns:w="{w}"'
+    ' xmlns:rsp="{rsp}" xmlns:f="{f}">'
+    '<s:Header><a:RelatesTo>{{relates_to}}</a:RelatesTo></s:Header>'
+    '<s:Body>{{body}}</s:Body></s:Envelope>').format(**NAMESPACES)
+
+_CREATED = (
+    '<x:ResourceCreated><a:ReferenceParameters><w:SelectorSet>'
+    '<w:Selector Name="ShellId">{shell_id}</w:Selector>'
+    '</w:SelectorSet></a:ReferenceParameters></x:ResourceCreated>')
+
+_FAULT = (
+    '<s:Fault><s:Code><s:Value>s:Receiver</s:Value></s:Code>'
+    '<s:Reason><s:Text xml:lang="en-US">{reason}</s:Text></s:Reason>'
+    '<s:Detail><f:WSManFault Code="{code}" Machine="argus">'
+    '<f:Message>{reason}</f:Message></f:WSManFault></s:Detail></s:Fault>')
+
+# Matches the opening of a file by the download scripts.
+_FILE_STREAM = (r"^\s*\$ErrorActionPreference = \"Stop\"\s*"
+                r"\$stream = New-Object System\.IO\.FileStream\("
+                r"'((?:[^']|'')*)'")
+
+# Matches the path given to the scripts of the action manager
+# checking a path and acting on it in a single command.
+_PATH_SCRIPT = r"^\$path = '((?:[^']|'')*)'; "
+
+# Matches a list of paths given to the scripts of the action manager,
+# whose paths are found by `_QUOTED_PATH`.
+_PATH_LIST = r"((?:'(?:[^']|'')*',?)*)"
+_QUOTED_PATH = re.compile(r"'((?:[^']|'')*)'")
+
+# The Windows file time of the Unix epoch, in 100 nanoseconds units.
+_FILE_TIME_EPOCH = 116444736000000000
+
+_POWERSHELL_ENCODED = re.compile(r"^powershell .*-EncodedCommand (\S+)$",
+                                 re.IGNORECASE)
+
+
+def _find(element, path):
+    return element.find(path, NAMESPACES)
+
+
+def _b64encode(data):
+    encoded = base64.b64encode(data)
+    if six.PY3:
+        encoded = encoded.decode()
+    return encoded
+
+
+def decode_command(command_line):
+    """Get the PowerShell script run by the command, if any."""
+    match = _POWERSHELL_ENCODED.match(command_line)
+    if match:
+        return base64.b64decode(match.group(1)).decode("UTF-16LE")
+    return None
+
+
+class WSManFault(Exception):
+    """A fault returned to the client instead of a response."""
+
+    def __init__(self, code, reason):
+        super(WSManFault, self).__init__(reason)
+        self.code = code
+        self.reason = reason
+
+
+class FakeCommand(object):
+    """A command running in a shell of the fake server.
+
+    The handlers write the output of the command with :meth:`write`
+    and end it with :meth:`finish`. The ones expecting input set
+    :attr:`on_input` to a callable receiving the data sent to the
+    command and whether the input was closed.
+
+    :param command_line:
+        The command line received by the server.
+    :param script:
+        The PowerShell script run by the command, if any.
+    """
+
+    def __init__(self, command_line, script=None):
+        self.command_id = str(uuid.uuid4()).upper()
+        self.command_line = command_line
+        self.script = script
+        self.stdin = b""
+        self.exit_code = None
+        self.on_input = None
+        self._output = collections.deque()
+        self._condition = threading.Condition()
+
+    @property
+    def text(self):
+        """The script of the command or its command line."""
+        return self.command_line if self.script is None else self.script
+
+    def write(self, data, stream=STDOUT):
+        """Add some output to the given stream of the command."""
+        if isinstance(data, six.text_type):
+            data = data.encode("utf-8")
+        with self._condition:
+            self._output.append((stream, data))
+            self._condition.notify_all()
+
+    def finish(self, exit_code=0):
+        """End the command with the given exit code."""
+        with self._condition:
+            self.exit_code = exit_code
+            self._condition.notify_all()
+
+    def send(self, data, end):
+        """Pass the input sent by the client to the command."""
+        self.stdin += data
+        if self.on_input is not None:
+            self.on_input(data, end)
+
+    def receive(self, timeout):
+        """Wait for the output of the command.
+
+        Return the chunks of output available, together with the
+        exit code of the command, which is None if it's still running.
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while not self._output and self.exit_code is None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise WSManFault(FAULT_OPERATION_TIMEOUT,
+                                     "The WS-Management service cannot "
+                                     "complete the operation within the "
+                                     "time specified in OperationTimeout.")
+                self._condition.wait(remaining)
+            output = list(self._output)
+            self._output.clear()
+            return output, self.exit_code
+
+
+class RunspaceHost(object):
+    """Emulates the PowerShell host of :mod:`argus.client.runspace`.
+
+    The scripts sent to the host are run by the handlers of the server,
+    as if they were received in separate commands.
+    """
+
+    def __init__(self, server):
+        self._server = server
+
+    def __call__(self, command, match):
+        buffer = [b""]
+
+        def on_input(data, end):
+            buffer[0] += data
+            while b"\r\n" in buffer[0]:
+                request, buffer[0] = buffer[0].split(b"\r\n", 1)
+                self._handle(command, request)
+            if end:
+                command.finish(0)
+
+        command.on_input = on_input
+
+    def _handle(self, command, request):
+        request_id, payload = request.decode().split(" ", 1)
+        script = base64.b64decode(payload).decode("utf-8")
+        stdout, stderr, exit_code = self._server.run_script(script)
+        command.write("{} {} {} {} {}\r\n".format(
+            runspace.RESPONSE_MARKER, request_id, exit_code,
+            _b64encode(stdout), _b64encode(stderr)))
+
+
+class WaitRunner(object):
+    """Emulates the scripts waiting for a condition on the instance.
+
+    The waited command is run by the handlers of the server, but only
+    the conditions comparing its trimmed output with a string are
+    supported, like ``$output.Trim() -eq 'Stopped'``.
+    """
+
+    PATTERN = (r"^\s*\$ErrorActionPreference = \"Stop\"\s*"
+               r"\$deadline = \[DateTime\]::UtcNow\.AddSeconds\(([\d.]+)\)"
+               r".*\$output = \((.*)\) \| Out-String\s*"
+               r"\$met = \[bool\]\((.*)\)\s*\}.*"
+               r"Start-Sleep -Milliseconds (\d+)")
+    CONDITION = re.compile(r"^\$output\.Trim\(\) -eq '([^']*)'$")
+
+    def __init__(self, server):
+        self._server = server
+
+    def __call__(self, command, match):
+        timeout, script, condition, interval = match.groups()
+        expected = self.CONDITION.match(condition)
+        if not expected:
+            return "", "Unsupported condition {!r}.".format(condition), 1
+
+        thread = threading.Thread(
+            target=self._wait,
+            args=(command, script, expected.group(1).lower(),
+                  time.time() + float(timeout), int(interval) / 1000.0))
+        thread.daemon = True
+        thread.start()
+
+    def _wait(self, command, script, expected, deadline, interval):
+        while True:
+            stdout, _, exit_code = self._server.run_script(script)
+            output = stdout.decode("utf-8") if not exit_code else ""
+            met = output.strip().lower() == expected
+            if met or time.time() >= deadline:
+                break
+            time.sleep(max(min(interval, deadline - time.time()), 0))
+        command.write(u"{}\n{}".format(met, output))
+        command.finish(0)
+
+
+class FakeWSManServer(object):
+    """An HTTP server emulating the WinRM service of an instance.
+
+    The commands are run by the first handler, in the reverse order
+    of their registration, whose pattern matches the PowerShell script
+    of the command or its command line. A handler is called with the
+    :class:`FakeCommand` and the match object, returning a tuple of
+    output, errors and exit code or None, if it handles the command
+    by itself. The commands without a handler fail, like the unknown
+    commands of CMD.
+
+    :param username:
+    :param password:
+        The credentials expected by the server, if any.
+    :param latency:
+        The number of seconds each request is delayed with.
+    :param bandwidth:
+        The maximum number of bytes transferred per second.
+    :param failure_rate:
+        The probability for a request to fail with an HTTP error.
+    :param receive_timeout:
+        The maximum number of seconds a Receive request waits
+        for the output of a command.
+    :param seed:
+        The seed for choosing the requests which fail.
+    :param certfile:
+    :param keyfile:
+        The certificate and its key in PEM format, for serving
+        the requests over HTTPS.
+    """
+
+    def __init__(self, username=None, password=None, host="127.0.0.1",
+                 port=0, latency=0, bandwidth=None, failure_rate=0,
+                 receive_timeout=RECEIVE_TIMEOUT, seed=None,
+                 certfile=None, keyfile=None):
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.receive_timeout = receive_timeout
+        self.shells = {}
+        self.commands = []
+        self.requests = collections.Counter()
+        self.handshakes = collections.Counter()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self._random = random.Random(seed)
+        self._failures = collections.deque()
+        self._handlers = []
+        self._lock = threading.RLock()
+        self._thread = None
+        self._httpd = _HTTPServer((host, port), _RequestHandler)
+        self._httpd.wsman = self
+        if certfile is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self._httpd.ssl_context = context
+        self.add_handler(
+            re.escape(decode_command(runspace.get_host_command())) + "$",
+            RunspaceHost(self))
+        self.add_handler(WaitRunner.PATTERN, WaitRunner(self))
+
+    @property
+    def host(self):
+        return self._httpd.server_address[0]
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    @property
+    def scheme(self):
+        return "http" if self._httpd.ssl_context is None else "https"
+
+    @property
+    def endpoint(self):
+        return "{}://{}:{}/wsman".format(self.scheme, self.host, self.port)
+
+    def start(self):
+        """Serve the requests in a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        args=(SERVE_POLL_INTERVAL, ))
+        self._thread.daemon = True
+        self._thread.start()
+        LOG.debug("Fake WS-Management server listening on %s.",
+                  self.endpoint)
+
+    def stop(self):
+        """Stop serving the requests and close the server."""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def get_client(self, **kwargs):
+        """Get a Windows client connected to this server."""
+        kwargs.setdefault("port", self.port)
+        kwargs.setdefault("transport_protocol", self.scheme)
+        return windows.WinRemoteClient(self.host, self.username,
+                                       self.password, **kwargs)
+
+    def add_handler(self, pattern, handler):
+        """Run the commands matching the regular expression with `handler`."""
+        with self._lock:
+            self._handlers.insert(0, (re.compile(pattern, re.DOTALL),
+                                      handler))
+
+    def inject_failure(self, action=None, count=1, status=500):
+        """Fail the next requests for the action with an HTTP error.
+
+        :param action:
+            The name of the operation, like ``Receive``, or None
+            for failing any request.
+        """
+        with self._lock:
+            self._failures.extend([(action, status)] * count)
+
+    def count_handshake(self, resumed):
+        """Count a TLS handshake, resuming a session or a full one."""
+        with self._lock:
+            self.handshakes["resumed" if resumed else "full"] += 1
+
+    def reset_stats(self):
+        """Forget the requests and the commands received so far."""
+        with self._lock:
+            self.requests.clear()
+            self.handshakes.clear()
+            self.commands = []
+            self.bytes_received = self.bytes_sent = 0
+
+    def _get_handler(self, text):
+        with self._lock:
+            handlers = list(self._handlers)
+        for pattern, handler in handlers:
+            match = pattern.match(text)
+            if match:
+                return handler, match
+        return None, None
+
+    def start_command(self, command):
+        """Run the command with its handler, in the background if needed."""
+        handler, match = self._get_handler(command.text)
+        if handler is None:
+            command.write("'{}' is not recognized as an internal or "
+                          "external command.".format(command.text), STDERR)
+            command.finish(1)
+            return
+
+        try:
+            result = handler(command, match)
+        except Exception as exc:  # pylint: disable=broad-except
+            LOG.exception("The handler of %r failed.", command.text)
+            result = "", str(exc), 1
+        if result is not None:
+            stdout, stderr, exit_code = result
+            if stdout:
+                command.write(stdout)
+            if stderr:
+                command.write(stderr, STDERR)
+            command.finish(exit_code)
+
+    def run_script(self, script):
+        """Run a PowerShell script through the handlers.
+
+        Return the output, the errors and the exit code of the script.
+        """
+        command = FakeCommand(script, script)
+        self.start_command(command)
+        output, exit_code = command.receive(0)
+        streams = {STDOUT: b"", STDERR: b""}
+        for stream, data in output:
+            streams[stream] += data
+        return streams[STDOUT], streams[STDERR], exit_code or 0
+
+    def check_failure(self, action):
+        """Get the HTTP status the request should fail with, if any."""
+        with self._lock:
+            for index, (failed_action, status) in enumerate(self._failures):
+                if failed_action in (None, action):
+                    del self._failures[index]
+                    return status
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                return 500
+        return None
+
+    def delay(self, size):
+        """Wait as much as the transfer of the given number of bytes takes."""
+        delay = self.latency
+        if self.bandwidth:
+            delay += float(size) / self.bandwidth
+        if delay:
+            time.sleep(delay)
+
+    def _get_shell(self, request):
+        selector = _find(request, ".//w:Selector[@Name='ShellId']")
+        shell_id = selector.text if selector is not None else None
+        with self._lock:
+            if shell_id not in self.shells:
+                raise WSManFault(FAULT_SHELL_NOT_FOUND,
+                                 "The request for the Windows Remote Shell "
+                                 "with ShellId {} failed because the shell "
+                                 "was not found on the server.".format(
+                                     shell_id))
+            return self.shells[shell_id]
+
+    def _get_command(self, request, element):
+        shell = self._get_shell(request)
+        command_id = element.get("CommandId")
+        try:
+            return shell[command_id]
+        except KeyError:
+            raise WSManFault(FAULT_SHELL_NOT_FOUND,
+                             "The command {} was not found.".format(
+                                 command_id))
+
+    @staticmethod
+    def _get_operation_timeout(request):
+        timeout = _find(request, ".//w:OperationTimeout")
+        if timeout is None:
+            return None
+        return float(timeout.text.strip("PTS"))
+
+    def handle(self, action, request):
+        """Handle a WS-Management request, returning the response body."""
+        with self._lock:
+            self.requests[action] += 1
+        method = getattr(self, "_handle_" + action.lower(), None)
+        if method is None:
+            raise WSManFault(FAULT_SHELL_NOT_FOUND,
+                             "Unsupported action {}.".format(action))
+        return method(request)
+
+    def _handle_create(self, _):
+        shell_id = str(uuid.uuid4()).upper()
+        with self._lock:
+            self.shells[shell_id] = {}
+        return _CREATED.format(shell_id=shell_id)
+
+    def _handle_delete(self, request):
+        self._get_shell(request)
+        selector = _find(request, ".//w:Selector[@Name='ShellId']")
+        with self._lock:
+            del self.shells[selector.text]
+        return ""
+
+    def _handle_command(self, request):
+        shell = self._get_shell(request)
+        command_line = _find(request, ".//rsp:Command").text or ""
+        command = FakeCommand(command_line, decode_command(command_line))
+        with self._lock:
+            shell[command.command_id] = command
+            self.commands.append(command)
+        self.start_command(command)
+        return ("<rsp:CommandResponse><rsp:CommandId>{}</rsp:CommandId>"
+                "</rsp:CommandResponse>".format(command.command_id))
+
+    def _handle_send(self, request):
+        stream = _find(request, ".//rsp:Stream")
+        command = self._get_command(request, stream)
+        command.send(base64.b64decode(stream.text or ""),
+                     stream.get("End") == "true")
+        return "<rsp:SendResponse/>"
+
+    def _handle_receive(self, request):
+        desired = _find(request, ".//rsp:DesiredStream")
+        command = self._get_command(request, desired)
+        timeout = self.receive_timeout
+        operation_timeout = self._get_operation_timeout(request)
+        if operation_timeout is not None:
+            timeout = min(timeout, operation_timeout)
+
+        output, exit_code = command.receive(timeout)
+        streams = [
+            '<rsp:Stream Name="{}" CommandId="{}">{}</rsp:Stream>'.format(
+                stream, command.command_id, _b64encode(data))
+            for stream, data in output]
+        if exit_code is None:
+            state = '<rsp:CommandState CommandId="{}" State="{}"/>'.format(
+                command.command_id, _COMMAND_STATE.format("Running"))
+        else:
+            state = ('<rsp:CommandState CommandId="{}" State="{}">'
+                     '<rsp:ExitCode>{}</rsp:ExitCode></rsp:CommandState>'
+                     .format(command.command_id,
+                             _COMMAND_STATE.format("Done"), exit_code))
+        return "<rsp:ReceiveResponse>{}{}</rsp:ReceiveResponse>".format(
+            "".join(streams), state)
+
+    def _handle_signal(self, request):
+        signal = _find(request, ".//rsp:Signal")
+        command = self._get_command(request, signal)
+        with self._lock:
+            self._get_shell(request).pop(command.command_id, None)
+        if command.exit_code is None:
+            command.finish(-1)
+        return "<rsp:SignalResponse/>"
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    ssl_context = None
+
+    def get_request(self):
+        sock, address = BaseHTTPServer.HTTPServer.get_request(self)
+        if self.ssl_context is None:
+            return sock, address
+        try:
+            sock = self.ssl_context.wrap_socket(sock, server_side=True)
+        except Exception:
+            sock.close()
+            raise
+        self.wsman.count_handshake(sock.session_reused)
+        return sock, address
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keep the connections alive, like the WinRM service.
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are written separately, so don't let
+    # them wait for each other.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        LOG.debug("Fake WS-Management server: " + format, *args)
+
+    def _is_authorized(self, server):
+        if server.username is None:
+            return True
+        credentials = "{}:{}".format(server.username, server.password)
+        expected = "Basic " + _b64encode(credentials.encode())
+        return self.headers.get("Authorization") == expected
+
+    def _send(self, status, body, content_type="application/soap+xml"):
+        if isinstance(body, six.text_type):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type",
+                         "{};charset=UTF-8".format(content_type))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return len(body)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        server = self.server.wsman
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self._is_authorized(server):
+            self._send(401, "", "text/plain")
+            return
+
+        request = ElementTree.fromstring(data)
+        action = _find(request, ".//a:Action").text.rsplit("/", 1)[-1]
+        message_id = _find(request, ".//a:MessageID").text
+        failure = server.check_failure(action)
+        if failure is not None:
+            server.delay(len(data))
+            self._send(failure, "Injected failure of {}.".format(action),
+                       "text/plain")
+            return
+
+        status = 200
+        try:
+            body = server.handle(action, request)
+        except WSManFault as fault:
+            status = 500
+            body = _FAULT.format(code=fault.code,
+                                 reason=saxutils.escape(fault.reason))
+        response = _ENVELOPE.format(relates_to=message_id, body=body)
+        server.delay(len(data) + len(response))
+        sent = self._send(status, response)
+        with server._lock:  # pylint: disable=protected-access
+            server.bytes_received += len(data)
+            server.bytes_sent += sent
+
+
+class FakeWindowsInstance(object):
+    """The state of a fake instance, changed by the commands it runs.
+
+    :meth:`install` registers the handlers of the commands issued by
+    :class:`argus.action_manager.windows.WindowsActionManager` and by
+    the introspection of the instance.
+    """
+
+    def __init__(self, major=6, minor=3, product_type=3,
+                 architecture="AMD64", nano_server=False,
+                 powershell_version="4.0"):
+        self.os_version = {"Major": major, "Minor": minor}
+        self.product_type = product_type
+        self.architecture = architecture
+        self.nano_server = nano_server
+        self.powershell_version = powershell_version
+        self.files = {}
+        self.directories = {"c:", r"c:\program files",
+                            r"c:\program files (x86)"}
+        self.modified = {}
+        self.services = {}
+        self.cloned = []
+        self.max_shells_per_user = 30
+        self.max_operations_per_user = 1500
+
+    @staticmethod
+    def _normalize(path):
+        return path.rstrip("\\").lower()
+
+    def _is_file(self, path):
+        return self._normalize(path) in self.files
+
+    def _is_dir(self, path):
+        return self._normalize(path) in self.directories
+
+    def _add_parents(self, path):
+        parent = self._normalize(ntpath.dirname(path))
+        while parent not in self.directories and parent != path:
+            self.directories.add(parent)
+            path, parent = parent, self._normalize(ntpath.dirname(parent))
+
+    def add_file(self, path, content=b""):
+        """Create a file, with all its parent directories."""
+        path = self._normalize(path)
+        self._add_parents(path)
+        self.files[path] = content
+        self.modified[path] = time.time()
+
+    def add_directory(self, path):
+        """Create a directory, with all its parent directories."""
+        path = self._normalize(path)
+        self._add_parents(path)
+        self.directories.add(path)
+        self.modified.setdefault(path, time.time())
+
+    def _remove(self, path):
+        path = self._normalize(path)
+        prefix = path + "\\"
+        self.files = {item: content for item, content in self.files.items()
+                      if item != path and not item.startswith(prefix)}
+        self.directories = {item for item in self.directories
+                            if item != path and not item.startswith(prefix)}
+        self.modified = {item: modified
+                         for item, modified in self.modified.items()
+                         if item != path and not item.startswith(prefix)}
+
+    def install(self, server):
+        """Register the handlers of this instance on the server."""
+        handlers = [
+            (r"^echo '(.*)'$", self._echo),
+            (r"^\[System\.Environment\]::OSVersion\.Version\.(\w+)$",
+             self._os_version),
+            (r".*function ConvertTo-JsonValue.*\$PSVersionTable",
+             self._os_fingerprint),
+            (r"^\$version = \[System\.Environment\]::OSVersion\.Version; "
+             r"\"\{0\} \{1\} \{2\}\"", self._os_check),
+            (r"^\$ENV:PROCESSOR_ARCHITECTURE$", self._architecture),
+            (r"^powershell \"\$ENV:ProgramFiles\"$", self._program_files),
+            (r"^powershell \"\$\{ENV:ProgramFiles\(x86\)\}\"$",
+             self._program_files),
+            (r"^\(Get-Item WSMan:\\localhost\\MaxEnvelopeSizekb\)\.Value$",
+             self._max_envelope_size),
+            (r"^\(Get-Item WSMan:\\localhost\\Shell\\MaxShellsPerUser\)"
+             r"\.Value; \(Get-Item WSMan:\\localhost\\Service"
+             r"\\MaxConcurrentOperationsPerUser\)\.Value$",
+             self._user_limits),
+            (r"^Test-Path (?:-PathType (\w+) )?(?:-Path )?\"([^\"]*)\"$",
+             self._test_path),
+            (_PATH_SCRIPT + r"\$item = Get-Item", self._stat),
+            (r"^(?:\$maxSize = (\d+); )?foreach \(\$path in @\(" +
+             _PATH_LIST + r"\)\) \{ (\$item = Get-Item.*)\}$",
+             self._stat_many),
+            (r"^@\(@\(" + _PATH_LIST + r"\) \| Where-Object \{ -not "
+             r"\(Test-Path -LiteralPath \$_\) \}\)\.Count$",
+             self._count_missing),
+            (_PATH_SCRIPT + r"if \(Test-Path -PathType (Leaf|Container) "
+             r"-LiteralPath \$path\) \{ Remove-Item", self._remove_item),
+            (_PATH_SCRIPT + r"if \(Test-Path -PathType Container "
+             r"-LiteralPath \$path\) \{ 'Directory' \} elseif "
+             r"\(Test-Path -LiteralPath \$path\) \{ 'Exists' \}",
+             self._mkdir),
+            (_PATH_SCRIPT + r"if \(Test-Path -PathType Container "
+             r"-LiteralPath \$path\) \{ 'Directory' \} elseif "
+             r"\(Test-Path -PathType Leaf", self._mkfile),
+            (_PATH_SCRIPT + r"if \(Test-Path -LiteralPath \$path\) "
+             r"\{ \$item = Get-Item", self._touch),
+            (r"^git clone '([^']*)' '([^']*)'$", self._git_clone),
+            (r"^\(Get-Service \| where \{\$_\.Name -match "
+             r"\"([^\"]*)\"\}\)\.Status$", self._service_status),
+            (_FILE_STREAM + r".*ComputeHash", self._file_info),
+            (_FILE_STREAM + r".*Seek\((\d+),.*byte\[\] (\d+)",
+             self._read_range),
+        ]
+        for pattern, handler in handlers:
+            server.add_handler(pattern, handler)
+
+    @staticmethod
+    def _echo(_, match):
+        return match.group(1) + "\r\n", "", 0
+
+    def _os_version(self, _, match):
+        return "{}\r\n".format(self.os_version[match.group(1)]), "", 0
+
+    def _os_fingerprint(self, *_):
+        x86 = self.architecture == "x86"
+        facts = {
+            "major": self.os_version["Major"],
+            "minor": self.os_version["Minor"],
+            "product_type": self.product_type,
+            "nano_server": self.nano_server,
+            "architecture": self.architecture,
+            "program_files": "C:\\Program Files",
+            "program_files_x86": None if x86 else "C:\\Program Files (x86)",
+            "powershell_version": self.powershell_version,
+        }
+        return json.dumps(facts) + "\r\n", "", 0
+
+    def _os_check(self, *_):
+        return "{} {} {}\r\n".format(
+            self.os_version["Major"], self.os_version["Minor"],
+            self.architecture), "", 0
+
+    def _architecture(self, *_):
+        return self.architecture + "\r\n", "", 0
+
+    @staticmethod
+    def _program_files(_, match):
+        if "x86" in match.group(0):
+            return "C:\\Program Files (x86)\r\n", "", 0
+        return "C:\\Program Files\r\n", "", 0
+
+    @staticmethod
+    def _max_envelope_size(*_):
+        return "500\r\n", "", 0
+
+    def _user_limits(self, *_):
+        return "{}\r\n{}\r\n".format(self.max_shells_per_user,
+                                     self.max_operations_per_user), "", 0
+
+    def _test_path(self, _, match):
+        path_type, path = match.groups()
+        path = re.sub(r"`(.)", r"\1", path)
+        if path.lower().startswith("hklm:"):
+            exists = self.nano_server
+        elif path_type == "Leaf":
+            exists = self._is_file(path)
+        elif path_type == "Container":
+            exists = self._is_dir(path)
+        else:
+            exists = self._is_file(path) or self._is_dir(path)
+        return "{}\r\n".format(exists), "", 0
+
+    @staticmethod
+    def _get_path(match):
+        return match.group(1).replace("''", "'")
+
+    def _get_stat(self, path):
+        if self._is_file(path):
+            item_type = "File"
+            size = len(self.files[self._normalize(path)])
+        elif self._is_dir(path):
+            item_type, size = "Directory", 0
+        else:
+            return "Missing"
+        modified = self.modified.get(self._normalize(path), 0)
+        file_time = int(modified * 10 ** 7)
+        return "{} {} {}".format(item_type, size,
+                                 file_time + _FILE_TIME_EPOCH)
+
+    def _stat(self, _, match):
+        return self._get_stat(self._get_path(match)) + "\r\n", "", 0
+
+    def _stat_many(self, _, match):
+        max_size, paths, script = match.groups()
+        lines = []
+        for path in _QUOTED_PATH.findall(paths):
+            path = path.replace("''", "'")
+            line = self._get_stat(path)
+            if "ToBase64String" in script and self._is_file(path):
+                content = self.files[self._normalize(path)]
+                line += " " + _b64encode(content[:int(max_size)])
+            lines.append(line + "\r\n")
+        return "".join(lines), "", 0
+
+    def _count_missing(self, _, match):
+        paths = [path.replace("''", "'")
+                 for path in _QUOTED_PATH.findall(match.group(1))]
+        missing = [path for path in paths
+                   if not (self._is_file(path) or self._is_dir(path))]
+        return "{}\r\n".format(len(missing)), "", 0
+
+    def _remove_item(self, _, match):
+        path = self._get_path(match)
+        exists = self._is_file if match.group(2) == "Leaf" else self._is_dir
+        if not exists(path):
+            if self._is_file(path) or self._is_dir(path):
+                return "Invalid\r\n", "", 0
+            return "Missing\r\n", "", 0
+        self._remove(path)
+        return "Done\r\n", "", 0
+
+    def _mkdir(self, _, match):
+        path = self._get_path(match)
+        if self._is_dir(path):
+            return "Directory\r\n", "", 0
+        if self._is_file(path):
+            return "Exists\r\n", "", 0
+        self.add_directory(path)
+        return "Done\r\n", "", 0
+
+    def _mkfile(self, _, match):
+        path = self._get_path(match)
+        if self._is_dir(path):
+            return "Directory\r\n", "", 0
+        if self._is_file(path):
+            self.modified[self._normalize(path)] = time.time()
+            return "File\r\n", "", 0
+        self.add_file(path)
+        return "Done\r\n", "", 0
+
+    def _touch(self, _, match):
+        path = self._get_path(match)
+        if self._is_file(path) or self._is_dir(path):
+            self.modified[self._normalize(path)] = time.time()
+        else:
+            self.add_file(path)
+        return "Done\r\n", "", 0
+
+    def _git_clone(self, _, match):
+        repo, location = match.groups()
+        if self._is_file(location) or self._is_dir(location):
+            return "", ("fatal: destination path '{}' already "
+                        "exists.".format(location)), 128
+        self.add_directory(location)
+        self.cloned.append(repo)
+        return "Cloning into '{}'...\r\n".format(location), "", 0
+
+    def _get_content(self, path):
+        path = path.replace("''", "'")
+        if not self._is_file(path):
+            raise ValueError("Could not find file '{}'.".format(path))
+        return self.files[self._normalize(path)]
+
+    def _file_info(self, _, match):
+        content = self._get_content(match.group(1))
+        return "{} {}\r\n".format(
+            len(content), hashlib.sha256(content).hexdigest().upper()), "", 0
+
+    def _read_range(self, _, match):
+        path, offset, length = match.groups()
+        content = self._get_content(path)
+        offset = int(offset)
+        return _b64encode(content[offset:offset + int(length)]), "", 0
+
+    def _service_status(self, _, match):
+        pattern = re.compile(match.group(1), re.IGNORECASE)
+        statuses = [status for name, status in sorted(self.services.items())
+                    if pattern.search(name)]
+        return "".join(status + "\r\n" for status in statuses), "", 0
+
+
+def count_requests(server, func, *args, **kwargs):
+    """Call `func`, returning its result and the requests it made."""
+    before = collections.Counter(server.requests)
+    result = func(*args, **kwargs)
+    requests = collections.Counter(server.requests)
+    requests.subtract(before)
+    return result, +requests
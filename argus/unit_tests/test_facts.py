@@ -0,0 +1,114 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from argus.introspection import facts
+from argus.unit_tests import test_utils
+
+
+class FactsStoreTest(unittest.TestCase):
+    """Tests for the persistent store of the image facts."""
+
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tempdir)
+        self._path = os.path.join(self._tempdir, "facts", "facts.json")
+        self._store = facts.FactsStore(self._path)
+
+    def test_persisted(self):
+        self._store.set("image", "cbinit_dir", r"C:\Cloudbase-Init")
+        self._store.set("other-image", "cbinit_dir", r"D:\Cloudbase-Init")
+
+        store = facts.FactsStore(self._path)
+        self.assertEqual(store.get("image", "cbinit_dir"),
+                         r"C:\Cloudbase-Init")
+        self.assertEqual(store.get("other-image", "cbinit_dir"),
+                         r"D:\Cloudbase-Init")
+
+        store.discard("image", "cbinit_dir")
+        self.assertIsNone(self._store.get("image", "cbinit_dir"))
+
+    def test_invalid_file_ignored(self):
+        os.makedirs(os.path.dirname(self._path))
+        with open(self._path, "w") as stream:
+            stream.write("{invalid")
+
+        self.assertIsNone(self._store.get("image", "cbinit_dir"))
+        self._store.set("image", "cbinit_dir", r"C:\Cloudbase-Init")
+        self.assertEqual(self._store.get("image", "cbinit_dir"),
+                         r"C:\Cloudbase-Init")
+
+    def test_lookup(self):
+        image_facts = self._store.get_facts("image")
+        compute = mock.Mock(return_value="first")
+        check = mock.Mock(return_value=True)
+
+        self.assertEqual(image_facts.lookup("fact", compute, check), "first")
+        self.assertEqual(image_facts.lookup("fact", compute, check), "first")
+        compute.assert_called_once_with()
+        check.assert_called_once_with("first")
+
+    def test_lookup_stale(self):
+        image_facts = self._store.get_facts("image")
+        self._store.set("image", "fact", "stale")
+        compute = mock.Mock(return_value="fresh")
+
+        value = image_facts.lookup("fact", compute, lambda value: False)
+
+        self.assertEqual(value, "fresh")
+        self.assertEqual(self._store.get("image", "fact"), "fresh")
+
+    def test_lookup_not_found(self):
+        image_facts = self._store.get_facts("image")
+        self._store.set("image", "fact", "known")
+        compute = mock.Mock(side_effect=[ValueError, None])
+
+        with self.assertRaises(ValueError):
+            image_facts.lookup("fact", compute, lambda value: False)
+        self.assertIsNone(
+            image_facts.lookup("fact", compute, lambda value: False))
+        # Not finding the fact on the instance doesn't make it stale.
+        self.assertEqual(self._store.get("image", "fact"), "known")
+
+    def test_lookup_not_rewritten(self):
+        image_facts = self._store.get_facts("image")
+        self._store.set("image", "fact", "known")
+
+        with mock.patch.object(self._store, "_dump") as mock_dump:
+            value = image_facts.lookup("fact", lambda: "known",
+                                       lambda value: False)
+
+        self.assertEqual(value, "known")
+        mock_dump.assert_not_called()
+
+    def test_get_image_facts(self):
+        with test_utils.ConfPatcher("facts_file", None, "argus"), \
+                test_utils.ConfPatcher("output_directory", None, "argus"):
+            self.assertIsNone(facts.get_image_facts())
+
+        with test_utils.ConfPatcher("facts_file", self._path, "argus"):
+            image_facts = facts.get_image_facts()
+            image_facts.lookup("fact", lambda: "value", None)
+        self.assertEqual(self._store.get(facts.get_image_key(), "fact"),
+                         "value")
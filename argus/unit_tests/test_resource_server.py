@@ -0,0 +1,135 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from concurrent import futures
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+import requests
+
+from argus import exceptions
+from argus import resource_server
+from argus.unit_tests import test_utils
+
+
+class ResourceServerTest(unittest.TestCase):
+    """Tests for the HTTP server of the resources."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(cls._root, "windows"))
+        cls._content = bytes(bytearray(range(256))) * 4
+        with open(os.path.join(cls._root, "windows", "script.ps1"),
+                  "wb") as stream:
+            stream.write(cls._content)
+
+        cls._server = resource_server.ResourceServer(
+            cls._root, host="127.0.0.1", address="127.0.0.1")
+        cls._server.start()
+        cls._url = cls._server.url + "windows/script.ps1"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server.stop()
+        shutil.rmtree(cls._root)
+
+    def test_url_not_running(self):
+        server = resource_server.ResourceServer(self._root)
+        with self.assertRaises(exceptions.ArgusError):
+            server.url  # pylint: disable=pointless-statement
+
+    def test_get(self):
+        response = requests.get(self._url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self._content)
+        self.assertTrue(response.headers["ETag"])
+
+    def test_etag(self):
+        etag = requests.get(self._url).headers["ETag"]
+
+        response = requests.get(self._url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        response = requests.get(self._url,
+                                headers={"If-None-Match": '"other"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_range(self):
+        etag = requests.get(self._url).headers["ETag"]
+
+        response = requests.get(self._url, headers={"Range": "bytes=100-"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self._content[100:])
+
+        response = requests.get(self._url, headers={"Range": "bytes=0-9",
+                                                    "If-Range": etag})
+        self.assertEqual(response.content, self._content[:10])
+        response = requests.get(self._url, headers={"Range": "bytes=0-9",
+                                                    "If-Range": '"other"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self._content)
+
+    def test_not_found(self):
+        for path in ("windows/missing.ps1", "windows", "../" * 5 + "etc"):
+            response = requests.get(self._server.url + path)
+            self.assertEqual(response.status_code, 404)
+
+    def test_concurrent_requests(self):
+        with futures.ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(
+                lambda _: requests.get(self._url), range(16)))
+
+        self.assertEqual({response.content for response in responses},
+                         {self._content})
+
+
+class GetResourcesUrlTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(resource_server, "_SERVER", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @test_utils.ConfPatcher("resource_server", False, "argus")
+    def test_disabled(self):
+        with test_utils.ConfPatcher("resources", test_utils.BASE_RESOURCE,
+                                    "argus"):
+            self.assertEqual(resource_server.get_resources_url(),
+                             test_utils.BASE_RESOURCE)
+
+    @test_utils.ConfPatcher("resource_server", True, "argus")
+    @test_utils.ConfPatcher("resource_server_address", "10.0.0.1", "argus")
+    @mock.patch("atexit.register")
+    @mock.patch("argus.resource_server.ResourceServer")
+    def test_started_once(self, mock_server, mock_register):
+        mock_server.return_value.url = "http://10.0.0.1:8000/resources/"
+
+        for _ in range(2):
+            self.assertEqual(resource_server.get_resources_url(),
+                             "http://10.0.0.1:8000/resources/")
+
+        mock_server.assert_called_once_with(port=0, address="10.0.0.1")
+        mock_server.return_value.start.assert_called_once_with()
+        mock_register.assert_called_once_with(
+            mock_server.return_value.stop)
@@ -0,0 +1,92 @@
+# Copyright 2016 Cloudbase Solutions Srl
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from argus import exceptions
+from argus import util
+
+
+class RetryPolicyTest(unittest.TestCase):
+    """Tests for the retry policies."""
+
+    @mock.patch('time.sleep')
+    def test_count(self, mock_sleep):
+        policy = util.RetryPolicy(count=3, delay=2)
+
+        self.assertEqual(list(policy), [1, 2, 3])
+        self.assertEqual(mock_sleep.mock_calls, [mock.call(2)] * 2)
+
+    @mock.patch('time.sleep')
+    def test_no_attempts(self, mock_sleep):
+        self.assertEqual(list(util.RetryPolicy(count=0)), [])
+        mock_sleep.assert_not_called()
+
+    def test_from_count(self):
+        self.assertEqual(util.RetryPolicy.from_count(5, 1).count, 5)
+        self.assertIsNone(util.RetryPolicy.from_count(None).count)
+        self.assertIsNone(util.RetryPolicy.from_count(-1).count)
+
+    def test_backoff(self):
+        policy = util.RetryPolicy(delay=1, backoff=2, max_delay=5)
+
+        self.assertEqual([policy.get_delay(retry) for retry in range(1, 6)],
+                         [1, 2, 4, 5, 5])
+
+    @mock.patch('random.uniform')
+    def test_jitter(self, mock_uniform):
+        mock_uniform.return_value = -0.5
+        policy = util.RetryPolicy(delay=10, jitter=0.5)
+
+        self.assertEqual(policy.get_delay(1), 5)
+        mock_uniform.assert_called_once_with(-0.5, 0.5)
+
+    @mock.patch('time.sleep')
+    @mock.patch('time.time')
+    def test_timeout(self, mock_time, mock_sleep):
+        now = [100]
+        mock_time.side_effect = lambda: now[0]
+        mock_sleep.side_effect = lambda delay: now.__setitem__(
+            0, now[0] + delay)
+        policy = util.RetryPolicy(delay=4, timeout=10)
+
+        self.assertEqual(list(policy), [1, 2, 3, 4])
+        # The last delay is shortened to end at the deadline.
+        self.assertEqual(mock_sleep.mock_calls,
+                         [mock.call(4), mock.call(4), mock.call(2)])
+
+    @mock.patch('time.time')
+    def test_limit(self, mock_time):
+        mock_time.return_value = 100
+        state = util.RetryPolicy(timeout=60).start()
+        mock_time.return_value = 130
+
+        inner = state.limit()
+        self.assertEqual(inner.count, util.RETRY_COUNT)
+        self.assertEqual(inner.timeout, 30)
+        self.assertEqual(
+            state.limit(util.RetryPolicy(count=2, timeout=10)).timeout, 10)
+        self.assertIsNone(util.RetryPolicy().start().limit().timeout)
+
+    def test_is_retryable(self):
+        policy = util.RetryPolicy(retry_on=(exceptions.ArgusTimeoutError, ))
+
+        self.assertTrue(policy.is_retryable(exceptions.ArgusTimeoutError()))
+        self.assertFalse(policy.is_retryable(exceptions.ArgusCLIError()))
@@ -33,6 +33,10 @@ CBINIT_LOCATION = r"C:\installCBinit.ps1"
 SYSPREP_RESOURCE_LOCATION = "windows/sysprep.ps1"
 SEARCHED_PATHS = [r"first\fake\path", r"second\fake\path", r"third\fake\path"]
 USERNAME = "fake_username"
+PASSWORD = "fake_password"
+HOSTNAME = "fake-hostname"
+SHELL_ID = "fake-shell-id"
+COMMAND_ID = "fake-command-id"
 PATH = r"fake\path"
 PATH_TYPE = "FakeType"
 ITEM_TYPE = "FakeType"
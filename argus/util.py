@@ -16,13 +16,16 @@
 import base64
 import collections
 import contextlib
+import copy
 import logging
+import os
 import pkgutil
 import random
 import socket
 import struct
 import subprocess
 import sys
+import time
 
 import six
 
@@ -52,7 +55,9 @@ __all__ = (
     'decrypt_password',
     'get_logger',
     'get_resource',
+    'get_resource_path',
     'cached_property',
+    'RetryPolicy',
     'run_once',
     'rand_name',
     'get_public_keys',
@@ -169,6 +174,13 @@ def get_resource(resource):
     return pkgutil.get_data('argus.resources', resource)
 
 
+def get_resource_path(resource):
+    """Get the path on the disk of the given resource."""
+    resources = os.path.dirname(
+        pkgutil.get_loader('argus.resources').get_filename())
+    return os.path.join(resources, *resource.split('/'))
+
+
 class cached_property(object):  # pylint: disable=invalid-name
     """A property which caches the result on access."""
 
@@ -183,6 +195,133 @@ class cached_property(object):  # pylint: disable=invalid-name
         return result
 
 
+class RetryPolicy(object):
+    """Describe how many times and how often an operation is retried.
+
+    The delay between two attempts grows exponentially with the
+    `backoff` factor, up to `max_delay`, and it is randomly spread by
+    `jitter`, so that multiple waiters don't act in lock-step.
+    When a `timeout` is given, no attempt is started after it expires,
+    no matter how many attempts are left.
+
+    :param count:
+        The maximum number of attempts, ``None`` for no limit.
+    :param delay:
+        The number of seconds to wait before the first retry.
+    :param backoff:
+        The factor by which the delay grows after each retry.
+    :param max_delay:
+        The maximum number of seconds to wait between two attempts.
+    :param jitter:
+        The fraction by which a delay can randomly vary, between 0 and 1.
+    :param timeout:
+        The total number of seconds given to the operation,
+        ``None`` for no limit.
+    :param retry_on:
+        The exception classes which are considered transient.
+    """
+
+    def __init__(self, count=None, delay=RETRY_DELAY, backoff=1,
+                 max_delay=None, jitter=0, timeout=None,
+                 retry_on=(Exception, )):
+        self.count = count
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.timeout = timeout
+        self.retry_on = retry_on
+
+    @classmethod
+    def from_count(cls, count=RETRY_COUNT, delay=RETRY_DELAY):
+        """Get a fixed delay policy, retrying forever for a missing count."""
+        if not count or count < 0:
+            count = None
+        return cls(count=count, delay=delay)
+
+    def is_retryable(self, exc):
+        """Check if the given exception is a transient one."""
+        return isinstance(exc, self.retry_on)
+
+    def get_delay(self, retry):
+        """Get the number of seconds to wait before the given retry."""
+        delay = self.delay * self.backoff ** (retry - 1)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(delay, 0)
+
+    def start(self):
+        """Start counting the attempts and the time of an operation."""
+        return RetryState(self)
+
+    def __iter__(self):
+        """Iterate over the attempt numbers, sleeping between them."""
+        return self.start().attempts()
+
+
+class RetryState(object):
+    """The progress of an operation retried by a :class:`RetryPolicy`."""
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.attempt = 1
+        self.deadline = None
+        if policy.timeout is not None:
+            self.deadline = time.time() + policy.timeout
+
+    def remaining(self):
+        """Get the number of seconds left, ``None`` if there's no limit."""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.time(), 0)
+
+    def attempts(self):
+        """Iterate over the attempt numbers, sleeping between them."""
+        if self.policy.count is not None and self.policy.count <= 0:
+            return
+        yield self.attempt
+        while True:
+            delay = self.next_delay()
+            if delay is None:
+                return
+            time.sleep(delay)
+            yield self.attempt
+
+    def limit(self, policy=None):
+        """Get a policy for an inner operation, ending by the deadline.
+
+        :param policy:
+            The policy of the inner operation, by default the one
+            given by :meth:`RetryPolicy.from_count`.
+        """
+        policy = copy.copy(policy or RetryPolicy.from_count())
+        remaining = self.remaining()
+        if remaining is not None and (policy.timeout is None or
+                                      remaining < policy.timeout):
+            policy.timeout = remaining
+        return policy
+
+    def next_delay(self):
+        """Get the delay before the next attempt, None if none is left.
+
+        The last delay is shortened so that the attempt following it
+        starts right before the deadline.
+        """
+        count = self.policy.count
+        if count is not None and self.attempt >= count:
+            return None
+        delay = self.policy.get_delay(self.attempt)
+        remaining = self.remaining()
+        if remaining is not None:
+            if not remaining:
+                return None
+            delay = min(delay, remaining)
+        self.attempt += 1
+        return delay
+
+
 def get_logger(name="argus",
                format_string=DEFAULT_FORMAT,
                logging_file=DEFAULT_LOG_FILE):